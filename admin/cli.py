@@ -2,10 +2,12 @@
 
 import argparse
 import getpass
+import sqlite3
 import bcrypt
 
 from database.encrypted_db import EncryptedSQLiteDB
-from database.models import init_db
+from database.log_store import compact_logs
+from database.models import init_db, insert_user
 import config.settings as settings
 
 def create_user(db, username, role):
@@ -18,14 +20,16 @@ def create_user(db, username, role):
         return
     role_id = rows[0]["id"]
 
-    db.execute(
-        "INSERT INTO users(username, password_hash, role_id) VALUES (?,?,?)",
-        (username, pw_hash, role_id)
-    )
+    try:
+        insert_user(db, username, pw_hash, role_id)
+    except sqlite3.IntegrityError:
+        print(f"❌ User {username!r} already exists.")
+        return
     print(f"✅ User {username!r} created with role {role!r}.")
 
 def add_acl(db, username, topic, can_sub, can_pub):
-    rows = db.query("SELECT id FROM users WHERE username = ?", (username,))
+    rows = db.query("SELECT id FROM users WHERE username_bidx = ?",
+                    (db.blind_index(username),))
     if not rows:
         print(f"❌ User {username!r} not found.")
         return
@@ -38,11 +42,11 @@ def add_acl(db, username, topic, can_sub, can_pub):
     print(f"✅ ACL for {username!r} on topic {topic!r} added.")
 
 def list_users(db):
-    rows = db.query("""
+    rows = db.query_decrypted("""
         SELECT u.id, u.username, r.name AS role
           FROM users u
           JOIN roles r ON u.role_id = r.id
-    """)
+    """, columns=("username",), cached=("username",))
     for r in rows:
         print(f"• {r['id']}: {r['username']} ({r['role']})")
 
@@ -82,6 +86,17 @@ def view_logs(db, args):
         )
         print(f"{ts:<20} {cid:<10} {topic:<25} {act:<10} {ok:<3} {det}")
 
+def compact(db, args):
+    stats = compact_logs(db, rotate_days=args.older_than)
+    print(f"✅ {stats['rotated']} log rows rotated, "
+          f"{len(stats['purged'])} archive files removed, "
+          f"{stats['vacuumed']} pages vacuumed.")
+    if args.vacuum:
+        # full rewrite: also switches a file created before auto_vacuum
+        # was configured over to incremental vacuum
+        db.execute("VACUUM")
+        print(f"✅ Database rebuilt (auto_vacuum={db.pragma('auto_vacuum')}).")
+
 def main():
     parser = argparse.ArgumentParser(prog="admin", description="Broker Admin CLI")
     sub = parser.add_subparsers(dest="cmd", required=True)
@@ -120,10 +135,23 @@ def main():
         help="Max number of entries to show"
     )
 
+    # compact-logs
+    cl = sub.add_parser("compact-logs",
+                        help="Rotate old log rows to archives and reclaim space now")
+    cl.add_argument(
+        "--older-than", type=float, default=settings.LOG_ROTATE_DAYS,
+        help="Rotate rows older than this many days"
+    )
+    cl.add_argument(
+        "--vacuum", action="store_true",
+        help="Also run a full VACUUM (locks the database while it runs)"
+    )
+
     args = parser.parse_args()
 
     # initialize DB & tables once
-    db = EncryptedSQLiteDB(settings.DB_PATH, settings.FERNET_KEY_PATH)
+    db = EncryptedSQLiteDB(settings.DB_PATH, settings.FERNET_KEY_PATH,
+                           profile="admin")
     init_db(db)
 
     # dispatch
@@ -135,6 +163,8 @@ def main():
         list_users(db)
     elif args.cmd == "view-logs":
         view_logs(db, args)
+    elif args.cmd == "compact-logs":
+        compact(db, args)
 
 if __name__ == "__main__":
     main()
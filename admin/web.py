@@ -4,7 +4,12 @@ eventlet.monkey_patch()  # patch stdlib for eventlet
 
 from flask import Flask, render_template, request, redirect, url_for, session, flash
 from flask_socketio import SocketIO
+from eventlet.queue import Empty, Full, LightQueue
+import bcrypt
 import json
+import sqlite3
+from broker.control import control_ports, control_request, session_path
+from broker.event_feed import feed_paths, read_events
 from database.encrypted_db import EncryptedSQLiteDB
 from database.models import init_db
 import config.settings as settings
@@ -17,7 +22,8 @@ app.secret_key = "password123"
 socketio = SocketIO(app, async_mode="eventlet")
 
 # ─── Init DB ─────────────────────────────────────────────────
-db = EncryptedSQLiteDB(settings.DB_PATH, settings.FERNET_KEY_PATH)
+db = EncryptedSQLiteDB(settings.DB_PATH, settings.FERNET_KEY_PATH,
+                       profile="admin")
 init_db(db)
 
 # ─── Simple auth check ───────────────────────────────────────
@@ -44,12 +50,12 @@ def login():
         username = request.form["username"]
         password = request.form["password"].encode()
 
-        # look up the user (decrypting username if needed)
+        # look up the user by the blind index of its encrypted username
         row = db.query(
             "SELECT u.id, u.password_hash, r.name AS role "
             "FROM users u JOIN roles r ON u.role_id=r.id "
-            "WHERE username = ?",
-            (username,)
+            "WHERE u.username_bidx = ?",
+            (db.blind_index(username),)
         )
         if not row or not bcrypt.checkpw(password, row[0]["password_hash"]):
             flash("Invalid username or password", "danger")
@@ -74,20 +80,24 @@ def users():
         pwd   = request.form["password"].encode()
         role  = request.form["role"]
         phash = bcrypt.hashpw(pwd, bcrypt.gensalt())
-        # insert user
-        db.execute(
-            "INSERT INTO users(username,password_hash,role_id) "
-            "VALUES (?, ?, (SELECT id FROM roles WHERE name=?))",
-            (uname, phash, role)
-        )
+        # insert user (encrypted username + blind index)
+        try:
+            db.execute(
+                "INSERT INTO users(username,username_bidx,password_hash,role_id) "
+                "VALUES (encrypt(?), blind_index(?), ?, (SELECT id FROM roles WHERE name=?))",
+                (uname, uname, phash, role)
+            )
+        except sqlite3.IntegrityError:
+            flash(f"User '{uname}' already exists", "danger")
+            return redirect(url_for("users"))
         flash(f"User '{uname}' created", "success")
         return redirect(url_for("users"))
 
-    rows = db.query("""
+    rows = db.query_decrypted("""
         SELECT u.id, u.username, r.name AS role
           FROM users u JOIN roles r ON u.role_id=r.id
         ORDER BY u.id
-    """)
+    """, columns=("username",), cached=("username",))
     roles = [r["name"] for r in db.query("SELECT name FROM roles")]
     return render_template("users.html", users=rows, roles=roles)
 
@@ -108,12 +118,13 @@ def acls():
         flash("ACL added", "success")
         return redirect(url_for("acls"))
 
-    users = db.query("SELECT id,username FROM users")
-    acls  = db.query("""
+    users = db.query_decrypted("SELECT id,username FROM users",
+                               columns=("username",), cached=("username",))
+    acls  = db.query_decrypted("""
         SELECT a.id, u.username, a.topic, a.can_subscribe, a.can_publish
           FROM acls a JOIN users u ON a.user_id=u.id
         ORDER BY a.id
-    """)
+    """, columns=("username",), cached=("username",))
     return render_template("acls.html", users=users, acls=acls)
 
 # ——— Logs ——————————————————————————————————————————————
@@ -130,30 +141,62 @@ def logs():
     rows = list(reversed(rows))
     return render_template("logs.html", logs=rows)
 
-# ─── WebSocket: broadcast new log entries ─────────────────────
+# ─── Live logs: follow the broker's event feed ────────────────
+# The broker publishes every committed log record on a local Unix socket
+# (one per worker with --workers N).  One green thread per socket relays
+# them to all Socket.IO clients and every open /logs/stream, so watching
+# browsers cost no database queries at all.
+FEED_RESCAN_SECONDS = 2      # how often to look for (re)started brokers
+SSE_QUEUE_SIZE      = 1000   # rows buffered per SSE client before it misses some
+SSE_KEEPALIVE       = 15     # seconds; also how soon a gone client is noticed
+
 thread = None
 thread_lock = eventlet.semaphore.Semaphore()
-
-def background_log_poller():
-    """Poll the DB every second for new logs and broadcast via WebSocket."""
-    last_id = db.query("SELECT MAX(id) AS mid FROM logs", [])[0]["mid"] or 0
+followed = set()             # feed sockets with a relay thread
+sse_clients = set()          # one LightQueue per open /logs/stream
+
+def broadcast_log(row):
+    socketio.emit("new_log", row, namespace="/logs")
+    for q in list(sse_clients):
+        try:
+            q.put_nowait(row)
+        except Full:
+            pass             # that browser fell behind; it misses this row
+
+def follow_feed(path):
+    """Relay one broker's log events until its socket closes."""
+    try:
+        for event in read_events(path):
+            if event.pop("type", None) == "log":
+                broadcast_log(event)
+    except (OSError, ValueError):
+        pass                 # broker gone (or stale socket file)
+    finally:
+        with thread_lock:
+            followed.discard(path)
+
+def feed_watcher():
+    """Attach to broker feed sockets as they appear."""
     while True:
-        eventlet.sleep(1)
-        new = db.query(
-            "SELECT id, timestamp, client_id, topic, action, success, details "
-            "FROM logs WHERE id > ? ORDER BY id ASC",
-            [last_id]
-        )
-        for row in new:
-            socketio.emit("new_log", row, namespace="/logs")
-            last_id = row["id"]
-
-@socketio.on("connect", namespace="/logs")
-def on_connect():
+        for path in feed_paths(settings.EVENT_FEED_SOCKET):
+            with thread_lock:
+                if path in followed:
+                    continue
+                followed.add(path)
+            socketio.start_background_task(follow_feed, path)
+        eventlet.sleep(FEED_RESCAN_SECONDS)
+
+def start_feed_watcher():
     global thread
+    if settings.EVENT_FEED_SOCKET is None:
+        return
     with thread_lock:
         if thread is None:
-            thread = socketio.start_background_task(background_log_poller)
+            thread = socketio.start_background_task(feed_watcher)
+
+@socketio.on("connect", namespace="/logs")
+def on_connect():
+    start_feed_watcher()
 
 
 # ——— Retained Messages ——————————————————————————————————
@@ -195,40 +238,59 @@ def publish():
 
     return render_template("publish.html")
 
+# ——— Sessions (broker control plane) ——————————————————————————
+SESSIONS_PAGE_SIZE = 100     # per worker
+
 @app.route("/sessions")
 def sessions():
-    # SessionManager holds sessions in memory
-    from broker.server import broker  # assume you exposed a global BrokerServer instance
-    active = []
-    for cid, sess in broker.router.session_mgr.sessions.items():
-        active.append({
-          "client_id": cid,
-          "will": sess.will,
-          "writer": sess.writer.get_extra_info("peername")
-        })
-    return render_template("sessions.html", sessions=active)
+    # live state is in the broker process(es); ask each worker's control plane
+    page = max(0, request.args.get("page", 0, type=int))
+    active, more = [], False
+    for port in control_ports():
+        try:
+            res = control_request(
+                "GET", f"/sessions?state=all&offset={page * SESSIONS_PAGE_SIZE}"
+                       f"&limit={SESSIONS_PAGE_SIZE}", port=port)
+        except OSError as e:
+            flash(f"Broker control plane on port {port} unavailable: {e}", "warning")
+            continue
+        for s in res["sessions"]:
+            s["port"] = port
+            active.append(s)
+        more = more or res["next"] is not None
+    return render_template("sessions.html", sessions=active, page=page, more=more)
 
 @app.route("/sessions/<client_id>/disconnect", methods=("POST",))
 def disconnect_session(client_id):
-    from broker.server import broker
-    broker.router.session_mgr.terminate_session(client_id)
-    flash(f"Session {client_id!r} disconnected", "success")
+    port = request.form.get("port", settings.CONTROL_PORT, type=int)
+    discard = "discard" in request.form
+    try:
+        control_request("POST", session_path(client_id, "disconnect")
+                        + ("?discard=1" if discard else ""), port=port)
+    except OSError as e:
+        flash(f"Could not disconnect {client_id!r}: {e}", "danger")
+    else:
+        flash(f"Session {client_id!r} {'ended' if discard else 'disconnected'}",
+              "success")
     return redirect(url_for("sessions"))
 
 @app.route("/logs/stream")
 def logs_stream():
+    """Server-sent events: log rows as the broker commits them."""
+    start_feed_watcher()
+    q = LightQueue(SSE_QUEUE_SIZE)
+    sse_clients.add(q)
     def gen():
-        import time
-        last_id = 0
-        while True:
-            rows = db.query(
-                "SELECT id, timestamp, client_id, topic, action, success, details "
-                "FROM logs WHERE id > ? ORDER BY id ASC", (last_id,)
-            )
-            for r in rows:
-                last_id = r["id"]
-                yield f"data: {json.dumps(r)}\n\n"
-            time.sleep(1)
+        try:
+            while True:
+                try:
+                    row = q.get(timeout=SSE_KEEPALIVE)
+                except Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(row)}\n\n"
+        finally:
+            sse_clients.discard(q)
     return app.response_class(gen(), mimetype="text/event-stream")
 
 @app.route("/acls/<int:acl_id>/delete", methods=("POST",))
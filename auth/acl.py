@@ -0,0 +1,79 @@
+# secure_mqtt_broker/auth/acl.py
+
+from collections import OrderedDict
+from typing import Iterable, Tuple
+
+from broker.topic_trie import TopicTrie
+import config.settings as settings
+
+
+class CompiledACL:
+    """
+    One user's ``acls`` rows compiled into in-memory matchers, with an LRU
+    of recent (operation, topic) decisions in front of them.
+
+    Built once (at CONNECT, or after the ACL table changed) so PUBLISH and
+    SUBSCRIBE checks never go back to SQLite.
+    """
+
+    def __init__(self,
+                 rows: Iterable[Tuple[str, int, int]],
+                 cache_size: int = settings.ACL_DECISION_CACHE_SIZE):
+        """
+        rows: (topic, can_publish, can_subscribe) for one user
+        """
+        self._publish = TopicTrie()
+        self._subscribe = set()
+        self._subscribe_parents = set()
+        for topic, can_pub, can_sub in rows:
+            if can_pub:
+                self._publish.insert(topic, topic, True)
+            if can_sub:
+                self._subscribe.add(topic)
+                if "/" in topic:
+                    # for rule 3 below (SQL `LIKE 'parent/%'`, ASCII nocase)
+                    self._subscribe_parents.add(topic.split("/", 1)[0].lower())
+        self._cache_size = cache_size
+        self._decisions: "OrderedDict[Tuple[str, str], bool]" = OrderedDict()
+
+    def _cached(self, op: str, topic: str, check) -> bool:
+        key = (op, topic)
+        decision = self._decisions.get(key)
+        if decision is not None:
+            self._decisions.move_to_end(key)
+            return decision
+        decision = check(topic)
+        self._decisions[key] = decision
+        if len(self._decisions) > self._cache_size:
+            self._decisions.popitem(last=False)
+        return decision
+
+    def can_publish(self, topic: str) -> bool:
+        return self._cached("pub", topic, self._check_publish)
+
+    def can_subscribe(self, topic_filter: str) -> bool:
+        return self._cached("sub", topic_filter, self._check_subscribe)
+
+    def _check_publish(self, topic: str) -> bool:
+        """
+        True if ANY publish filter matches this topic.
+        Supports exact topics, '+' single‑level and '#' multi‑level wildcards.
+        """
+        return bool(self._publish.match(topic))
+
+    def _check_subscribe(self, topic_filter: str) -> bool:
+        """
+        Allow subscribing to a filter if:
+          1) Exact match exists (user has ACL on that filter)
+          2) If filter ends with '/#', user has ACL on the prefix before '/#'
+          3) If filter contains '+', user has an ACL under its first level
+        """
+        if topic_filter in self._subscribe:
+            return True
+        if topic_filter.endswith("/#") and topic_filter[:-2] in self._subscribe:
+            return True
+        if "+" in topic_filter:
+            parent = topic_filter.split("/")[0].lower()
+            if parent in self._subscribe_parents:
+                return True
+        return False
@@ -2,6 +2,8 @@
 
 import bcrypt
 
+from auth.acl import CompiledACL
+
 class AuthManager:
     def __init__(self, db):
         """
@@ -9,24 +11,42 @@ class AuthManager:
         """
         self.db = db
 
-    def verify_user(self, username: str, password: str):
+    def lookup_user(self, username: str):
         """
-        Return a user dict if credentials match, else None.
+        Return {id, password_hash, role_id} for a username, else None.
+        Only touches the DB; pair with check_password().  The encrypted
+        username is found through its blind index (one B-tree lookup).
         """
         row = self.db.query(
-            "SELECT id, password_hash, role_id FROM users WHERE username = ?",
-            (username,)
+            "SELECT id, password_hash, role_id FROM users WHERE username_bidx = ?",
+            (self.db.blind_index(username),)
         )
         if not row:
             return None
-
         record = row[0]
         stored_hash = record["password_hash"]
         # bcrypt stores hashes as bytes
         if isinstance(stored_hash, str):
             stored_hash = stored_hash.encode()
+        return {
+            "id":            record["id"],
+            "password_hash": stored_hash,
+            "role_id":       record["role_id"]
+        }
 
-        if bcrypt.checkpw(password.encode(), stored_hash):
+    @staticmethod
+    def check_password(password: str, stored_hash: bytes) -> bool:
+        """
+        bcrypt comparison; CPU-heavy (~100 ms), keep it off the event loop.
+        """
+        return bcrypt.checkpw(password.encode(), stored_hash)
+
+    def verify_user(self, username: str, password: str):
+        """
+        Return a user dict if credentials match, else None.
+        """
+        record = self.lookup_user(username)
+        if record and self.check_password(password, record["password_hash"]):
             return {
                 "id":    record["id"],
                 "username": username,
@@ -34,78 +54,38 @@ class AuthManager:
             }
         return None
 
-    def can_subscribe(self, user_id: int, topic_filter: str) -> bool:
+    def load_acl(self, user_id: int) -> CompiledACL:
         """
-        Allow subscribing to a filter if:
-          1) Exact match exists (user has ACL on that filter)
-          2) If filter ends with '/#', user has ACL on the prefix before '/#'
-          3) If filter contains '+', we check each possible expanded level
+        Fetch all of a user's ACL rows in one query and compile them.
         """
-        # 1) Exact ACL on the filter itself
         rows = self.db.query(
-            "SELECT 1 FROM acls WHERE user_id=? AND topic=? AND can_subscribe=1",
-            (user_id, topic_filter)
+            "SELECT topic, can_publish, can_subscribe FROM acls WHERE user_id=?",
+            (user_id,)
+        )
+        return CompiledACL(
+            (r["topic"], r["can_publish"], r["can_subscribe"]) for r in rows
         )
-        if rows:
-            return True
-
-        # 2) Prefix‐wildcard: e.g. 'school/#' → check 'school'
-        if topic_filter.endswith("/#"):
-            prefix = topic_filter[:-2] or ""  # strip '/#'
-            rows = self.db.query(
-                "SELECT 1 FROM acls WHERE user_id=? AND topic=? AND can_subscribe=1",
-                (user_id, prefix)
-            )
-            if rows:
-                return True
 
-        # 3) Single‑level '+' wildcards: e.g. 'school/+/status'
-        if "+" in topic_filter:
-            parts = topic_filter.split("/")
-            # build patterns replacing '+' with each actual level from ACL table
-            # but simpler: allow if user has subscribe on the parent prefix
-            parent = parts[0]
-            rows = self.db.query(
-                "SELECT 1 FROM acls WHERE user_id=? AND topic LIKE ? AND can_subscribe=1",
-                (user_id, parent + "/%",)
-            )
-            if rows:
-                return True
+    def acl_version(self) -> int:
+        """
+        Current value of the counter bumped by triggers on every change
+        to the acls table (see database.models).
+        """
+        rows = self.db.query("SELECT version FROM acl_version WHERE id = 1")
+        return rows[0]["version"] if rows else 0
 
-        return False
+    def can_subscribe(self, user_id: int, topic_filter: str) -> bool:
+        """
+        Allow subscribing to a filter if:
+          1) Exact match exists (user has ACL on that filter)
+          2) If filter ends with '/#', user has ACL on the prefix before '/#'
+          3) If filter contains '+', user has an ACL under its first level
+        """
+        return self.load_acl(user_id).can_subscribe(topic_filter)
 
     def can_publish(self, user_id: int, topic: str) -> bool:
         """
         Return True if the user has ANY publish ACL filter that matches this topic.
         Supports exact topics, '+' single‑level and '#' multi‑level wildcards.
         """
-        # 1) Fetch all publish filters for this user
-        rows: List[dict] = self.db.query(
-            "SELECT topic FROM acls WHERE user_id=? AND can_publish=1",
-            (user_id,)
-        )
-        for r in rows:
-            filt = r["topic"]
-            if self._match_topic(filt, topic):
-                return True
-        return False
-
-    def _match_topic(self, filt: str, topic: str) -> bool:
-        """
-        MQTT‑style match: '+' matches one level, '#' matches all remaining levels.
-        """
-        f_parts = filt.split('/')
-        t_parts = topic.split('/')
-
-        for i, fp in enumerate(f_parts):
-            if fp == '#':
-                return True
-            if i >= len(t_parts):
-                return False
-            if fp == '+':
-                continue
-            if fp != t_parts[i]:
-                return False
-
-        # only match if filter and topic have same number of levels
-        return len(t_parts) == len(f_parts)
\ No newline at end of file
+        return self.load_acl(user_id).can_publish(topic)
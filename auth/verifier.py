@@ -0,0 +1,114 @@
+# secure_mqtt_broker/auth/verifier.py
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from auth.auth import AuthManager
+import config.settings as settings
+
+
+class PasswordVerifier:
+    """
+    Runs bcrypt checks in a thread pool, at most ``max_concurrency`` at a
+    time, so a reconnect storm queues CONNECTs instead of stalling the
+    event loop.
+
+    Successful checks are cached for ``ttl`` seconds under a keyed BLAKE2b
+    digest of (username, password, stored hash): nothing reversible is
+    kept in memory, and a password change misses the cache immediately.
+    """
+
+    def __init__(self,
+                 workers: int = settings.AUTH_WORKERS,
+                 max_concurrency: int = settings.AUTH_MAX_CONCURRENCY,
+                 ttl: float = settings.AUTH_CACHE_TTL,
+                 cache_size: int = settings.AUTH_CACHE_SIZE):
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix="bcrypt")
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self.ttl = ttl
+        self.cache_size = cache_size
+        # per-process secret: cache keys are useless outside this broker
+        self._secret = os.urandom(32)
+        self._cache: "OrderedDict[bytes, float]" = OrderedDict()
+
+        # counters / gauges
+        self.waiting = 0          # CONNECTs queued for a bcrypt slot
+        self.active = 0           # bcrypt checks running now
+        self.max_waiting = 0
+        self.verified = 0
+        self.rejected = 0
+        self.cache_hits = 0
+
+    def stats(self) -> dict:
+        return {
+            "waiting":     self.waiting,
+            "active":      self.active,
+            "max_waiting": self.max_waiting,
+            "verified":    self.verified,
+            "rejected":    self.rejected,
+            "cache_hits":  self.cache_hits,
+            "cached":      len(self._cache),
+        }
+
+    def _key(self, username: str, password: str, stored_hash: bytes) -> bytes:
+        h = hashlib.blake2b(key=self._secret, digest_size=32)
+        for part in (username.encode(), password.encode(), stored_hash):
+            # length-prefix each part so field boundaries can't be shifted
+            h.update(len(part).to_bytes(4, "big"))
+            h.update(part)
+        return h.digest()
+
+    def _cache_hit(self, key: bytes) -> bool:
+        expires = self._cache.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._cache[key]
+            return False
+        return True
+
+    def _remember(self, key: bytes):
+        self._cache[key] = time.monotonic() + self.ttl
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def verify(self,
+                     username: str,
+                     password: str,
+                     stored_hash: bytes) -> bool:
+        key = self._key(username, password, stored_hash)
+        if self._cache_hit(key):
+            self.cache_hits += 1
+            return True
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._limit.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            loop = asyncio.get_running_loop()
+            ok = await loop.run_in_executor(
+                self._executor, AuthManager.check_password, password, stored_hash
+            )
+        finally:
+            self.active -= 1
+            self._limit.release()
+
+        if ok:
+            self.verified += 1
+            self._remember(key)
+        else:
+            self.rejected += 1
+        return ok
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,180 @@
+# secure_mqtt_broker/broker/admission.py
+
+import asyncio
+import contextlib
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import config.settings as settings
+
+# (messages/s, message burst, bytes/s, byte burst); a None rate is no limit
+Rates = Tuple[Optional[float], float, Optional[float], float]
+
+CLIENT_RATES: Rates = (settings.CLIENT_MSG_RATE, settings.CLIENT_MSG_BURST,
+                       settings.CLIENT_BYTE_RATE, settings.CLIENT_BYTE_BURST)
+USER_RATES: Rates = (settings.USER_MSG_RATE, settings.USER_MSG_BURST,
+                     settings.USER_BYTE_RATE, settings.USER_BYTE_BURST)
+
+
+class TokenBucket:
+    """
+    ``rate`` tokens per second, at most ``burst`` saved up.  take() always
+    succeeds and may leave the bucket in debt; it returns how long the
+    caller should wait for the debt to be repaid, so a message larger
+    than the burst is delayed rather than refused forever.
+    """
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, n: float, now: Optional[float] = None) -> float:
+        if now is None:
+            now = time.monotonic()
+        tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens = tokens - n
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Limits:
+    """The message and byte buckets of one client_id or user."""
+    __slots__ = ("buckets", "refs")
+
+    def __init__(self, rates: Rates):
+        msg_rate, msg_burst, byte_rate, byte_burst = rates
+        # (bucket, charge per message: 1 or the payload size)
+        self.buckets = []
+        if msg_rate:
+            self.buckets.append((TokenBucket(msg_rate, msg_burst), False))
+        if byte_rate:
+            self.buckets.append((TokenBucket(byte_rate, byte_burst), True))
+        self.refs = 0       # connections using these buckets
+
+    def charge(self, size: int, now: float) -> float:
+        wait = 0.0
+        for bucket, by_size in self.buckets:
+            wait = max(wait, bucket.take(size if by_size else 1, now))
+        return wait
+
+
+class Throttle:
+    """
+    Rate limits of one connection: its client_id's buckets and its user's
+    (shared with the user's other connections).  Obtained from
+    AdmissionControl.throttle(), handed back with release().
+    """
+    __slots__ = ("keys", "limits")
+
+    def __init__(self, keys: List[Hashable], limits: List[_Limits]):
+        self.keys = keys
+        self.limits = limits
+
+    def charge(self, size: int) -> float:
+        """
+        Account for one PUBLISH of ``size`` payload bytes; returns the
+        seconds to wait before reading the client's next packet.
+        """
+        now = time.monotonic()
+        return max(limits.charge(size, now) for limits in self.limits)
+
+
+class AdmissionControl:
+    """
+    Connection admission and PUBLISH rate limits for one broker process.
+
+    handshake() bounds the CONNECTs being authenticated and set up at
+    once; admit() enforces the session cap; throttle() hands a connection
+    its token buckets.  The router applies a Throttle by sleeping before
+    it reads the next packet, so the client is slowed down, never
+    dropped: once the StreamReader's buffer fills, asyncio pauses reading
+    the socket and TCP flow control pushes back on the client.
+
+    Limits are per process: with --workers N a user spread over several
+    workers gets N times its rate.
+    """
+
+    def __init__(self,
+                 max_handshakes: Optional[int] = settings.MAX_HANDSHAKES,
+                 max_sessions: Optional[int] = settings.MAX_SESSIONS,
+                 client_rates: Rates = CLIENT_RATES,
+                 user_rates: Rates = USER_RATES):
+        self._handshakes = (asyncio.Semaphore(max_handshakes)
+                            if max_handshakes else None)
+        self.max_sessions = max_sessions
+        self.client_rates = client_rates
+        self.user_rates = user_rates
+        # ("client", client_id) / ("user", user_id) -> buckets in use
+        self._limits: Dict[Hashable, _Limits] = {}
+
+        # counters / gauges
+        self.waiting = 0          # CONNECTs queued for a handshake slot
+        self.active = 0           # CONNECTs being handled now
+        self.rejected = 0         # CONNECTs refused by the session cap
+
+    def stats(self) -> dict:
+        return {
+            "waiting":  self.waiting,
+            "active":   self.active,
+            "rejected": self.rejected,
+            "limited":  len(self._limits),
+        }
+
+    @contextlib.asynccontextmanager
+    async def handshake(self):
+        """Hold one of the ``max_handshakes`` CONNECT slots."""
+        self.waiting += 1
+        try:
+            if self._handshakes is not None:
+                await self._handshakes.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            if self._handshakes is not None:
+                self._handshakes.release()
+
+    def admit(self, session_mgr, client_id: str) -> bool:
+        """
+        May ``client_id`` connect under the session cap?  Taking over a
+        connected session or resuming/replacing a stored one does not add
+        a session, so it is always admitted.
+        """
+        if self.max_sessions is None:
+            return True
+        if client_id in session_mgr.sessions or client_id in session_mgr.offline_sessions:
+            return True
+        if len(session_mgr.sessions) + len(session_mgr.offline_sessions) < self.max_sessions:
+            return True
+        self.rejected += 1
+        return False
+
+    def throttle(self, client_id: str, user: dict) -> Optional[Throttle]:
+        """The connection's rate limits; None when none are configured."""
+        keys, limits = [], []
+        for key, rates in ((("client", client_id), self.client_rates),
+                           (("user", user["id"]), self.user_rates)):
+            if not (rates[0] or rates[2]):
+                continue
+            entry = self._limits.get(key)
+            if entry is None:
+                entry = self._limits[key] = _Limits(rates)
+            entry.refs += 1
+            keys.append(key)
+            limits.append(entry)
+        return Throttle(keys, limits) if limits else None
+
+    def release(self, throttle: Optional[Throttle]):
+        """The connection is gone; forget buckets nobody uses any more."""
+        if throttle is None:
+            return
+        for key, entry in zip(throttle.keys, throttle.limits):
+            entry.refs -= 1
+            if entry.refs <= 0 and self._limits.get(key) is entry:
+                del self._limits[key]
@@ -0,0 +1,139 @@
+# secure_mqtt_broker/broker/audit.py
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Optional, Tuple
+
+from broker.metrics import DB_WRITE_SECONDS
+import config.settings as settings
+
+log = logging.getLogger(__name__)
+
+_WRITE_SECONDS = DB_WRITE_SECONDS.labels("logs")
+
+# (timestamp, client_id, topic, action, success, details)
+LogRecord = Tuple[str, str, str, str, int, str]
+
+INSERT_LOG_SQL = (
+    "INSERT INTO logs(timestamp, client_id, topic, action, success, details) "
+    "VALUES (?,?,?,?,?,?)"
+)
+
+
+class AuditLogWriter:
+    """
+    Background sink for the ``logs`` table.
+
+    ``write()`` only appends to an in-memory ring; a flusher task writes the
+    ring with one ``executemany`` + commit every ``batch_size`` records or
+    ``flush_interval`` seconds, whichever comes first.  When the ring is
+    full the oldest record is dropped and counted.
+
+    ``db`` is an AsyncEncryptedDB, so the commit happens on the DB thread.
+    Committed batches are also published to ``feed`` (an EventFeed), if
+    given, for live viewers.
+    """
+
+    def __init__(self,
+                 db,
+                 feed=None,
+                 capacity: int = settings.AUDIT_RING_SIZE,
+                 batch_size: int = settings.AUDIT_BATCH_SIZE,
+                 flush_interval: float = settings.AUDIT_FLUSH_INTERVAL_MS / 1000):
+        self.db = db
+        self.feed = feed
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # writes made while the ring is this full count as backpressure
+        self.high_water = max(1, capacity * 3 // 4)
+
+        self._ring: Deque[LogRecord] = deque()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+        # counters
+        self.written = 0        # records committed to the DB
+        self.dropped = 0        # records lost to ring overflow or DB errors
+        self.backpressure = 0   # writes that found the ring above high water
+        self.flushes = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._ring)
+
+    def stats(self) -> dict:
+        return {
+            "pending":      self.pending,
+            "written":      self.written,
+            "dropped":      self.dropped,
+            "backpressure": self.backpressure,
+            "flushes":      self.flushes,
+        }
+
+    def write(self,
+              client_id: Optional[str],
+              topic: Optional[str],
+              action: str,
+              success: bool,
+              details: str = "") -> None:
+        """Queue one log record; never touches the database."""
+        ring = self._ring
+        if len(ring) >= self.capacity:
+            ring.popleft()
+            self.dropped += 1
+        if len(ring) >= self.high_water:
+            self.backpressure += 1
+        # stamped now, not at flush time, in CURRENT_TIMESTAMP's format
+        ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        ring.append((ts, client_id or "", topic or "", action,
+                     int(success), details))
+        if len(ring) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write everything buffered so far in one transaction."""
+        if not self._ring:
+            return 0
+        batch = list(self._ring)
+        self._ring.clear()
+        started = time.perf_counter()
+        try:
+            await self.db.executemany(INSERT_LOG_SQL, batch)
+        except sqlite3.Error as e:
+            self.dropped += len(batch)
+            log.error("failed to write %d log records: %s", len(batch), e)
+            return 0
+        _WRITE_SECONDS.observe(time.perf_counter() - started)
+        self.written += len(batch)
+        self.flushes += 1
+        if self.feed is not None:
+            self.feed.publish_logs(batch)
+        return len(batch)
+
+    async def close(self):
+        """Stop the flusher and write whatever is still buffered."""
+        self._closing = True
+        self._wakeup.set()
+        task, self._task = self._task, None
+        if task is not None:
+            await task
+        await self.flush()
@@ -0,0 +1,131 @@
+# secure_mqtt_broker/broker/cluster.py
+
+import asyncio
+import os
+import struct
+from typing import Callable, Dict, Optional
+
+import config.settings as settings
+
+# forwarded PUBLISH: qos, retain, topic length, payload length, then
+# topic (UTF-8) and payload bytes
+_HEADER = struct.Struct("!BBHI")
+
+OnPublish = Callable[[str, bytes, int, bool], None]
+
+
+class ClusterLink:
+    """
+    Publish forwarding between the worker processes of one broker.
+
+    Every worker accepts connections from the same TLS port (SO_REUSEPORT)
+    and keeps its own sessions and subscription trie.  A PUBLISH accepted
+    by one worker is dispatched locally and then forwarded, unchanged, to
+    every peer over a Unix socket; peers dispatch it to their own
+    subscribers but never forward it again.
+
+    Each worker listens on ``<socket_dir>/broker-<name>-<index>.sock`` and
+    opens one write-only stream to each peer.
+    """
+
+    def __init__(self,
+                 index: int,
+                 workers: int,
+                 name: str = str(settings.PORT),
+                 socket_dir: str = settings.CLUSTER_SOCKET_DIR,
+                 max_buffer: int = settings.CLUSTER_MAX_BUFFER):
+        self.index = index
+        self.workers = workers
+        self.name = name
+        self.socket_dir = socket_dir
+        self.max_buffer = max_buffer
+
+        self._peers: Dict[int, asyncio.StreamWriter] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks = []
+        self._on_publish: Optional[OnPublish] = None
+
+        # counters
+        self.forwarded = 0
+        self.received = 0
+        self.dropped = 0      # peer missing or its socket buffer is full
+
+    def socket_path(self, index: int) -> str:
+        return os.path.join(self.socket_dir,
+                            f"broker-{self.name}-{index}.sock")
+
+    async def start(self, on_publish: OnPublish):
+        """Listen for peers and start connecting to them."""
+        self._on_publish = on_publish
+        path = self.socket_path(self.index)
+        if os.path.exists(path):
+            os.unlink(path)     # stale socket from a previous run
+        self._server = await asyncio.start_unix_server(self._handle_peer, path)
+        for peer in range(self.workers):
+            if peer != self.index:
+                self._tasks.append(asyncio.create_task(self._connect(peer)))
+
+    async def _connect(self, peer: int):
+        # peers start in any order; retry until each one is listening
+        delay = 0.05
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(
+                    self.socket_path(peer))
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 2.0)
+                continue
+            self._peers[peer] = writer
+            return
+
+    async def _handle_peer(self,
+                           reader: asyncio.StreamReader,
+                           writer: asyncio.StreamWriter):
+        try:
+            while True:
+                qos, retain, tlen, plen = _HEADER.unpack(
+                    await reader.readexactly(_HEADER.size))
+                body = await reader.readexactly(tlen + plen)
+                self.received += 1
+                self._on_publish(body[:tlen].decode("utf-8"),
+                                 memoryview(body)[tlen:], qos, bool(retain))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def forward(self, topic: str, payload: bytes, qos: int, retain: bool):
+        """Send one locally accepted PUBLISH to every peer (non-blocking)."""
+        if self.workers < 2:
+            return
+        t = topic.encode("utf-8")
+        frame = (_HEADER.pack(qos, int(retain), len(t), len(payload)),
+                 t, payload)
+        for peer in range(self.workers):
+            if peer == self.index:
+                continue
+            w = self._peers.get(peer)
+            if w is not None and w.is_closing():
+                # peer went away (e.g. restarted): reconnect in background
+                del self._peers[peer]
+                self._tasks.append(asyncio.create_task(self._connect(peer)))
+                w = None
+            if w is None or w.transport.get_write_buffer_size() > self.max_buffer:
+                self.dropped += 1
+                continue
+            w.writelines(frame)
+            self.forwarded += 1
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        for w in self._peers.values():
+            w.close()
+        self._peers.clear()
+        if self._server is not None:
+            self._server.close()
+            try:
+                os.unlink(self.socket_path(self.index))
+            except OSError:
+                pass
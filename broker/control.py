@@ -0,0 +1,202 @@
+# secure_mqtt_broker/broker/control.py
+
+import asyncio
+import hmac
+import itertools
+import json
+import logging
+import urllib.request
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import config.settings as settings
+
+log = logging.getLogger(__name__)
+
+_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized",
+            404: "Not Found", 405: "Method Not Allowed"}
+
+
+class ControlServer:
+    """
+    Control plane of one broker process: a small HTTP/JSON API on its own
+    listener, served from the broker's event loop so it reads live state
+    without locks or copies.
+
+        GET  /sessions?state=online|offline|all&offset=0&limit=100
+        GET  /sessions/<client_id>
+        POST /sessions/<client_id>/disconnect[?discard=1]
+
+    A listing page walks the session dicts lazily (``islice``) and takes
+    one Session.snapshot() per entry -- a handful of len() calls -- so a
+    page of ``limit`` sessions costs O(offset + limit), never a copy of
+    the whole table.  Pages are not isolated from each other: sessions
+    that connect or leave between two requests can shift entries.
+
+    When ``token`` is set every request needs ``Authorization: Bearer
+    <token>``.  Bind it to localhost: it can disconnect any client.
+    """
+
+    def __init__(self,
+                 router,
+                 host: str = settings.CONTROL_HOST,
+                 port: int = settings.CONTROL_PORT,
+                 token: Optional[str] = settings.CONTROL_TOKEN,
+                 max_page: int = settings.CONTROL_MAX_PAGE):
+        self.router = router
+        self.host = host
+        self.port = port
+        self.token = token
+        self.max_page = max_page
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port 0: the OS picked one
+        self.port = self._server.sockets[0].getsockname()[1]
+        log.info("🛠  Control plane on http://%s:%d/sessions", self.host, self.port)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    async def _handle(self,
+                      reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            parts = request.decode("latin-1").split()
+            if len(parts) < 2:
+                status, body = 400, {"error": "bad request"}
+            elif not self._authorized(headers.get("authorization", "")):
+                status, body = 401, {"error": "unauthorized"}
+            else:
+                status, body = await self.dispatch(parts[0], parts[1])
+            data = json.dumps(body).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                "Connection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _authorized(self, header: str) -> bool:
+        if self.token is None:
+            return True
+        scheme, _, credential = header.partition(" ")
+        return (scheme.lower() == "bearer"
+                and hmac.compare_digest(credential.encode(), self.token.encode()))
+
+    async def dispatch(self, method: str, target: str) -> Tuple[int, dict]:
+        """Route one request; returns (HTTP status, JSON body)."""
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = [unquote(p) for p in url.path.strip("/").split("/")]
+        if path[0] != "sessions" or len(path) > 3:
+            return 404, {"error": "not found"}
+        if len(path) == 1:
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            return self.list_sessions(query)
+        if len(path) == 2:
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            return self.get_session(path[1])
+        if path[2] != "disconnect":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        discard = query.get("discard", "0") not in ("0", "false", "")
+        if not await self.router.disconnect_client(path[1], discard=discard):
+            return 404, {"error": f"no session {path[1]!r}"}
+        return 200, {"client_id": path[1], "disconnected": True, "discarded": discard}
+
+    def list_sessions(self, query: dict) -> Tuple[int, dict]:
+        mgr = self.router.session_mgr
+        state = query.get("state", "online")
+        try:
+            offset = max(0, int(query.get("offset", 0)))
+            limit = min(self.max_page, max(1, int(query.get("limit", self.max_page))))
+        except ValueError:
+            return 400, {"error": "offset and limit must be integers"}
+        if state == "online":
+            total = len(mgr.sessions)
+            source = mgr.sessions.values()
+        elif state == "offline":
+            total = len(mgr.offline_sessions)
+            source = mgr.offline_sessions.values()
+        elif state == "all":
+            total = len(mgr.sessions) + len(mgr.offline_sessions)
+            source = itertools.chain(mgr.sessions.values(),
+                                     mgr.offline_sessions.values())
+        else:
+            return 400, {"error": "state must be online, offline or all"}
+        # no await from here on: the dicts cannot change under islice
+        offline = self.router.offline
+        page = []
+        for session in itertools.islice(source, offset, offset + limit):
+            entry = session.snapshot()
+            entry["offline_queued"] = offline.depth(session.client_id)
+            page.append(entry)
+        end = offset + len(page)
+        return 200, {
+            "total":    total,
+            "offset":   offset,
+            "limit":    limit,
+            "next":     end if end < total else None,
+            "sessions": page,
+        }
+
+    def get_session(self, client_id: str) -> Tuple[int, dict]:
+        mgr = self.router.session_mgr
+        session = mgr.sessions.get(client_id) or mgr.offline_sessions.get(client_id)
+        if session is None:
+            return 404, {"error": f"no session {client_id!r}"}
+        entry = session.snapshot()
+        entry["offline_queued"] = self.router.offline.depth(client_id)
+        entry["filters"] = sorted(session.subscriptions)
+        return 200, entry
+
+
+# ——— client side (admin web app, scripts) ——————————————————————————
+
+def control_ports(port: int = settings.CONTROL_PORT,
+                  workers: int = settings.WORKERS) -> list:
+    """Control port of every worker (worker i listens on port + i)."""
+    return [port + i for i in range(max(1, workers))]
+
+
+def control_request(method: str,
+                    path: str,
+                    port: int = settings.CONTROL_PORT,
+                    host: str = settings.CONTROL_HOST,
+                    token: Optional[str] = settings.CONTROL_TOKEN,
+                    timeout: float = 5.0) -> dict:
+    """
+    Call one broker's control plane; returns the decoded JSON body.
+    Raises urllib.error.HTTPError for 4xx answers and URLError (an
+    OSError) when nothing is listening.
+    """
+    req = urllib.request.Request(f"http://{host}:{port}{path}", method=method)
+    if token is not None:
+        req.add_header("Authorization", f"Bearer {token}")
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.load(resp)
+
+
+def session_path(client_id: str, action: str = "") -> str:
+    path = "/sessions/" + quote(client_id, safe="")
+    return f"{path}/{action}" if action else path
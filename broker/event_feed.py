@@ -0,0 +1,139 @@
+# secure_mqtt_broker/broker/event_feed.py
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import socket
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import config.settings as settings
+
+log = logging.getLogger(__name__)
+
+# audit LogRecord fields, in order
+LOG_FIELDS = ("timestamp", "client_id", "topic", "action", "success", "details")
+
+
+def feed_path(base: str, index: Optional[int] = None) -> str:
+    """Socket of one broker process: ``base``, or ``<stem>-<index><ext>``."""
+    if index is None:
+        return base
+    stem, ext = os.path.splitext(base)
+    return f"{stem}-{index}{ext}"
+
+
+def feed_paths(base: str) -> List[str]:
+    """Every feed socket currently present: a single broker's or workers'."""
+    stem, ext = os.path.splitext(base)
+    paths = [base] if os.path.exists(base) else []
+    return paths + sorted(glob.glob(f"{glob.escape(stem)}-*{ext}"))
+
+
+class EventFeed:
+    """
+    Local pub/sub channel for broker events.
+
+    The broker listens on a Unix socket and writes every event, as one
+    JSON object per line, to each connected listener; listeners never
+    send anything.  It is meant for out-of-process consumers on the same
+    host (the admin web app follows the audit log through it instead of
+    polling the ``logs`` table), so there is no auth beyond the socket's
+    file permissions (0600 by default).
+
+    publish() never blocks: a listener whose socket buffer already holds
+    more than ``max_buffer`` bytes misses events (counted in ``dropped``)
+    until it catches up.
+    """
+
+    def __init__(self,
+                 path: str = settings.EVENT_FEED_SOCKET,
+                 max_buffer: int = settings.EVENT_FEED_MAX_BUFFER,
+                 mode: int = 0o600):
+        self.path = path
+        self.max_buffer = max_buffer
+        self.mode = mode
+        self._listeners: Dict[asyncio.StreamWriter, None] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+        # counters
+        self.published = 0      # events written to at least one listener
+        self.dropped = 0        # (event, listener) pairs skipped
+
+    def __len__(self) -> int:
+        return len(self._listeners)
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)        # stale socket from a previous run
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+        os.chmod(self.path, self.mode)
+        log.info("📡 Event feed on %s", self.path)
+
+    async def _handle(self,
+                      reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        self._listeners[writer] = None
+        try:
+            # only to notice the listener going away
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._listeners.pop(writer, None)
+            writer.close()
+
+    def publish(self, events: Iterable[dict]) -> None:
+        """Send ``events`` to every listener, as one write per listener."""
+        if not self._listeners:
+            return
+        data = b"".join(json.dumps(e, separators=(",", ":")).encode("utf-8")
+                        + b"\n" for e in events)
+        if not data:
+            return
+        n = data.count(b"\n")
+        sent = False
+        for w in list(self._listeners):
+            if w.is_closing():
+                self._listeners.pop(w, None)
+                continue
+            if w.transport.get_write_buffer_size() > self.max_buffer:
+                self.dropped += n
+                continue
+            w.write(data)
+            sent = True
+        if sent:
+            self.published += n
+
+    def publish_logs(self, records: Iterable[tuple]) -> None:
+        """Publish audit LogRecords as ``{"type": "log", ...}`` events."""
+        if self._listeners:
+            self.publish(dict(zip(LOG_FIELDS, r), type="log") for r in records)
+
+    async def close(self):
+        for w in list(self._listeners):
+            w.close()
+        self._listeners.clear()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+def read_events(path: str, timeout: Optional[float] = None) -> Iterator[dict]:
+    """
+    Blocking client: connect to one feed socket and yield its events until
+    the broker closes it.  Plain sockets, so it also runs in eventlet or
+    any thread.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        with sock.makefile("rb") as stream:
+            for line in stream:
+                yield json.loads(line)
@@ -0,0 +1,127 @@
+# secure_mqtt_broker/broker/framing.py
+
+import asyncio
+import json
+from typing import Optional
+
+import config.settings as settings
+
+
+class ProtocolError(ValueError):
+    """Raised by a codec when the peer sends a malformed packet."""
+
+
+def encode_packet(packet: dict) -> bytes:
+    """Newline‐delimited JSON framing of one packet."""
+    return (json.dumps(packet) + "\n").encode()
+
+
+def _text(payload) -> str:
+    # JSON clients only carry text; binary payloads degrade to U+FFFD
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return str(payload, "utf-8", "replace")
+    return payload
+
+
+def _binary(payload) -> bytes:
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    return payload
+
+
+class PublishFrame:
+    """
+    A PUBLISH encoded once per dispatch and reused for every subscriber.
+
+    QoS 0 recipients all get the same immutable ``bytes`` object.  For
+    QoS 1/2 only the packet id differs, so the serialized packet is kept
+    open-ended and the id is written after it per recipient: buffers()
+    hands the session the shared head and a few bytes of id rather than
+    a copy of the whole packet, once the packet is big enough
+    (settings.SHARED_PAYLOAD_MIN) for that to matter.
+    """
+    __slots__ = ("qos", "_shared", "_head")
+
+    def __init__(self,
+                 topic: str,
+                 payload,
+                 qos: int = 0,
+                 retain: bool = False):
+        self.qos = qos
+        body = json.dumps({
+            "type":    "PUBLISH",
+            "topic":   topic,
+            "payload": _text(payload),
+            "retain":  retain,
+            "qos":     qos
+        })
+        if qos == 0:
+            self._shared = (body + "\n").encode()
+            self._head = None
+        else:
+            # drop the closing '}' so the id can be appended as last key
+            self._shared = None
+            self._head = body[:-1].encode()
+
+    def buffers(self, pid: Optional[int] = None, dup: bool = False):
+        """
+        The packet for one recipient as ``bytes``, or as a tuple of
+        buffers to be written back to back (writelines).
+        """
+        if pid is None:
+            return self._shared
+        if dup:
+            # retransmission of an unacknowledged QoS 1/2 delivery
+            tail = b', "id": %d, "dup": true}\n' % pid
+        else:
+            tail = b', "id": %d}\n' % pid
+        if len(self._head) < settings.SHARED_PAYLOAD_MIN:
+            return self._head + tail
+        return (self._head, tail)
+
+    def encode(self, pid: Optional[int] = None, dup: bool = False) -> bytes:
+        data = self.buffers(pid, dup)
+        return data if type(data) is bytes else b"".join(data)
+
+
+class JsonCodec:
+    """
+    The broker's original wire format: one JSON object per line.
+
+    Every codec turns wire packets into the router's packet dicts and back.
+    Payloads (PUBLISH and Last Will) are ``bytes`` on the router side.
+    """
+    name = "json"
+
+    async def read_packet(self,
+                          reader: asyncio.StreamReader) -> Optional[dict]:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            pkt = json.loads(line)
+        except ValueError as e:
+            raise ProtocolError(f"invalid JSON packet: {e}") from None
+        if not isinstance(pkt, dict):
+            raise ProtocolError("packet is not a JSON object")
+        if pkt.get("type") == "PUBLISH" and "payload" in pkt:
+            pkt["payload"] = _binary(pkt["payload"])
+        will = pkt.get("last_will")
+        if isinstance(will, dict) and "payload" in will:
+            will["payload"] = _binary(will["payload"])
+        return pkt
+
+    def encode(self, packet: dict) -> bytes:
+        if "payload" in packet:
+            packet = dict(packet, payload=_text(packet["payload"]))
+        return encode_packet(packet)
+
+    def publish_frame(self,
+                      topic: str,
+                      payload: bytes,
+                      qos: int = 0,
+                      retain: bool = False) -> PublishFrame:
+        return PublishFrame(topic, payload, qos, retain)
+
+
+JSON_CODEC = JsonCodec()
@@ -0,0 +1,79 @@
+# secure_mqtt_broker/broker/log.py
+
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Dict, Optional
+
+import config.settings as settings
+
+# attributes every LogRecord has; anything else came in through `extra=`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, plus every
+    field passed via ``extra=`` (client_id, topic, …).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts":     self.formatTime(record),
+            "level":  record.levelname,
+            "logger": record.name,
+            "msg":    record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=repr)
+
+
+def configure_logging(level: str = settings.LOG_LEVEL,
+                      module_levels: Optional[Dict[str, str]] = None,
+                      fmt: str = settings.LOG_FORMAT,
+                      use_queue: bool = settings.LOG_QUEUE,
+                      tag: str = "") -> Optional[logging.handlers.QueueListener]:
+    """
+    Set up the root logger for a broker process.
+
+    - ``level`` is the default; ``module_levels`` ({"broker.router":
+      "DEBUG"}, defaults to settings.LOG_LEVELS) overrides it per logger,
+      so tracing one module never turns on the others.
+    - ``fmt`` is "text" or "json".
+    - with ``use_queue`` the event loop only appends records to a queue and
+      a QueueListener thread formats and writes them.  The listener is
+      returned (already started); stop() it on shutdown to flush.
+    - ``tag`` is put in front of every text line, e.g. the worker index.
+    """
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        prefix = f"[{tag}] " if tag else ""
+        handler.setFormatter(logging.Formatter(
+            f"%(asctime)s %(levelname)s {prefix}%(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.setLevel(level)
+    if module_levels is None:
+        module_levels = settings.LOG_LEVELS
+    for name, lvl in module_levels.items():
+        logging.getLogger(name).setLevel(lvl)
+
+    if not use_queue:
+        root.addHandler(handler)
+        return None
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(q))
+    listener = logging.handlers.QueueListener(q, handler,
+                                              respect_handler_level=True)
+    listener.start()
+    return listener
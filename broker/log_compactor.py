@@ -0,0 +1,126 @@
+# secure_mqtt_broker/broker/log_compactor.py
+
+import asyncio
+import logging
+import sqlite3
+from typing import Optional
+
+from broker.metrics import LOG_ROWS_ROTATED
+from database import log_store
+import config.settings as settings
+
+log = logging.getLogger(__name__)
+
+
+class LogCompactor:
+    """
+    Background retention for the ``logs`` table (see database.log_store).
+
+    At start and then every ``interval`` seconds it rotates rows older
+    than ``rotate_days`` into the period archives, deletes archive files
+    older than ``retention_days`` and vacuums the freed pages.  Every
+    batch and every vacuum step is a separate call on the DB thread, so
+    audit flushes and other queries queue behind one short step at most
+    rather than behind the whole pass.
+
+    ``db`` is an AsyncEncryptedDB.
+    """
+
+    def __init__(self,
+                 db,
+                 interval: float = settings.LOG_COMPACT_INTERVAL,
+                 rotate_days: float = settings.LOG_ROTATE_DAYS,
+                 archive_dir: Optional[str] = settings.LOG_ARCHIVE_DIR,
+                 period: str = settings.LOG_ARCHIVE_PERIOD,
+                 retention_days: Optional[float] = settings.LOG_RETENTION_DAYS,
+                 batch_size: int = settings.LOG_COMPACT_BATCH,
+                 vacuum_pages: int = settings.LOG_VACUUM_PAGES):
+        if period not in log_store.PERIODS:
+            raise ValueError(f"unknown log archive period {period!r}")
+        self.db = db
+        self.interval = interval
+        self.rotate_days = rotate_days
+        self.archive_dir = archive_dir
+        self.period = period
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+        # counters
+        self.rotated = 0        # rows moved out of `logs`
+        self.purged = 0         # archive files deleted
+        self.vacuumed = 0       # pages released to the OS
+        self.runs = 0
+        self.errors = 0
+
+    def stats(self) -> dict:
+        return {
+            "rotated":  self.rotated,
+            "purged":   self.purged,
+            "vacuumed": self.vacuumed,
+            "runs":     self.runs,
+            "errors":   self.errors,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await self.compact()
+            except (sqlite3.Error, OSError) as e:
+                self.errors += 1
+                log.error("log compaction failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def compact(self) -> dict:
+        """One retention pass; stops between steps once close() is called."""
+        before = log_store.cutoff(self.rotate_days)
+        rotated = 0
+        while not self._closing:
+            n = await self.db.run(log_store.rotate_batch, self.db.db, before,
+                                  self.archive_dir, self.period, self.batch_size)
+            if not n:
+                break
+            rotated += n
+            LOG_ROWS_ROTATED.inc(n)
+
+        purged = []
+        if self.retention_days is not None:
+            purged = await self.db.run(
+                log_store.purge_archives, self.archive_dir,
+                log_store.cutoff(self.retention_days), self.period)
+
+        vacuumed = 0
+        while not self._closing:
+            n = await self.db.run(log_store.vacuum_step, self.db.db,
+                                  self.vacuum_pages)
+            if not n:
+                break
+            vacuumed += n
+
+        self.rotated += rotated
+        self.purged += len(purged)
+        self.vacuumed += vacuumed
+        self.runs += 1
+        if rotated or purged:
+            log.info("logs compacted: %d rows rotated, %d archive files "
+                     "removed, %d pages vacuumed", rotated, len(purged), vacuumed)
+        return {"rotated": rotated, "purged": purged, "vacuumed": vacuumed}
+
+    async def close(self):
+        """Stop after the step in progress."""
+        self._closing = True
+        self._wakeup.set()
+        task, self._task = self._task, None
+        if task is not None:
+            await task
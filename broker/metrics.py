@@ -0,0 +1,312 @@
+# secure_mqtt_broker/broker/metrics.py
+
+import asyncio
+import bisect
+import logging
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+# seconds; spans a queue-only dispatch (µs) up to a bcrypt check (100s of ms)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+Labels = Tuple[str, ...]
+
+
+def _fmt_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _fmt_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, int) or v.is_integer():
+        return str(int(v))
+    return repr(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Labels, "_Metric"] = {}
+
+    def labels(self, *values) -> "_Metric":
+        """
+        The child for one label combination.  Look it up once and keep it:
+        the hot path should only call ``inc()``/``observe()`` on it.
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = type(self)(self.name, self.help)
+        return child
+
+    def _series(self) -> Iterable[Tuple[Labels, "_Metric"]]:
+        if self.labelnames:
+            return sorted(self._children.items())
+        return [((), self)]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.kind}"]
+        for values, m in self._series():
+            lines.extend(m._samples(self.name, self.labelnames, values))
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Monotonic count.  ``inc()`` is a plain attribute add: everything that
+    touches it runs on the broker's event loop, so no lock is needed.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def _samples(self, name, names, values):
+        yield f"{name}{_fmt_labels(names, values)} {_fmt_value(self.value)}"
+
+
+class Gauge(_Metric):
+    """
+    Current value; either ``set()``/``inc()``/``dec()`` or a callback
+    evaluated at scrape time (``set_function``).  A labelled callback
+    returns ``{label value(s): value}``.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.value = 0
+        self._fn: Optional[Callable] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set_function(self, fn: Optional[Callable]):
+        self._fn = fn
+
+    def _series(self):
+        if self._fn is None:
+            return super()._series()
+        if not self.labelnames:
+            g = Gauge(self.name, self.help)
+            g.value = self._fn()
+            return [((), g)]
+        out = []
+        for key, value in sorted(self._fn().items()):
+            g = Gauge(self.name, self.help)
+            g.value = value
+            out.append((key if isinstance(key, tuple) else (key,), g))
+        return out
+
+    def _samples(self, name, names, values):
+        yield f"{name}{_fmt_labels(names, values)} {_fmt_value(self.value)}"
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values (seconds)."""
+    kind = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 help: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)     # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def labels(self, *values) -> "Histogram":
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = Histogram(
+                self.name, self.help, buckets=self.buckets)
+        return child
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _samples(self, name, names, values):
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += n
+            le = f'le="{_fmt_value(bound)}"'
+            yield f"{name}_bucket{_fmt_labels(names, values, le)} {cumulative}"
+        yield f"{name}_sum{_fmt_labels(names, values)} {self.sum!r}"
+        yield f"{name}_count{_fmt_labels(names, values)} {self.count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> _Metric:
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+# ——— Broker metrics ————————————————————————————————————————
+
+SESSIONS = gauge("broker_sessions",
+                 "Connected client sessions")
+SUBSCRIPTIONS = gauge("broker_subscriptions",
+                      "(client, filter) entries in the subscription index")
+RETAINED = gauge("broker_retained_messages",
+                 "Topics with a retained message")
+QUEUE_DEPTH = gauge("broker_outbound_queue_depth",
+                    "Frames waiting in a subscriber's outbound queue",
+                    ["client_id"])
+QUEUE_DROPPED = gauge("broker_outbound_dropped",
+                      "Frames dropped by outbound queue overflow, "
+                      "summed over connected sessions")
+INFLIGHT = gauge("broker_inflight_messages",
+                 "Outbound QoS 1/2 deliveries waiting for PUBACK/PUBREC/PUBCOMP")
+INFLIGHT_HELD = gauge("broker_inflight_held",
+                      "QoS 1/2 frames waiting for a free inflight slot")
+OFFLINE_SESSIONS = gauge("broker_offline_sessions",
+                         "Disconnected persistent sessions kept for reconnect")
+OFFLINE_MESSAGES = gauge("broker_offline_messages",
+                         "QoS 1/2 messages queued for offline sessions")
+OFFLINE_DROPPED = gauge("broker_offline_dropped",
+                        "Messages dropped because an offline queue was full")
+EVENT_FEED_LISTENERS = gauge("broker_event_feed_listeners",
+                             "Processes following the local event feed")
+EVENT_FEED_DROPPED = gauge("broker_event_feed_dropped",
+                           "Events not sent to a listener that fell behind")
+HANDSHAKES = gauge("broker_handshakes",
+                   "CONNECTs being authenticated and set up")
+HANDSHAKES_WAITING = gauge("broker_handshakes_waiting",
+                           "CONNECTs waiting for a handshake slot")
+CLIENT_THROTTLED = gauge("broker_client_throttled",
+                         "PUBLISHes a connected client was held back for "
+                         "by rate limits", ["client_id"])
+AUTH_WAITING = gauge("broker_auth_waiting",
+                     "CONNECTs waiting for a bcrypt thread")
+AUTH_ACTIVE = gauge("broker_auth_active",
+                    "bcrypt password checks running now")
+AUTH_MAX_WAITING = gauge("broker_auth_max_waiting",
+                         "Most CONNECTs seen waiting for a bcrypt thread")
+AUDIT_PENDING = gauge("broker_audit_pending",
+                      "Audit log records waiting to be written")
+AUDIT_DROPPED = gauge("broker_audit_dropped",
+                      "Audit log records lost to queue overflow or DB errors")
+
+PUBLISHES_IN = counter("broker_publishes_received_total",
+                       "PUBLISH packets accepted from clients", ["qos"])
+DELIVERIES_OUT = counter("broker_deliveries_total",
+                         "PUBLISH frames queued to subscribers", ["qos"])
+CONNECTS_REJECTED = counter("broker_connects_rejected_total",
+                            "CONNECTs refused by admission control", ["reason"])
+THROTTLE_SECONDS = counter("broker_throttle_seconds_total",
+                           "Time client readers were paused by rate limits")
+RETRANSMITS = counter("broker_retransmits_total",
+                      "Unacknowledged PUBLISH/PUBREL frames sent again")
+LOG_ROWS_ROTATED = counter("broker_log_rows_rotated_total",
+                           "Audit log rows moved to archives or expired")
+DISPATCH_SECONDS = histogram("broker_dispatch_seconds",
+                             "Time to fan one PUBLISH out to local subscribers")
+
+AUTH_SECONDS = histogram("broker_auth_seconds",
+                         "CONNECT authentication time (lookup + bcrypt)",
+                         ["result"])
+DB_WRITE_SECONDS = histogram("broker_db_write_seconds",
+                             "Batched write + commit time on the DB thread",
+                             ["table"])
+
+
+# ——— HTTP endpoint ——————————————————————————————————————————
+
+async def _handle_http(reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter,
+                       registry: Registry):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        # skip the headers; nothing in them matters here
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status = "200 OK"
+            body = registry.render().encode()
+        else:
+            status = "404 Not Found"
+            body = b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str,
+                               port: int,
+                               registry: Registry = REGISTRY) -> asyncio.AbstractServer:
+    """
+    Serve ``GET /metrics`` (plain HTTP) on the running event loop, so a
+    scrape reads the counters without any cross-thread handoff.
+    """
+    server = await asyncio.start_server(
+        lambda r, w: _handle_http(r, w, registry), host, port)
+    log.info("📈 Metrics on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,303 @@
+# secure_mqtt_broker/broker/mqtt_codec.py
+
+import asyncio
+import struct
+import uuid
+from typing import List, Optional, Tuple
+
+from broker.framing import ProtocolError
+import config.settings as settings
+
+# MQTT 3.1.1 control packet types (upper nibble of the fixed header)
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = range(1, 8)
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = range(8, 12)
+PINGREQ, PINGRESP, DISCONNECT = range(12, 15)
+
+_NAMES = {
+    CONNECT: "CONNECT", PUBLISH: "PUBLISH", PUBACK: "PUBACK",
+    PUBREC: "PUBREC", PUBREL: "PUBREL", PUBCOMP: "PUBCOMP",
+    SUBSCRIBE: "SUBSCRIBE", UNSUBSCRIBE: "UNSUBSCRIBE",
+    PINGREQ: "PINGREQ", DISCONNECT: "DISCONNECT",
+}
+
+# CONNACK return codes
+CONNACK_ACCEPTED           = 0x00
+CONNACK_SERVER_UNAVAILABLE = 0x03
+CONNACK_BAD_CREDENTIALS    = 0x04
+CONNACK_NOT_AUTHORIZED     = 0x05
+
+SUBACK_FAILURE = 0x80
+
+_U16 = struct.Struct("!H")
+
+
+def encode_remaining_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def _utf8(s: str) -> bytes:
+    data = s.encode("utf-8")
+    return _U16.pack(len(data)) + data
+
+
+class _Body:
+    """Cursor over the variable header + payload of one packet."""
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def remaining(self) -> int:
+        return len(self.data) - self.pos
+
+    def u8(self) -> int:
+        if self.pos >= len(self.data):
+            raise ProtocolError("packet truncated")
+        b = self.data[self.pos]
+        self.pos += 1
+        return b
+
+    def u16(self) -> int:
+        if self.pos + 2 > len(self.data):
+            raise ProtocolError("packet truncated")
+        (v,) = _U16.unpack_from(self.data, self.pos)
+        self.pos += 2
+        return v
+
+    def binary(self) -> bytes:
+        n = self.u16()
+        if self.pos + n > len(self.data):
+            raise ProtocolError("packet truncated")
+        v = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return v
+
+    def string(self) -> str:
+        try:
+            return self.binary().decode("utf-8")
+        except UnicodeDecodeError:
+            raise ProtocolError("invalid UTF-8 string") from None
+
+    def rest(self) -> memoryview:
+        # a view, not a copy: PUBLISH payloads can be large
+        v = memoryview(self.data)[self.pos:]
+        self.pos = len(self.data)
+        return v
+
+
+class MqttPublishFrame:
+    """
+    Binary counterpart of ``framing.PublishFrame``: the fixed header and
+    topic are encoded once; QoS 1/2 recipients only differ in the 2-byte
+    packet id between topic and payload.
+
+    A payload of settings.SHARED_PAYLOAD_MIN bytes or more is never
+    copied into a frame: buffers() returns (header, [id,] payload) and
+    every subscriber's queue references the same payload object -- the
+    ``bytes`` or receive-buffer ``memoryview`` the publisher's packet
+    was decoded into.
+    """
+    __slots__ = ("qos", "_shared", "_head", "_payload")
+
+    def __init__(self,
+                 topic: str,
+                 payload: bytes,
+                 qos: int = 0,
+                 retain: bool = False):
+        self.qos = qos
+        topic_b = _utf8(topic)
+        length = len(topic_b) + len(payload) + (2 if qos else 0)
+        flags = (qos << 1) | int(bool(retain))
+        self._head = bytes((PUBLISH << 4 | flags,)) + encode_remaining_length(length) + topic_b
+        self._payload = payload
+        if qos == 0 and len(payload) < settings.SHARED_PAYLOAD_MIN:
+            self._shared = self._head + payload
+        else:
+            self._shared = None
+
+    def buffers(self, pid: Optional[int] = None, dup: bool = False):
+        """
+        The packet for one recipient as ``bytes``, or as a tuple of
+        buffers to be written back to back (writelines).
+        """
+        if pid is None:
+            return self._shared or (self._head, self._payload)
+        head = self._head
+        if dup:
+            # retransmission: same packet with the DUP flag (bit 3) set
+            head = bytes((head[0] | 0x08,)) + head[1:]
+        if len(self._payload) < settings.SHARED_PAYLOAD_MIN:
+            return b"".join((head, _U16.pack(pid), self._payload))
+        return (head, _U16.pack(pid), self._payload)
+
+    def encode(self, pid: Optional[int] = None, dup: bool = False) -> bytes:
+        if pid is None:
+            if self._shared is None:
+                self._shared = self._head + self._payload
+            return self._shared
+        data = self.buffers(pid, dup)
+        return data if type(data) is bytes else b"".join(data)
+
+
+class MqttCodec:
+    """
+    MQTT 3.1.1 fixed-header / remaining-length framing.
+
+    Packets are parsed incrementally from the StreamReader: one header
+    byte, the remaining-length varint, then exactly that many bytes.
+    Payloads stay ``bytes`` end to end; a decoded PUBLISH payload is a
+    ``memoryview`` into the packet's receive buffer.
+    """
+    name = "mqtt"
+
+    def __init__(self, max_packet_size: int = settings.MAX_PACKET_SIZE):
+        self.max_packet_size = max_packet_size
+
+    # ─── decoding ─────────────────────────────────────────────────────
+    async def read_packet(self,
+                          reader: asyncio.StreamReader) -> Optional[dict]:
+        try:
+            header = (await reader.readexactly(1))[0]
+            length, multiplier = 0, 1
+            for _ in range(4):
+                byte = (await reader.readexactly(1))[0]
+                length += (byte & 0x7F) * multiplier
+                if not byte & 0x80:
+                    break
+                multiplier *= 128
+            else:
+                raise ProtocolError("malformed remaining length")
+            if length > self.max_packet_size:
+                raise ProtocolError(f"packet of {length} bytes exceeds limit")
+            body = await reader.readexactly(length) if length else b""
+        except asyncio.IncompleteReadError:
+            return None
+        return self.decode(header, body)
+
+    def decode(self, header: int, body: bytes) -> dict:
+        ptype, flags = header >> 4, header & 0x0F
+        name = _NAMES.get(ptype)
+        if name is None:
+            raise ProtocolError(f"unexpected packet type {ptype}")
+        b = _Body(body)
+
+        if ptype == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            if qos == 3:
+                raise ProtocolError("invalid PUBLISH QoS 3")
+            pkt = {"type": name, "topic": b.string(), "qos": qos,
+                   "retain": bool(flags & 0x01), "dup": bool(flags & 0x08)}
+            if qos:
+                pkt["id"] = b.u16()
+            pkt["payload"] = b.rest()
+            return pkt
+        if ptype in (PUBACK, PUBREC, PUBREL, PUBCOMP):
+            return {"type": name, "id": b.u16()}
+        if ptype == SUBSCRIBE:
+            pid = b.u16()
+            topics: List[Tuple[str, int]] = []
+            while b.remaining():
+                topics.append((b.string(), b.u8() & 0x03))
+            if not topics:
+                raise ProtocolError("SUBSCRIBE without topic filters")
+            return {"type": name, "id": pid, "topics": topics,
+                    "topic": topics[0][0], "qos": topics[0][1]}
+        if ptype == UNSUBSCRIBE:
+            pid = b.u16()
+            topics = []
+            while b.remaining():
+                topics.append(b.string())
+            if not topics:
+                raise ProtocolError("UNSUBSCRIBE without topic filters")
+            return {"type": name, "id": pid, "topics": topics}
+        if ptype == CONNECT:
+            return self._decode_connect(b)
+        # PINGREQ, DISCONNECT
+        return {"type": name}
+
+    def _decode_connect(self, b: _Body) -> dict:
+        proto, level = b.string(), b.u8()
+        if (proto, level) not in (("MQTT", 4), ("MQIsdp", 3)):
+            raise ProtocolError(f"unsupported protocol {proto!r} level {level}")
+        flags = b.u8()
+        keepalive = b.u16()
+        client_id = b.string()
+        if not client_id:
+            # 3.1.1 §3.1.3.1: the server assigns an id to anonymous clients
+            client_id = f"auto-{uuid.uuid4().hex[:16]}"
+        pkt = {"type": "CONNECT", "client_id": client_id,
+               "clean_session": bool(flags & 0x02), "keepalive": keepalive}
+        if flags & 0x04:
+            pkt["last_will"] = {
+                "topic":   b.string(),
+                "payload": b.binary(),
+                "qos":     (flags >> 3) & 0x03,
+                "retain":  bool(flags & 0x20),
+            }
+        pkt["username"] = b.string() if flags & 0x80 else ""
+        password = b.binary() if flags & 0x40 else b""
+        pkt["password"] = password.decode("utf-8", "replace")
+        return pkt
+
+    # ─── encoding ─────────────────────────────────────────────────────
+    def _frame(self, ptype: int, flags: int, body: bytes) -> bytes:
+        return (bytes((ptype << 4 | flags,))
+                + encode_remaining_length(len(body)) + body)
+
+    def encode(self, packet: dict) -> bytes:
+        kind = packet["type"]
+        if kind == "CONNACK":
+            code = CONNACK_ACCEPTED if packet.get("success") else \
+                packet.get("return_code", CONNACK_BAD_CREDENTIALS)
+            return self._frame(CONNACK, 0, bytes(
+                (int(bool(packet.get("session_present"))), code)))
+        if kind == "PUBLISH":
+            return MqttPublishFrame(
+                packet["topic"], _binary(packet.get("payload", b"")),
+                packet.get("qos", 0), packet.get("retain", False)
+            ).encode(packet.get("id"))
+        if kind in ("PUBACK", "PUBREC", "PUBCOMP"):
+            ptype = {"PUBACK": PUBACK, "PUBREC": PUBREC, "PUBCOMP": PUBCOMP}[kind]
+            return self._frame(ptype, 0, _U16.pack(packet["id"]))
+        if kind == "PUBREL":
+            # PUBREL carries the reserved flags 0b0010
+            return self._frame(PUBREL, 0x02, _U16.pack(packet["id"]))
+        if kind == "SUBACK":
+            granted = packet.get("granted")
+            if granted is None:
+                granted = [packet.get("qos", 0) if packet.get("success")
+                           else SUBACK_FAILURE]
+            return self._frame(SUBACK, 0,
+                               _U16.pack(packet.get("id", 0)) + bytes(granted))
+        if kind == "UNSUBACK":
+            return self._frame(UNSUBACK, 0, _U16.pack(packet.get("id", 0)))
+        if kind == "PINGRESP":
+            return self._frame(PINGRESP, 0, b"")
+        raise ProtocolError(f"cannot encode {kind!r} as MQTT")
+
+    def publish_frame(self,
+                      topic: str,
+                      payload: bytes,
+                      qos: int = 0,
+                      retain: bool = False) -> MqttPublishFrame:
+        return MqttPublishFrame(topic, _binary(payload), qos, retain)
+
+
+def _binary(payload):
+    # bytes and memoryviews of bytes are immutable: share them as they are
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    if isinstance(payload, bytearray):
+        return bytes(payload)
+    return payload
+
+
+MQTT_CODEC = MqttCodec()
@@ -0,0 +1,239 @@
+# secure_mqtt_broker/broker/offline.py
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from broker.metrics import DB_WRITE_SECONDS
+import config.settings as settings
+
+log = logging.getLogger(__name__)
+
+_WRITE_SECONDS = DB_WRITE_SECONDS.labels("offline_messages")
+
+# (topic, payload, qos, retain)
+OfflineMessage = Tuple[str, bytes, int, bool]
+
+# every statement is scoped to one worker process: with --workers N the
+# processes share the table but not their sessions
+INSERT_OFFLINE_SQL = (
+    "INSERT INTO offline_messages(worker, client_id, topic, payload, qos, retain) "
+    "VALUES (?,?,?,?,?,?)"
+)
+SELECT_OFFLINE_SQL = (
+    "SELECT id, topic, payload, qos, retain FROM offline_messages "
+    "WHERE worker = ? AND client_id = ? ORDER BY id LIMIT ?"
+)
+DELETE_OFFLINE_UPTO_SQL = (
+    "DELETE FROM offline_messages WHERE worker = ? AND client_id = ? AND id <= ?"
+)
+DELETE_OFFLINE_CLIENT_SQL = (
+    "DELETE FROM offline_messages WHERE worker = ? AND client_id = ?"
+)
+# this worker's rows, and those of workers a smaller --workers no longer runs
+DELETE_OFFLINE_WORKER_SQL = (
+    "DELETE FROM offline_messages WHERE worker = ? OR worker >= ?"
+)
+
+
+def _take_rows(db, worker: int, client_id: str, n: int) -> list:
+    # on the DB thread, inside one transaction: read a batch and delete it
+    rows = db.query(SELECT_OFFLINE_SQL, (worker, client_id, n))
+    if rows:
+        db.execute(DELETE_OFFLINE_UPTO_SQL, (worker, client_id, rows[-1]["id"]))
+    return rows
+
+
+class _Queue:
+    __slots__ = ("memory", "pending", "writing", "on_disk", "dropped")
+
+    def __init__(self):
+        # oldest first: memory, then rows on disk, then rows being written,
+        # then pending (not yet handed to the DB thread)
+        self.memory: Deque[OfflineMessage] = deque()
+        self.pending: List[OfflineMessage] = []
+        self.writing = 0
+        self.on_disk = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.memory) + self.on_disk + self.writing + len(self.pending)
+
+    @property
+    def spilled(self) -> bool:
+        return bool(self.on_disk or self.writing or self.pending)
+
+
+class OfflineStore:
+    """
+    QoS 1/2 messages waiting for disconnected persistent sessions.
+
+    Each client's queue keeps up to ``memory_limit`` messages in memory;
+    once that is full, newer messages are spilled to ``offline_messages``
+    by a background flusher (one executemany per ``spill_batch`` rows or
+    ``flush_interval``), and keep going to disk until the spilled part is
+    replayed, so delivery order is preserved.  A queue never holds more
+    than ``max_messages``; later messages are dropped and counted.
+
+    Sessions live in memory, so rows left over from a previous run are
+    deleted by start().  With several worker processes (``worker`` of
+    ``workers``), each owns its rows: a persistent session can only be
+    resumed on the worker that stored it, and start() leaves the other
+    workers' rows alone.
+    """
+
+    def __init__(self,
+                 db,
+                 worker: int = 0,
+                 workers: int = 1,
+                 memory_limit: int = settings.OFFLINE_MEMORY_MESSAGES,
+                 max_messages: int = settings.OFFLINE_QUEUE_MAX,
+                 spill_batch: int = settings.OFFLINE_SPILL_BATCH,
+                 flush_interval: float = settings.OFFLINE_SPILL_INTERVAL_MS / 1000):
+        self.db = db
+        self.worker = worker
+        self.workers = workers
+        self.memory_limit = memory_limit
+        self.max_messages = max_messages
+        self.spill_batch = spill_batch
+        self.flush_interval = flush_interval
+
+        self._queues: Dict[str, _Queue] = {}
+        self._pending_total = 0
+        # serializes disk reads/writes so replay never misses rows in flight
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+        # counters
+        self.queued = 0
+        self.spilled = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        """Messages waiting across all clients."""
+        return sum(len(q) for q in self._queues.values())
+
+    def depth(self, client_id: str) -> int:
+        q = self._queues.get(client_id)
+        return len(q) if q else 0
+
+    async def start(self):
+        await self.db.execute(DELETE_OFFLINE_WORKER_SQL,
+                              (self.worker, self.workers))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def push(self, client_id: str, topic: str, payload: bytes,
+             qos: int, retain: bool = False) -> bool:
+        """Queue one message for ``client_id``; False if its queue is full."""
+        q = self._queues.get(client_id)
+        if q is None:
+            q = self._queues[client_id] = _Queue()
+        if len(q) >= self.max_messages:
+            q.dropped += 1
+            self.dropped += 1
+            return False
+        msg = (topic, bytes(payload), qos, retain)
+        self.queued += 1
+        if not q.spilled and len(q.memory) < self.memory_limit:
+            q.memory.append(msg)
+            return True
+        q.pending.append(msg)
+        self._pending_total += 1
+        if self._pending_total >= self.spill_batch:
+            self._wakeup.set()
+        return True
+
+    def requeue(self, client_id: str, messages: List[OfflineMessage]):
+        """Put messages popped but not delivered back at the front."""
+        if not messages:
+            return
+        q = self._queues.get(client_id)
+        if q is None:
+            q = self._queues[client_id] = _Queue()
+        q.memory.extendleft(reversed(messages))
+
+    async def pop_batch(self, client_id: str, n: int) -> List[OfflineMessage]:
+        """Take up to ``n`` of the oldest messages queued for ``client_id``."""
+        q = self._queues.get(client_id)
+        if q is None:
+            return []
+        if q.memory:
+            return [q.memory.popleft() for _ in range(min(n, len(q.memory)))]
+        async with self._lock:
+            # a flush in progress has finished here: on_disk is exact
+            if q.on_disk:
+                rows = await self.db.run_in_transaction(
+                    _take_rows, self.worker, client_id, n)
+                q.on_disk = max(0, q.on_disk - len(rows))
+                return [(r["topic"], bytes(r["payload"] or b""), r["qos"],
+                         bool(r["retain"])) for r in rows]
+            batch, q.pending = q.pending[:n], q.pending[n:]
+            self._pending_total -= len(batch)
+        if not len(q):
+            self._queues.pop(client_id, None)
+        return batch
+
+    async def discard(self, client_id: str):
+        """Forget everything queued for ``client_id`` (session ended)."""
+        q = self._queues.pop(client_id, None)
+        if q is None:
+            return
+        self._pending_total -= len(q.pending)
+        async with self._lock:
+            if q.on_disk:
+                await self.db.execute(DELETE_OFFLINE_CLIENT_SQL,
+                                      (self.worker, client_id))
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write every pending message to disk in one transaction."""
+        if not self._pending_total:
+            return 0
+        async with self._lock:
+            batch, moved = [], []
+            for client_id, q in self._queues.items():
+                if q.pending:
+                    batch.extend((self.worker, client_id, *m[:3], int(m[3]))
+                                 for m in q.pending)
+                    moved.append((q, len(q.pending)))
+                    q.writing += len(q.pending)
+                    q.pending = []
+            self._pending_total = 0
+            started = time.perf_counter()
+            try:
+                await self.db.executemany(INSERT_OFFLINE_SQL, batch)
+            except sqlite3.Error as e:
+                for q, n in moved:
+                    q.writing -= n
+                    q.dropped += n
+                self.dropped += len(batch)
+                log.error("failed to spill %d offline messages: %s", len(batch), e)
+                return 0
+            _WRITE_SECONDS.observe(time.perf_counter() - started)
+            for q, n in moved:
+                q.writing -= n
+                q.on_disk += n
+        self.spilled += len(batch)
+        return len(batch)
+
+    async def close(self):
+        """Stop the flusher; queued messages die with the sessions."""
+        self._closing = True
+        self._wakeup.set()
+        task, self._task = self._task, None
+        if task is not None:
+            await task
@@ -0,0 +1,226 @@
+# secure_mqtt_broker/broker/retained.py
+
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from broker.metrics import DB_WRITE_SECONDS
+import config.settings as settings
+
+log = logging.getLogger(__name__)
+
+_WRITE_SECONDS = DB_WRITE_SECONDS.labels("retained_messages")
+
+# topic -> (payload, qos)
+RetainedMessage = Tuple[bytes, int]
+
+UPSERT_RETAINED_SQL = (
+    "INSERT INTO retained_messages(topic, payload, qos, timestamp) "
+    "VALUES (?,?,?,CURRENT_TIMESTAMP) "
+    "ON CONFLICT(topic) DO UPDATE SET payload = excluded.payload, "
+    "qos = excluded.qos, timestamp = excluded.timestamp"
+)
+
+DELETE_RETAINED_SQL = "DELETE FROM retained_messages WHERE topic = ?"
+
+
+class _Node:
+    __slots__ = ("children", "message")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.message: Optional[RetainedMessage] = None
+
+
+def _write_retained(db, upserts, deletes):
+    # on the DB thread, inside one transaction
+    if upserts:
+        db.executemany(UPSERT_RETAINED_SQL, upserts)
+    if deletes:
+        db.executemany(DELETE_RETAINED_SQL, deletes)
+
+
+class RetainedStore:
+    """
+    Retained messages, one per topic.
+
+    Topics are kept in a level trie (the mirror image of TopicTrie: here
+    the stored keys are concrete topics and the lookup is a filter), so a
+    SUBSCRIBE only visits the branches its filter can reach.
+
+    Changes apply to memory immediately and are persisted write-behind:
+    only the latest state of each changed topic is kept, and every
+    ``flush_interval`` seconds it is upserted (UNIQUE topic) or deleted
+    on the DB thread.
+    An empty payload clears the topic, as in MQTT.
+    """
+
+    def __init__(self,
+                 db,
+                 flush_interval: float = settings.RETAINED_FLUSH_INTERVAL_MS / 1000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.root = _Node()
+        self._count = 0
+
+        # topic -> latest message, or None for "delete"
+        self._dirty: Dict[str, Optional[RetainedMessage]] = {}
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+        # counters
+        self.persisted = 0      # upserts + deletes committed
+        self.errors = 0         # flushes that failed (state kept for retry)
+
+    def __len__(self) -> int:
+        return self._count
+
+    async def load(self):
+        """Fill the index from ``retained_messages`` (startup only)."""
+        rows = await self.db.query(
+            "SELECT topic, payload, qos FROM retained_messages")
+        for r in rows:
+            payload = r["payload"]
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            if payload:
+                self._store(r["topic"], (bytes(payload), r["qos"] or 0))
+
+    # ——— in-memory index ——————————————————————————————————
+
+    def _store(self, topic: str, message: Optional[RetainedMessage]) -> bool:
+        """Set or (message=None) clear one topic; True if the index changed."""
+        path: List[Tuple[_Node, str]] = []
+        node = self.root
+        for level in topic.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                if message is None:
+                    return False
+                child = node.children[level] = _Node()
+            path.append((node, level))
+            node = child
+
+        if message is not None:
+            if node.message is None:
+                self._count += 1
+            node.message = message
+            return True
+
+        if node.message is None:
+            return False
+        node.message = None
+        self._count -= 1
+        # prune branches that no longer lead to a message
+        for parent, level in reversed(path):
+            if node.message is not None or node.children:
+                break
+            del parent.children[level]
+            node = parent
+        return True
+
+    def get(self, topic: str) -> Optional[RetainedMessage]:
+        node = self.root
+        for level in topic.split('/'):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node.message
+
+    def match(self, topic_filter: str) -> List[Tuple[str, bytes, int]]:
+        """
+        ``(topic, payload, qos)`` for every retained topic matched by
+        ``topic_filter``, with the same rules as match_topic().
+        """
+        levels = topic_filter.split('/')
+        depth = len(levels)
+        found: List[Tuple[str, bytes, int]] = []
+        stack = [(self.root, 0, [])]
+        while stack:
+            node, i, path = stack.pop()
+            if i == depth:
+                if node.message is not None:
+                    found.append(("/".join(path), *node.message))
+                continue
+            level = levels[i]
+            if level == '#':
+                # this level and everything below it
+                sub = [(node, path)] if node.message is not None else []
+                walk = [(c, path + [lvl]) for lvl, c in node.children.items()]
+                while walk:
+                    n, p = walk.pop()
+                    if n.message is not None:
+                        sub.append((n, p))
+                    walk.extend((c, p + [lvl]) for lvl, c in n.children.items())
+                found.extend(("/".join(p), *n.message) for n, p in sub)
+            elif level == '+':
+                for lvl, child in node.children.items():
+                    stack.append((child, i + 1, path + [lvl]))
+            else:
+                child = node.children.get(level)
+                if child is not None:
+                    stack.append((child, i + 1, path + [level]))
+        return found
+
+    # ——— updates + write-behind ————————————————————————————
+
+    def set(self,
+            topic: str,
+            payload: bytes,
+            qos: int = 0,
+            persist: bool = True) -> None:
+        """
+        Retain ``payload`` on ``topic`` (empty payload: clear it).
+        ``persist=False`` updates memory only, e.g. for a message another
+        worker process already stored.
+        """
+        message = (bytes(payload), qos) if payload else None
+        if not self._store(topic, message) or not persist:
+            return
+        self._dirty[topic] = message
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Persist every topic changed since the last flush."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        upserts = [(t, m[0], m[1]) for t, m in dirty.items() if m is not None]
+        deletes = [(t,) for t, m in dirty.items() if m is None]
+        started = time.perf_counter()
+        try:
+            await self.db.run_in_transaction(_write_retained, upserts, deletes)
+        except sqlite3.Error as e:
+            self.errors += 1
+            # keep newer changes made while we were writing
+            for topic, message in dirty.items():
+                self._dirty.setdefault(topic, message)
+            log.error("failed to persist %d retained topics: %s", len(dirty), e)
+            return 0
+        _WRITE_SECONDS.observe(time.perf_counter() - started)
+        self.persisted += len(dirty)
+        return len(dirty)
+
+    async def close(self):
+        """Stop the flusher and persist whatever is still pending."""
+        self._closing = True
+        self._wakeup.set()
+        task, self._task = self._task, None
+        if task is not None:
+            await task
+        await self.flush()
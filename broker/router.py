@@ -1,21 +1,83 @@
 # secure_mqtt_broker/broker/router.py
 
-import asyncio, json
-from typing import Dict, List, Tuple, Optional
+import asyncio
+import logging
+import sys
+import time
+from typing import Dict, List, Optional
 
-from broker.session import SessionManager
-from database.encrypted_db import EncryptedSQLiteDB
+from broker.admission import AdmissionControl
+from broker.audit import AuditLogWriter
+from broker.cluster import ClusterLink
+from broker.event_feed import EventFeed
+from broker.session import Session, SessionManager
+from broker.framing import JSON_CODEC, ProtocolError
+from broker.metrics import (CONNECTS_REJECTED, DELIVERIES_OUT, DISPATCH_SECONDS,
+                            PUBLISHES_IN, THROTTLE_SECONDS)
+from broker.mqtt_codec import CONNACK_SERVER_UNAVAILABLE
+from broker.offline import OfflineStore
+from broker.retained import RetainedStore
+from broker.topic_trie import TopicTrie
+from database.async_db import AsyncEncryptedDB
+import config.settings as settings
+
+log = logging.getLogger(__name__)
+
+# per-QoS metric children, resolved once
+_PUBLISHES_IN = tuple(PUBLISHES_IN.labels(q) for q in range(3))
+_DELIVERIES_OUT = tuple(DELIVERIES_OUT.labels(q) for q in range(3))
+_REJECTED_SESSIONS = CONNECTS_REJECTED.labels("max_sessions")
 
 class Router:
     def __init__(self,
                  session_mgr: SessionManager,
-                 db: EncryptedSQLiteDB):
+                 db: AsyncEncryptedDB,
+                 cluster: Optional[ClusterLink] = None,
+                 event_feed: Optional[EventFeed] = None,
+                 admission: Optional[AdmissionControl] = None):
         self.session_mgr = session_mgr
         self.db          = db
+        # peer workers in multi-process mode (None when running alone)
+        self.cluster     = cluster
+        # handshake / session caps and per-client PUBLISH rate limits
+        self.admission   = admission if admission is not None else AdmissionControl()
+        # sessions being taken over -> resolved when their connection is gone
+        self._takeovers: Dict[Session, asyncio.Future] = {}
+
+        # topic_filter trie: client_id -> Session at each filter node;
+        # each Session keeps the handles of its own filters
+        self.subscriptions = TopicTrie()
+        # retained messages by topic, loaded by start()
+        self.retained = RetainedStore(db)
+        # QoS 1/2 messages for offline persistent sessions
+        self.offline = (OfflineStore(db, cluster.index, cluster.workers)
+                        if cluster else OfflineStore(db))
+        self._expiry_task: Optional[asyncio.Task] = None
+        # batched, non-blocking writer for the logs table; committed
+        # records also go out on the local event feed, if any
+        self.audit = AuditLogWriter(db, feed=event_feed)
+
+    async def start(self):
+        """Load persisted state and start background tasks."""
+        await self.retained.load()
+        self.retained.start()
+        await self.offline.start()
+        if settings.SESSION_EXPIRY is not None:
+            self._expiry_task = asyncio.create_task(
+                self._expire_sessions(settings.SESSION_EXPIRY))
+        self.audit.start()
+        if self.cluster:
+            await self.cluster.start(self._on_cluster_publish)
 
-        # list of (client_id, StreamWriter, topic_filter)
-        self.subscriptions: List[Tuple[str, asyncio.StreamWriter, str]] = []
-        self.retained = self._load_retained_messages()
+    async def close(self):
+        """Stop background tasks, flushing buffered records."""
+        if self.cluster:
+            await self.cluster.close()
+        if self._expiry_task:
+            self._expiry_task.cancel()
+        await self.offline.close()
+        await self.retained.close()
+        await self.audit.close()
 
     def _log(self,
              client_id: Optional[str],
@@ -24,213 +86,497 @@ class Router:
              success: bool,
              details: str = "") -> None:
         """
-        Write an entry into the logs table.
+        Queue an entry for the logs table (written in batches by self.audit).
         """
-        self.db.execute(
-            "INSERT INTO logs(client_id, topic, action, success, details) VALUES (?,?,?,?,?)",
-            (
-                client_id or "",
-                topic    or "",
-                action,
-                int(success),
-                details
-            )
-        )
-
-    def _load_retained_messages(self) -> Dict[str, str]:
-        rows = self.db.query("SELECT topic, payload FROM retained_messages")
-        return {r["topic"]: r["payload"] for r in rows}
+        self.audit.write(client_id, topic, action, success, details)
 
     async def handle_client(self,
                             reader: asyncio.StreamReader,
-                            writer: asyncio.StreamWriter):
+                            writer: asyncio.StreamWriter,
+                            codec=JSON_CODEC):
+        """
+        Run one client connection.  ``codec`` is the listener's wire format
+        (newline JSON or binary MQTT); the router only sees packet dicts.
+        """
         peer = writer.get_extra_info("peername")
         client_id = None
         user = None
+        session = None
+        replay = None
+        throttle = None
         try:
             # ─── 1) CONNECT ────────────────────────────────────────────────
-            pkt = await self._recv_packet(reader)
-            if pkt.get("type") != "CONNECT":
+            pkt = await self._recv_packet(reader, codec)
+            if not pkt or pkt.get("type") != "CONNECT":
                 return await self._close(writer)
 
-            # authenticate
-            user = await self.session_mgr.authenticate(
-                pkt["username"], pkt["password"]
-            )
-            if not user:
-                # log failed CONNECT
-                self._log(None, None, "CONNECT", False, "auth failed")
-                await self._send_packet(writer, {"type":"CONNACK","success":False})
-                return await self._close(writer)
+            # auth and session setup run in one of a bounded number of slots
+            async with self.admission.handshake():
+                # authenticate
+                user = await self.session_mgr.authenticate(
+                    pkt["username"], pkt["password"]
+                )
+                if not user:
+                    # log failed CONNECT
+                    self._log(None, None, "CONNECT", False, "auth failed")
+                    await self._send_packet(writer, {"type":"CONNACK","success":False}, codec)
+                    return await self._close(writer)
 
-            client_id = pkt["client_id"]
-            self._log(client_id, None, "CONNECT", True)
+                if not self.admission.admit(self.session_mgr, pkt["client_id"]):
+                    _REJECTED_SESSIONS.inc()
+                    self._log(pkt["client_id"], None, "CONNECT", False,
+                              "session limit reached")
+                    await self._send_packet(writer, {
+                        "type": "CONNACK", "success": False,
+                        "return_code": CONNACK_SERVER_UNAVAILABLE}, codec)
+                    return await self._close(writer)
 
-            # create session (w/ optional LWT)
-            will = pkt.get("last_will")
-            self.session_mgr.create_session(client_id, writer, will)
-            await self._send_packet(writer, {"type":"CONNACK","success":True})
+                client_id = pkt["client_id"]
+                self._log(client_id, None, "CONNECT", True)
+                # the same client_id still connected: end that connection
+                # first, so its cleanup cannot touch the new session
+                await self._take_over(client_id)
 
-            # ─── 2) Deliver retained messages ───────────────────────────────
-            for topic, msg in self.retained.items():
-                if self.session_mgr.can_subscribe(user, topic):
-                    await self._send_packet(writer, {
-                        "type":"PUBLISH","topic":topic,
-                        "payload":msg,"retain":True
-                    })
+                # MQTT 3.1.1 §3.1.2.10: silent for 1.5 keepalives = gone
+                keepalive = pkt.get("keepalive") or 0
+                idle = 1.5 * keepalive if keepalive > 0 else None
 
-            # ─── 3) Main loop (SUBSCRIBE / PUBLISH) ─────────────────────────
+                # create or resume the session (w/ optional LWT)
+                clean = pkt.get("clean_session", True)
+                if clean:
+                    # a clean start ends any session stored for this client
+                    await self._discard_offline(client_id)
+                will = pkt.get("last_will")
+                session, present = self.session_mgr.create_session(
+                    client_id, writer, will, codec, clean_session=clean)
+                await self._send_packet(writer, {"type":"CONNACK","success":True,
+                                                 "session_present":present}, codec)
+            throttle = self.admission.throttle(client_id, user)
+            if present:
+                # subscriptions are still in the trie; catch up on the rest
+                replay = asyncio.create_task(self._replay_offline(session))
+
+            # ─── 2) Main loop (SUBSCRIBE / UNSUBSCRIBE / PUBLISH) ───────────
             while True:
-                pkt = await self._recv_packet(reader)
-                if not pkt or pkt.get("type") == "DISCONNECT":
+                if idle is None:
+                    pkt = await self._recv_packet(reader, codec)
+                else:
+                    try:
+                        pkt = await asyncio.wait_for(
+                            self._recv_packet(reader, codec), idle)
+                    except asyncio.TimeoutError:
+                        # a half-open connection: disconnect, Will included
+                        log.info("%r sent nothing for %.0fs (keepalive %ds), "
+                                 "disconnecting", client_id, idle, keepalive)
+                        self._log(client_id, None, "KEEPALIVE_TIMEOUT", False)
+                        break
+                if not pkt:
+                    break
+                if pkt.get("type") == "DISCONNECT":
+                    # MQTT 3.1.1 §3.14.4: a clean disconnect discards the Will
+                    session.will = None
                     break
-                print(f"[router] received packet: {pkt!r}")
-                
+                log.debug("received %s from %r: %r", pkt["type"], client_id, pkt)
+
                 # ─── SUBSCRIBE ──────────────────────────────────────────────────
                 if pkt["type"] == "SUBSCRIBE":
-                    success = self.session_mgr.can_subscribe(user, pkt["topic"])
-                    await self._handle_subscribe(client_id, user, pkt["topic"], writer)
-                    # log SUBSCRIBE attempt
-                    self._log(client_id, pkt["topic"], "SUBSCRIBE", success,
-                              "" if success else "ACL denied")
+                    # JSON clients send one filter; MQTT may send several
+                    topics = pkt.get("topics") or [(pkt["topic"], pkt.get("qos", 0))]
+                    granted = []
+                    accepted = []
+                    for topic, req_qos in topics:
+                        sub_qos = min(req_qos, 2)
+                        success = await self._handle_subscribe(
+                            session, user, topic, sub_qos)
+                        granted.append(sub_qos if success else 0x80)
+                        if success:
+                            accepted.append((topic, sub_qos))
+                        # log SUBSCRIBE attempt
+                        self._log(client_id, topic, "SUBSCRIBE", success,
+                                  "" if success else "ACL denied")
+                    suback = {"type":"SUBACK",
+                              "success":0x80 not in granted,
+                              "topic":topics[0][0],
+                              "granted":granted}
+                    if pkt.get("id") is not None:
+                        suback["id"] = pkt["id"]
+                    await self._send_packet(writer, suback, codec)
+                    # retained messages for the new filters follow the SUBACK
+                    for topic, sub_qos in accepted:
+                        self._deliver_retained(session, topic, sub_qos)
+
+                # ─── UNSUBSCRIBE ────────────────────────────────────────────────
+                elif pkt["type"] == "UNSUBSCRIBE":
+                    topics = pkt.get("topics") or [pkt["topic"]]
+                    removed = self._handle_unsubscribe(session, topics)
+                    for topic in topics:
+                        self._log(client_id, topic, "UNSUBSCRIBE", topic in removed)
+                    unsuback = {"type":"UNSUBACK",
+                                "success":len(removed) == len(topics),
+                                "topic":topics[0]}
+                    if pkt.get("id") is not None:
+                        unsuback["id"] = pkt["id"]
+                    await self._send_packet(writer, unsuback, codec)
 
                 # ─── PUBLISH (QoS0/1/2 step 1) ──────────────────────────────────
                 elif pkt["type"] == "PUBLISH":
+                    if throttle is not None:
+                        wait = throttle.charge(len(pkt.get("payload") or b""))
+                        if wait:
+                            await self._throttle(session, wait)
                     qos = pkt.get("qos", 0)
                     pid = pkt.get("id")
+                    if qos not in (0, 1, 2):
+                        raise ProtocolError(f"invalid QoS {qos!r}")
                     # ACL, logging, retain…
-                    if not self.session_mgr.can_publish(user, pkt["topic"]):
-                        # log + continue
+                    if not await self.session_mgr.can_publish(user, pkt["topic"]):
+                        self._log(client_id, pkt["topic"], "PUBLISH", False,
+                                  "ACL denied")
+                        # 3.1.1 has no negative ack: acknowledge and drop,
+                        # or the client retries this packet id forever
+                        if qos and pid is not None:
+                            await self._send_packet(writer, {
+                                "type": "PUBACK" if qos == 1 else "PUBREC",
+                                "id": pid}, codec)
                         continue
+                    _PUBLISHES_IN[qos].inc()
                     # log success, handle retained…
                     # QoS2 first handshake
                     if qos == 2 and pid is not None:
-                        sess = self.session_mgr.sessions[client_id]
-                        sess.pending_pubrec[pid] = (
+                        # this connection's own session: after a timed-out
+                        # takeover another one may be registered under client_id
+                        session.store_pubrec(pid, (
                             pkt["topic"], pkt["payload"], pkt.get("retain", False)
-                        )
-                        await self._send_packet(writer, {"type":"PUBREC","id":pid})
+                        ))
+                        await self._send_packet(writer, {"type":"PUBREC","id":pid}, codec)
                         continue
                     # QoS1 handshake
                     if qos == 1 and pid is not None:
-                        await self._send_packet(writer, {"type":"PUBACK","id":pid})
+                        await self._send_packet(writer, {"type":"PUBACK","id":pid}, codec)
                     # Finally dispatch to subscribers (at qos 0/1)
-                    await self._dispatch_publish(
-                        pkt["topic"], pkt["payload"], qos=qos
+                    self._publish(
+                        pkt["topic"], pkt["payload"], qos, pkt.get("retain", False)
                     )
+                # ─── Acks for our deliveries to this client ──────────────────────
+                elif pkt["type"] == "PUBACK":
+                    session.puback(pkt.get("id"))
+                elif pkt["type"] == "PUBREC":
+                    # answered with PUBREL through the outbound queue
+                    session.pubrec(pkt.get("id"))
+                elif pkt["type"] == "PUBCOMP":
+                    session.pubcomp(pkt.get("id"))
                 # ─── PUBREL (QoS2 step 2) ───────────────────────────────────────
                 elif pkt["type"] == "PUBREL":
                     pid = pkt.get("id")
-                    sess = self.session_mgr.sessions[client_id]
-                    entry = sess.pending_pubrec.pop(pid, None)
+                    entry = session.release_pubrec(pid)
                     if entry:
                         topic, payload, retain = entry
                         # dispatch at QoS2
-                        await self._dispatch_publish(topic, payload, qos=2)
+                        self._publish(topic, payload, 2, retain)
                     # complete handshake
-                    await self._send_packet(writer, {"type":"PUBCOMP","id":pid})
+                    await self._send_packet(writer, {"type":"PUBCOMP","id":pid}, codec)
+                # ─── PINGREQ (MQTT keep-alive) ──────────────────────────────────
+                elif pkt["type"] == "PINGREQ":
+                    await self._send_packet(writer, {"type":"PINGRESP"}, codec)
 
+        except ProtocolError as e:
+            log.warning("protocol error from %r: %s", client_id or peer, e)
 
-            # ─── 4) DISCONNECT / LWT ────────────────────────────────────────
+            # ─── 3) DISCONNECT / LWT ────────────────────────────────────────
         finally:
-            if client_id:
-                will = await self.session_mgr.terminate_session(client_id)
+            self.admission.release(throttle)
+            if client_id and session is not None:
+                # ───── Remove this client's subscriptions ──────────
+                # (before the session goes away, so no dispatch targets it);
+                # a persistent session keeps them and queues while offline,
+                # unless a newer connection has replaced it
+                current = self.session_mgr.sessions.get(client_id) is session
+                if session.clean_session or not current:
+                    self._remove_filters(session)
+
+                will = await self.session_mgr.terminate_session(client_id, session)
+                if replay is not None:
+                    # stops by itself once the session is offline
+                    await replay
                 # log the DISCONNECT
                 self._log(client_id, None, "DISCONNECT", True)
-
-                # ───── Remove this client's subscriptions ──────────
-                before = len(self.subscriptions)
-                self.subscriptions = [
-                    (cid, w, filt)
-                    for (cid, w, filt) in self.subscriptions
-                    if cid != client_id
-                ]
-                after = len(self.subscriptions)
-                print(f"[router] cleaned up subscriptions for {client_id!r}: "
-                      f"{before}→{after}")   
                                
                 if will:
-                    # publish LWT on behalf of client
+                    # publish LWT on behalf of client, under its own ACL
                     await self._handle_publish(
-                        client_id="__system__",
-                        user={"id":"__system__"},
+                        client_id=client_id,
+                        user=user,
                         topic=will["topic"],
                         payload=will["payload"],
+                        qos=will.get("qos", 0),
                         retain=will.get("retain", False)
                     )
+                waiter = self._takeovers.pop(session, None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(None)
 
             await self._close(writer)
 
 
-    async def _handle_subscribe(self,
+    async def _take_over(self, client_id: str):
+        """
+        MQTT 3.1.1 §3.1.4: a CONNECT with a client_id that is still
+        connected disconnects the existing client.  Waits (at most
+        TAKEOVER_TIMEOUT) until that connection's disconnect path -- Last
+        Will included -- has run, so a persistent session is stored and
+        can be resumed.
+        """
+        old = self.session_mgr.sessions.get(client_id)
+        while old is not None:
+            waiter = self._takeovers.get(old)
+            if waiter is None:
+                waiter = self._takeovers[old] = \
+                    asyncio.get_running_loop().create_future()
+            old.disconnect()
+            self._log(client_id, None, "TAKEOVER", True)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter),
+                                       settings.TAKEOVER_TIMEOUT)
+            except asyncio.TimeoutError:
+                log.warning("connection of %r did not close in time; "
+                            "taking over anyway", client_id)
+                self._takeovers.pop(old, None)
+                return
+            current = self.session_mgr.sessions.get(client_id)
+            old = None if current is old else current
+
+    async def _throttle(self, session: Session, wait: float):
+        """
+        Hold a client over its rate limits: nothing is read from it for
+        ``wait`` seconds (its socket backs up once the reader's buffer is
+        full).  It is slowed down, not disconnected.
+        """
+        session.throttled += 1
+        session.throttled_seconds += wait
+        THROTTLE_SECONDS.inc(wait)
+        await asyncio.sleep(wait)
+
+    def _remove_filters(self, session: Session):
+        """Drop all of a session's filters, through its trie handles."""
+        cid = session.client_id
+        for handle, granted in session.subscriptions.values():
+            # entries under cid that a newer session re-inserted stay
+            self.subscriptions.discard(handle, cid, (session, granted))
+        log.debug("removed %d filters of %r, index has %d entries",
+                  len(session.subscriptions), cid, len(self.subscriptions))
+        session.subscriptions.clear()
+
+    async def _discard_offline(self, client_id: str):
+        """End a stored persistent session: subscriptions and queue."""
+        session = self.session_mgr.discard_offline(client_id)
+        if session is None:
+            return
+        self._remove_filters(session)
+        await self.offline.discard(client_id)
+
+    async def disconnect_client(self,
                                 client_id: str,
+                                discard: bool = False) -> bool:
+        """
+        Forcibly end ``client_id``'s connection (admin request).  Its read
+        loop sees EOF and runs the normal disconnect path, Last Will
+        included.  ``discard`` also ends a persistent session, online or
+        offline, with its subscriptions and queued messages.  Returns
+        False if there is no such session.
+        """
+        session = self.session_mgr.sessions.get(client_id)
+        stored = discard and client_id in self.session_mgr.offline_sessions
+        if session is None and not stored:
+            return False
+        if session is not None:
+            if discard:
+                # the disconnect path then drops it instead of storing it
+                session.clean_session = True
+            session.disconnect()
+        if discard:
+            await self._discard_offline(client_id)
+            # anything a replay in progress had not delivered yet
+            await self.offline.discard(client_id)
+        self._log(client_id, None, "FORCED_DISCONNECT", True,
+                  "session discarded" if discard else "")
+        return True
+
+    async def _replay_offline(self, session: Session):
+        """
+        Deliver what was queued while a persistent session was offline, in
+        batches of OFFLINE_REPLAY_BATCH, waiting for the outbound queue to
+        drain in between.  New QoS 1/2 messages keep going to the offline
+        queue until it is empty, so order is preserved.
+        """
+        cid = session.client_id
+        session.replaying = True
+        replayed = 0
+        try:
+            while session.online:
+                batch = await self.offline.pop_batch(
+                    cid, settings.OFFLINE_REPLAY_BATCH)
+                if not batch:
+                    break
+                if not session.online:
+                    self.offline.requeue(cid, batch)
+                    break
+                for topic, payload, qos, retain in batch:
+                    frame = session.codec.publish_frame(topic, payload, qos, retain)
+                    if session.publish(frame):
+                        _DELIVERIES_OUT[qos].inc()
+                replayed += len(batch)
+                await session.wait_for_room()
+        finally:
+            session.replaying = False
+        if replayed:
+            log.info("replayed %d offline messages to %r", replayed, cid)
+
+    async def _expire_sessions(self, max_age: float):
+        while True:
+            await asyncio.sleep(min(max_age, 60))
+            for cid in self.session_mgr.expired_sessions(max_age):
+                await self._discard_offline(cid)
+                self._log(cid, None, "SESSION_EXPIRED", True)
+
+    async def _handle_subscribe(self,
+                                session: Session,
                                 user: dict,
                                 topic: str,
-                                writer: asyncio.StreamWriter):
-        print(f"[router] handling SUBSCRIBE from {client_id!r} for filter={topic!r}")
-        if not self.session_mgr.can_subscribe(user, topic):
-            print(f"[router]  → ACL denied, sending NACK")
-            await self._send_packet(writer, {
-                "type":"SUBACK", "success":False, "topic":topic
-            })
-            return
+                                qos: int = 0) -> bool:
+        """
+        ACL-check and record one filter with its granted ``qos``; the
+        caller sends the SUBACK.
+        """
+        client_id = session.client_id
+        if not await self.session_mgr.can_subscribe(user, topic):
+            log.info("SUBSCRIBE %r by %r denied by ACL", topic, client_id)
+            return False
 
-        # record the wildcard filter
-        self.subscriptions.append((client_id, writer, topic))
-        print(f"[router]  → subscription list now has {len(self.subscriptions)} entries: {self.subscriptions!r}")
+        # record the wildcard filter, keeping its handle on the session;
+        # interned, so thousands of clients on one filter share its string.
+        # The trie entry carries the granted QoS for dispatch.
+        topic = sys.intern(topic)
+        handle = self.subscriptions.insert(topic, client_id, (session, qos))
+        session.subscriptions[topic] = (handle, qos)
+        log.debug("%r subscribed to %r, index has %d entries",
+                  client_id, topic, len(self.subscriptions))
+        return True
 
-        await self._send_packet(writer, {
-            "type":"SUBACK", "success":True, "topic":topic
-        })
-        print(f"[router]  → sent SUBACK(success=True) for {topic!r}")
+    def _handle_unsubscribe(self,
+                            session: Session,
+                            topics: List[str]) -> List[str]:
+        """
+        Drop the given filters of one session; returns those it held.
+        Needs no ACL check: a client can only remove its own entries.
+        """
+        removed = []
+        for topic in topics:
+            entry = session.subscriptions.pop(topic, None)
+            if entry is not None:
+                self.subscriptions.discard(entry[0], session.client_id)
+                removed.append(topic)
+        log.debug("%r unsubscribed from %r, index has %d entries",
+                  session.client_id, removed, len(self.subscriptions))
+        return removed
     
-    async def _dispatch_publish(self, topic, payload, qos=0):
-        for cid, w, filt in self.subscriptions:
-            if self._match_topic(filt, topic):
-                pid = None
-                if qos in (1,2):
-                    pid = self.session_mgr.next_id(cid)
-                pkt = {
-                    "type":   "PUBLISH",
-                    "topic":  topic,
-                    "payload":payload,
-                    "retain": False,
-                    "qos":    qos
-                }
-                if pid is not None:
-                    pkt["id"] = pid
-                await self._send_packet(w, pkt)
-
-
-    def _match_topic(self, filter: str, topic: str) -> bool:
-        print(f"[router] matching topic={topic!r} against filter={filter!r}")
-        f_parts = filter.split('/')
-        t_parts = topic.split('/')
-        for i, fp in enumerate(f_parts):
-            if fp == '#':
-                return True
-            if i >= len(t_parts):
-                return False
-            if fp == '+':
-                continue
-            if fp != t_parts[i]:
-                return False
-        return len(t_parts) == len(f_parts)
+    def _deliver_retained(self, session: Session, topic_filter: str, qos: int):
+        """
+        Queue the retained messages matching a newly accepted filter
+        (the filter itself was ACL-checked, so every match is allowed).
+        """
+        for topic, payload, msg_qos in self.retained.match(topic_filter):
+            q = min(qos, msg_qos)
+            frame = session.codec.publish_frame(topic, payload, q, retain=True)
+            if session.publish(frame):
+                _DELIVERIES_OUT[q].inc()
+
+    async def _handle_publish(self,
+                              client_id: str,
+                              user: dict,
+                              topic: str,
+                              payload: bytes,
+                              qos: int = 0,
+                              retain: bool = False) -> bool:
+        """
+        ACL-check and route a PUBLISH the broker makes on a client's
+        behalf (its Last Will).
+        """
+        if not await self.session_mgr.can_publish(user, topic):
+            self._log(client_id, topic, "PUBLISH", False, "ACL denied (LWT)")
+            return False
+        self._log(client_id, topic, "PUBLISH", True, "LWT")
+        self._publish(topic, payload, qos, retain)
+        return True
 
+    def _publish(self, topic: str, payload: bytes, qos: int, retain: bool):
+        """
+        Route a PUBLISH accepted from one of our clients: update the
+        retained store, deliver it to local subscribers and hand it to
+        the other worker processes.
+        """
+        if retain:
+            self.retained.set(topic, payload, qos)
+        self._dispatch_publish(topic, payload, qos=qos)
+        if self.cluster:
+            self.cluster.forward(topic, payload, qos, retain)
+
+    def _on_cluster_publish(self, topic: str, payload: bytes,
+                            qos: int, retain: bool):
+        # already ACL-checked, acknowledged and persisted by the worker
+        # that took it; only our in-memory copies need updating
+        if retain:
+            self.retained.set(topic, payload, qos, persist=False)
+        self._dispatch_publish(topic, payload, qos=qos)
+
+    def _dispatch_publish(self, topic, payload, qos=0):
+        """
+        Fan a message out to every matching subscriber.  Frames are only
+        queued on each subscriber's Session; its own writer task does the
+        socket I/O, so a slow consumer never stalls the publisher.
+
+        Each subscriber gets the lower of the message's QoS and the one
+        granted for its filter.  The PUBLISH is serialized once per wire
+        codec and QoS; subscribers share the frame and QoS 1/2 recipients
+        only get their packet id spliced in, when their inflight window
+        has room.
+        """
+        started = time.perf_counter()
+        frames = {}
+        delivered = [0, 0, 0]
+        for cid, (sess, granted) in self.subscriptions.match(topic):
+            q = min(qos, granted)
+            if q and not sess.clean_session and (sess.replaying or not sess.online):
+                # persistent session offline (or catching up): queue it
+                self.offline.push(cid, topic, payload, q)
+                continue
+            if not sess.online:
+                continue
+            frame = frames.get((sess.codec, q))
+            if frame is None:
+                frame = frames[sess.codec, q] = sess.codec.publish_frame(
+                    topic, payload, q)
+            if sess.publish(frame):
+                delivered[q] += 1
+            else:
+                # warn once per session; the counter keeps the total
+                log.log(logging.WARNING if sess.dropped == 1 else logging.DEBUG,
+                        "outbound queue full for %r (%s), dropped=%d",
+                        cid, sess.overflow_policy, sess.dropped)
+        for q, n in enumerate(delivered):
+            if n:
+                _DELIVERIES_OUT[q].inc(n)
+        DISPATCH_SECONDS.observe(time.perf_counter() - started)
 
     async def _recv_packet(self,
-                           reader: asyncio.StreamReader) -> Optional[dict]:
-        # newline‐delimited JSON framing
-        line = await reader.readline()
-        if not line:
-            return None
-        return json.loads(line.decode().strip())
+                           reader: asyncio.StreamReader,
+                           codec=JSON_CODEC) -> Optional[dict]:
+        return await codec.read_packet(reader)
 
     async def _send_packet(self,
                            writer: asyncio.StreamWriter,
-                           packet: dict):
-        data = (json.dumps(packet) + "\n").encode()
-        writer.write(data)
+                           packet: dict,
+                           codec=JSON_CODEC):
+        writer.write(codec.encode(packet))
         await writer.drain()
 
     async def _close(self,
@@ -1,21 +1,57 @@
+import argparse
 import asyncio
+import functools
 import logging
+import multiprocessing
+import socket
+from typing import Optional
 
+from .cluster import ClusterLink
+from .control import ControlServer
+from .event_feed import EventFeed, feed_path
+from .framing import JSON_CODEC
+from .log import configure_logging
+from .log_compactor import LogCompactor
+from . import metrics
+from .mqtt_codec import MQTT_CODEC
 from .router import Router
 from .session import SessionManager
 from .tls import create_tls_context      # or create_ssl_context, whichever you named it
+from database.async_db import AsyncEncryptedDB
 from database.encrypted_db import EncryptedSQLiteDB
 import config.settings as settings
 from database.models import init_db
 
+log = logging.getLogger(__name__)
+
+# wire protocols a listener can speak
+CODECS = {
+    JSON_CODEC.name: JSON_CODEC,
+    MQTT_CODEC.name: MQTT_CODEC,
+}
+
 
 class BrokerServer:
     """An asyncio-based MQTT-like broker with TLS."""
     def __init__(self,
                  host: str = settings.HOST,
-                 port: int = settings.PORT):
+                 port: int = settings.PORT,
+                 listeners=None,
+                 cluster: Optional[ClusterLink] = None,
+                 metrics_port: Optional[int] = settings.METRICS_PORT):
         self.host = host
         self.port = port
+        # plain-HTTP /metrics on the broker's own loop (None: disabled)
+        self.metrics_port = metrics_port
+        # set when running as one of several worker processes
+        self.cluster = cluster
+        # [(port, protocol)]: JSON on `port` plus the configured extras
+        if listeners is None:
+            listeners = [(port, "json")] + list(settings.EXTRA_LISTENERS)
+        for _, proto in listeners:
+            if proto not in CODECS:
+                raise ValueError(f"unknown listener protocol {proto!r}")
+        self.listeners = listeners
 
         # 1) Initialize encrypted SQLite + Fernet wrapper
         self.db = EncryptedSQLiteDB(
@@ -23,12 +59,35 @@ class BrokerServer:
             key_path=settings.FERNET_KEY_PATH
         )
         init_db(self.db)
+        # …and its awaitable facade: once the loop runs, every query goes
+        # through the dedicated DB thread
+        self.adb = AsyncEncryptedDB(self.db)
 
         # 2) Session manager (auth + ACL)
-        self.sessions = SessionManager(self.db)
+        self.sessions = SessionManager(self.adb)
+
+        # local event feed for the admin app (one socket per worker)
+        self.event_feed = None
+        if settings.EVENT_FEED_SOCKET is not None:
+            self.event_feed = EventFeed(feed_path(
+                settings.EVENT_FEED_SOCKET,
+                cluster.index if cluster is not None else None))
 
         # 3) Router (pub/sub, retained messages, LWT)
-        self.router = Router(session_mgr=self.sessions, db=self.db)
+        self.router = Router(session_mgr=self.sessions, db=self.adb,
+                             cluster=cluster, event_feed=self.event_feed)
+
+        # control plane (session listing, forced disconnects)
+        self.control = None
+        if settings.CONTROL_PORT is not None:
+            self.control = ControlServer(
+                self.router,
+                port=settings.CONTROL_PORT + (cluster.index if cluster else 0))
+
+        # log retention; with several workers only the first one runs it
+        self.log_compactor = None
+        if cluster is None or cluster.index == 0:
+            self.log_compactor = LogCompactor(self.adb)
 
         # 4) SSL/TLS context
         self.ssl_context = create_tls_context(
@@ -40,32 +99,158 @@ class BrokerServer:
 
     async def handle_client(self,
                             reader: asyncio.StreamReader,
-                            writer: asyncio.StreamWriter):
+                            writer: asyncio.StreamWriter,
+                            codec=JSON_CODEC):
         peer = writer.get_extra_info('peername')
-        logging.info(f"🔌 New connection from {peer}")
+        log.info("🔌 New connection from %s", peer)
         # hand off to our router’s full MQTT‐style CONNECT→...→DISCONNECT loop
-        await self.router.handle_client(reader, writer)
+        await self.router.handle_client(reader, writer, codec)
+
+    def _register_gauges(self):
+        sessions = self.sessions.sessions
+        metrics.SESSIONS.set_function(lambda: len(sessions))
+        metrics.SUBSCRIPTIONS.set_function(lambda: len(self.router.subscriptions))
+        metrics.RETAINED.set_function(lambda: len(self.router.retained))
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: {cid: len(s.outbound) for cid, s in sessions.items()})
+        metrics.QUEUE_DROPPED.set_function(
+            lambda: sum(s.dropped for s in sessions.values()))
+        metrics.INFLIGHT.set_function(
+            lambda: sum(len(s.inflight) for s in sessions.values()))
+        metrics.INFLIGHT_HELD.set_function(
+            lambda: sum(len(s.held) for s in sessions.values()))
+        metrics.CLIENT_THROTTLED.set_function(
+            lambda: {cid: s.throttled for cid, s in sessions.items() if s.throttled})
+        admission = self.router.admission
+        metrics.HANDSHAKES.set_function(lambda: admission.active)
+        metrics.HANDSHAKES_WAITING.set_function(lambda: admission.waiting)
+        verifier = self.sessions.verifier
+        metrics.AUTH_WAITING.set_function(lambda: verifier.waiting)
+        metrics.AUTH_ACTIVE.set_function(lambda: verifier.active)
+        metrics.AUTH_MAX_WAITING.set_function(lambda: verifier.max_waiting)
+        audit = self.router.audit
+        metrics.AUDIT_PENDING.set_function(lambda: audit.pending)
+        metrics.AUDIT_DROPPED.set_function(lambda: audit.dropped)
+        offline = self.router.offline
+        metrics.OFFLINE_SESSIONS.set_function(
+            lambda: len(self.sessions.offline_sessions))
+        metrics.OFFLINE_MESSAGES.set_function(lambda: len(offline))
+        metrics.OFFLINE_DROPPED.set_function(lambda: offline.dropped)
+        feed = self.event_feed
+        if feed is not None:
+            metrics.EVENT_FEED_LISTENERS.set_function(lambda: len(feed))
+            metrics.EVENT_FEED_DROPPED.set_function(lambda: feed.dropped)
 
     async def start(self):
-        server = await asyncio.start_server(
-            self.handle_client,
-            self.host,
-            self.port,
-            ssl=self.ssl_context
-        )
-        addr = server.sockets[0].getsockname()
-        logging.info(f"🚀 Broker listening on {addr}")
-        async with server:
-            await server.serve_forever()
+        if self.event_feed is not None:
+            await self.event_feed.start()
+        await self.sessions.start()
+        await self.router.start()
+        if self.log_compactor:
+            self.log_compactor.start()
+        servers = []
+        if self.metrics_port is not None:
+            self._register_gauges()
+            servers.append(await metrics.start_metrics_server(
+                settings.METRICS_HOST, self.metrics_port))
+        if self.control is not None:
+            await self.control.start()
+        for port, proto in self.listeners:
+            server = await asyncio.start_server(
+                functools.partial(self.handle_client, codec=CODECS[proto]),
+                self.host,
+                port,
+                ssl=self.ssl_context,
+                # workers share the port; the kernel spreads connections
+                reuse_port=self.cluster is not None
+            )
+            addr = server.sockets[0].getsockname()
+            log.info("🚀 Broker listening on %s (%s)", addr, proto)
+            servers.append(server)
+        try:
+            await asyncio.gather(*(s.serve_forever() for s in servers))
+        finally:
+            for s in servers:
+                s.close()
+            if self.control is not None:
+                await self.control.close()
+            # guaranteed flush of buffered audit records
+            await self.sessions.close()
+            await self.router.close()
+            if self.log_compactor:
+                await self.log_compactor.close()
+            if self.event_feed is not None:
+                await self.event_feed.close()
+            self.adb.close()
 
-def main():
-    logging.basicConfig(level=logging.INFO,
-                        format="%(asctime)s %(levelname)s %(message)s")
-    broker = BrokerServer()
+def run_worker(index: int, workers: int):
+    """Entry point of one worker process in multi-process mode."""
+    listener = configure_logging(tag=f"w{index}")
+    # one metrics port per worker: a scrape must see a single process
+    metrics_port = settings.METRICS_PORT
+    if metrics_port is not None:
+        metrics_port += index
+    broker = BrokerServer(cluster=ClusterLink(index, workers),
+                          metrics_port=metrics_port)
     try:
         asyncio.run(broker.start())
     except KeyboardInterrupt:
-        logging.info("🛑 Broker shutting down")
+        pass
+    finally:
+        if listener:
+            listener.stop()
+
+def run_workers(workers: int):
+    """
+    Start ``workers`` broker processes on the same ports (SO_REUSEPORT)
+    and wait for them.  Each one owns the clients the kernel hands it and
+    forwards PUBLISHes to the others (see broker.cluster).
+    """
+    # create the schema once, before the workers race to do it
+    db = EncryptedSQLiteDB(settings.DB_PATH, settings.FERNET_KEY_PATH)
+    init_db(db)
+    db.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=run_worker, args=(i, workers),
+                    name=f"broker-worker-{i}")
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        # Ctrl+C reaches the whole process group; let workers flush
+        for p in procs:
+            p.join(timeout=5)
+
+def main():
+    parser = argparse.ArgumentParser(description="Secure MQTT broker")
+    parser.add_argument("--workers", type=int, default=settings.WORKERS,
+                        help="number of broker processes sharing the ports")
+    args = parser.parse_args()
+
+    listener = configure_logging()
+    try:
+        if args.workers > 1:
+            if not hasattr(socket, "SO_REUSEPORT"):
+                log.warning("SO_REUSEPORT is not available on this platform; "
+                            "running a single broker process")
+            else:
+                log.info("🚀 Starting %d broker workers", args.workers)
+                run_workers(args.workers)
+                return
+        broker = BrokerServer()
+        try:
+            asyncio.run(broker.start())
+        except KeyboardInterrupt:
+            log.info("🛑 Broker shutting down")
+    finally:
+        if listener:
+            listener.stop()
 
 if __name__ == '__main__':
     main()
@@ -1,81 +1,621 @@
 # secure_mqtt_broker/broker/session.py
 
-from typing import Dict, Optional
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from types import MappingProxyType
+from typing import Deque, Dict, Hashable, Optional, Tuple, Union
 from asyncio import StreamWriter
 
+from auth.acl import CompiledACL
 from auth.auth import AuthManager
+from auth.verifier import PasswordVerifier
+from broker.framing import JSON_CODEC
+from broker.metrics import AUTH_SECONDS, RETRANSMITS
+from broker.timer_wheel import TimerWheel
+import config.settings as settings
+
+log = logging.getLogger(__name__)
+
+_AUTH_OK = AUTH_SECONDS.labels("ok")
+_AUTH_FAILED = AUTH_SECONDS.labels("failed")
+
+# outbound queue overflow policies
+DROP_OLDEST = "drop-oldest"
+DROP_NEW    = "drop-new"
+DISCONNECT  = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEW, DISCONNECT)
+
+# read-only stand-ins for a session's queues and packet-id maps while
+# they are empty: most connected clients are idle, and an empty deque
+# costs ~600 bytes
+_NO_ENTRIES = MappingProxyType({})
+_NO_FRAMES = ()
+
+class _Inflight:
+    """One unacknowledged outbound QoS 1/2 delivery."""
+    __slots__ = ("frame", "released")
+
+    def __init__(self, frame):
+        # the shared PublishFrame; re-encoded with DUP on retransmission
+        self.frame = frame
+        # QoS 2: PUBREC received and PUBREL sent, waiting for PUBCOMP
+        self.released = False
 
 class Session:
+    """
+    One client's state.  Slotted, and the outbound/held queues and the
+    inflight/pending_pubrec maps are only allocated while they hold
+    something, so an idle connection costs a few hundred bytes plus its
+    writer task (see tests/stress/bench_sessions.py).
+    """
+    __slots__ = ("client_id", "writer", "clean_session", "connected_at",
+                 "disconnected_at", "replaying", "will", "codec",
+                 "subscriptions", "next_msg_id", "pending_pubrec",
+                 "inflight", "held", "max_inflight", "timers",
+                 "retry_interval", "retransmits", "outbound", "max_queue",
+                 "overflow_policy", "dropped", "throttled",
+                 "throttled_seconds", "_wakeup", "_drained", "_closing",
+                 "_writer_task")
+
     def __init__(self,
                  client_id: str,
                  writer: StreamWriter,
-                 will: Optional[dict] = None):
+                 will: Optional[dict] = None,
+                 codec=JSON_CODEC,
+                 max_queue: int = settings.OUTBOUND_QUEUE_SIZE,
+                 overflow_policy: str = settings.OUTBOUND_OVERFLOW_POLICY,
+                 timers: Optional[TimerWheel] = None,
+                 max_inflight: int = settings.MAX_INFLIGHT,
+                 retry_interval: float = settings.INFLIGHT_RETRY_INTERVAL):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow_policy!r}")
         self.client_id = client_id
-        self.writer = writer
-        # will format: {"topic": str, "payload": str, "retain": bool}
+        # None while a persistent session is offline
+        self.writer: Optional[StreamWriter] = writer
+        # False: subscriptions and QoS 1/2 messages outlive the connection
+        self.clean_session = True
+        # wall-clock time of the current connection (for introspection)
+        self.connected_at = time.time()
+        # monotonic time of the last disconnect (persistent sessions)
+        self.disconnected_at: Optional[float] = None
+        # True while the offline queue is replayed after a reconnect
+        self.replaying = False
+        # will format: {"topic": str, "payload": bytes, "retain": bool}
         self.will = will
+        # wire format of this connection (framing.JsonCodec / MqttCodec)
+        self.codec = codec
+        # topic filter -> (TopicTrie handle, granted QoS), so UNSUBSCRIBE
+        # and disconnect cleanup cost O(this client's filters)
+        self.subscriptions: Dict[str, Tuple[object, int]] = {}
         self.next_msg_id = 1    # for outbound QoS1 to subscribers
-        self.pending_pubrec = {}  
-        # maps packet_id -> (topic, payload, retain)
+        # inbound QoS 2 awaiting PUBREL: packet_id -> (topic, payload, retain)
+        self.pending_pubrec: Dict[int, tuple] = _NO_ENTRIES
+
+        # outbound QoS 1/2 flow control: packet_id -> _Inflight, in send
+        # order, at most max_inflight; further frames wait in `held`
+        self.inflight: Dict[int, _Inflight] = _NO_ENTRIES
+        self.held: Deque = _NO_FRAMES
+        self.max_inflight = max_inflight
+        # retransmission timers, keyed (session, packet_id)
+        self.timers = timers
+        self.retry_interval = retry_interval
+        self.retransmits = 0
+
+        # bounded outbound queue of encoded frames, drained by _writer_loop;
+        # a frame is bytes or a tuple of buffers sharing a large payload
+        self.outbound: Deque[Union[bytes, tuple]] = _NO_FRAMES
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+        # PUBLISHes this client was held back for by rate limits, and the
+        # total time its reader was paused (broker.admission)
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        # resolved to wake the parked writer task
+        self._wakeup: Optional[asyncio.Future] = None
+        # set whenever the writer task has emptied the queue; created by
+        # the first wait_for_room()
+        self._drained: Optional[asyncio.Event] = None
+        self._closing = False
+        self._writer_task: Optional[asyncio.Task] = None
+
+    @property
+    def online(self) -> bool:
+        return self.writer is not None and not self._closing
+
+    def attach(self,
+               writer: StreamWriter,
+               will: Optional[dict] = None,
+               codec=JSON_CODEC):
+        """Resume an offline persistent session on a new connection."""
+        self.writer = writer
+        self.will = will
+        self.connected_at = time.time()
+        self.disconnected_at = None
+        self.outbound = _NO_FRAMES
+        self._closing = False
+        if codec is not self.codec:
+            # frames were encoded for the old wire format
+            self.codec = codec
+            self.inflight = _NO_ENTRIES
+            self.held = _NO_FRAMES
+        self.start()
+        # MQTT 3.1.1 §4.4: resend unacknowledged PUBLISH/PUBREL on resume
+        for pid in list(self.inflight):
+            self.retransmit(pid)
+        self._fill_window()
+
+    def detach(self):
+        """Drop the (stopped) connection but keep the session state."""
+        self.writer = None
+        self.will = None
+        self.disconnected_at = time.monotonic()
+        self.cancel_timers()
+
+    def snapshot(self) -> dict:
+        """
+        Point-in-time counters for the control plane: only sizes and scalar
+        fields, so it costs the same however busy the session is.
+        """
+        peer = self.writer.get_extra_info("peername") if self.writer else None
+        return {
+            "client_id":     self.client_id,
+            "online":        self.online,
+            "clean_session": self.clean_session,
+            "protocol":      self.codec.name,
+            "peer":          "%s:%s" % peer[:2] if peer else None,
+            "connected_at":  self.connected_at,
+            "offline_for":   (time.monotonic() - self.disconnected_at
+                              if self.disconnected_at is not None else None),
+            "will_topic":    self.will["topic"] if self.will else None,
+            "subscriptions": len(self.subscriptions),
+            "inflight":      len(self.inflight),
+            "held":          len(self.held),
+            "queued":        len(self.outbound),
+            "dropped":       self.dropped,
+            "retransmits":   self.retransmits,
+            "throttled":     self.throttled,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
+
+    def disconnect(self):
+        """Drop the connection now (admin request); queued frames are lost."""
+        if self.online:
+            self._abort()
+
+    def start(self):
+        """Spawn the task that drains the outbound queue to the socket."""
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    def enqueue(self, frame: Union[bytes, tuple]) -> bool:
+        """
+        Queue an encoded frame (``bytes`` or a tuple of buffers) for
+        delivery without waiting on the socket.  Returns False if the
+        frame was not queued.
+        """
+        if self._closing:
+            return False
+        outbound = self.outbound
+        if not outbound:
+            outbound = self.outbound = deque()
+        elif len(outbound) >= self.max_queue:
+            self.dropped += 1
+            if self.overflow_policy == DROP_NEW:
+                return False
+            if self.overflow_policy == DISCONNECT:
+                self._abort()
+                return False
+            # an evicted QoS 1/2 frame is still inflight and gets resent
+            outbound.popleft()
+        outbound.append(frame)
+        self._wake()
+        return True
+
+    def _wake(self):
+        waiter = self._wakeup
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _notify_drained(self):
+        if self._drained is not None:
+            self._drained.set()
+
+    def _abort(self):
+        # the peer is not keeping up; its read loop sees EOF and runs the
+        # normal disconnect path
+        self._closing = True
+        self.outbound = _NO_FRAMES
+        self.writer.transport.abort()
+
+    # ─── outbound QoS 1/2 ──────────────────────────────────────────────
+    def publish(self, frame) -> bool:
+        """
+        Queue a PUBLISH frame (framing.PublishFrame / MqttPublishFrame).
+        QoS 0 goes straight to the outbound queue.  QoS 1/2 gets a packet
+        id and an inflight slot; with the window full it waits in `held`
+        (bounded by max_queue, same overflow policy) until an ack frees
+        one.  Returns False if the frame was not queued.
+        """
+        if not frame.qos:
+            return self.enqueue(frame.buffers())
+        if self._closing:
+            return False
+        if len(self.inflight) < self.max_inflight and not self.held:
+            return self._send_inflight(frame)
+        if len(self.held) >= self.max_queue:
+            self.dropped += 1
+            if self.overflow_policy == DROP_NEW:
+                return False
+            if self.overflow_policy == DISCONNECT:
+                self._abort()
+                return False
+            self.held.popleft()
+        elif not self.held:
+            self.held = deque()
+        self.held.append(frame)
+        return True
+
+    def next_packet_id(self) -> int:
+        """Next 16-bit packet id not currently inflight."""
+        pid = self.next_msg_id
+        while pid in self.inflight:
+            pid = pid % 0xFFFF + 1
+        self.next_msg_id = pid % 0xFFFF + 1
+        return pid
+
+    def _send_inflight(self, frame) -> bool:
+        pid = self.next_packet_id()
+        if not self.enqueue(frame.buffers(pid)):
+            return False
+        if not self.inflight:
+            self.inflight = {}
+        self.inflight[pid] = _Inflight(frame)
+        self._arm(pid)
+        return True
+
+    def _arm(self, pid: int):
+        if self.timers is not None:
+            self.timers.schedule((self, pid), self.retry_interval)
+
+    def _release(self, pid: int):
+        del self.inflight[pid]
+        if not self.inflight:
+            self.inflight = _NO_ENTRIES
+        if self.timers is not None:
+            self.timers.cancel((self, pid))
+        self._fill_window()
+        # a slot is free: wake wait_for_room()
+        self._notify_drained()
+
+    def _fill_window(self):
+        while self.held and len(self.inflight) < self.max_inflight and self.online:
+            if not self._send_inflight(self.held.popleft()):
+                break
+        if not self.held:
+            self.held = _NO_FRAMES
+
+    def store_pubrec(self, pid: int, message: tuple):
+        """Keep an inbound QoS 2 PUBLISH (topic, payload, retain) until PUBREL."""
+        if not self.pending_pubrec:
+            self.pending_pubrec = {}
+        self.pending_pubrec[pid] = message
+
+    def release_pubrec(self, pid: int) -> Optional[tuple]:
+        """The message stored for ``pid``, if any, now that PUBREL came."""
+        message = self.pending_pubrec.get(pid)
+        if message is not None:
+            del self.pending_pubrec[pid]
+            if not self.pending_pubrec:
+                self.pending_pubrec = _NO_ENTRIES
+        return message
+
+    def puback(self, pid: int) -> bool:
+        """QoS 1 delivery acknowledged."""
+        entry = self.inflight.get(pid)
+        if entry is None or entry.frame.qos != 1:
+            return False
+        self._release(pid)
+        return True
+
+    def pubrec(self, pid: int) -> bool:
+        """
+        QoS 2 step 1 acknowledged: answer with PUBREL and wait for
+        PUBCOMP.  PUBREL is sent for unknown ids too, so a subscriber
+        retrying after a broker restart can finish its handshake.
+        """
+        entry = self.inflight.get(pid)
+        known = entry is not None and entry.frame.qos == 2
+        if known:
+            entry.released = True
+            self._arm(pid)
+        self.enqueue(self.codec.encode({"type": "PUBREL", "id": pid}))
+        return known
+
+    def pubcomp(self, pid: int) -> bool:
+        """QoS 2 delivery complete."""
+        entry = self.inflight.get(pid)
+        if entry is None or not entry.released:
+            return False
+        self._release(pid)
+        return True
+
+    def retransmit(self, pid: int):
+        """Resend an unacknowledged PUBLISH (with DUP) or PUBREL."""
+        entry = self.inflight.get(pid)
+        if entry is None or not self.online:
+            return
+        if entry.released:
+            frame = self.codec.encode({"type": "PUBREL", "id": pid})
+        else:
+            frame = entry.frame.buffers(pid, dup=True)
+        if self.enqueue(frame):
+            self.retransmits += 1
+            RETRANSMITS.inc()
+            self._arm(pid)
+
+    def cancel_timers(self):
+        if self.timers is not None:
+            for pid in self.inflight:
+                self.timers.cancel((self, pid))
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if not (self.outbound or self._closing):
+                    # park until enqueue() or stop()
+                    self._wakeup = loop.create_future()
+                    await self._wakeup
+                    self._wakeup = None
+                while self.outbound:
+                    # hand everything queued so far to the transport in one
+                    # scatter-gather write, then wait once for the socket
+                    # buffer to drain
+                    self.writer.writelines(self._gather())
+                    await self.writer.drain()
+                self.outbound = _NO_FRAMES
+                self._notify_drained()
+                if self._closing:
+                    return
+        except (ConnectionError, RuntimeError):
+            # peer went away; the reader side handles the disconnect
+            self.outbound = _NO_FRAMES
+        finally:
+            self._notify_drained()
+
+    def _gather(self) -> list:
+        # shared payloads go to the transport by reference; the TLS
+        # transport keeps each buffer as is until it is encrypted
+        chunks = []
+        outbound = self.outbound
+        while outbound:
+            frame = outbound.popleft()
+            if type(frame) is tuple:
+                chunks.extend(frame)
+            else:
+                chunks.append(frame)
+        return chunks
+
+    async def wait_for_room(self):
+        """
+        Wait until the outbound and held queues are at most half full
+        (or the connection is going away), so bulk producers never
+        overflow them.
+        """
+        while (self.online
+               and len(self.outbound) + len(self.held) > self.max_queue // 2):
+            if self._drained is None:
+                self._drained = asyncio.Event()
+            self._drained.clear()
+            await self._drained.wait()
+
+    async def stop(self, timeout: float = settings.OUTBOUND_FLUSH_TIMEOUT):
+        """Flush what is still queued (bounded by ``timeout``) and stop."""
+        self._closing = True
+        self._wake()
+        task, self._writer_task = self._writer_task, None
+        if task is None:
+            return
+        try:
+            await asyncio.wait_for(task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
 
 class SessionManager:
     def __init__(self, db):
         """
-        db: instance of EncryptedSQLiteDB
+        db: instance of AsyncEncryptedDB; AuthManager's blocking queries
+        run on its DB thread, never on the event loop
         """
+        self.db = db
         # delegate auth & ACL checks to AuthManager
-        self.auth = AuthManager(db)
+        self.auth = AuthManager(db.db)
+        # bcrypt in a bounded thread pool, with a short-TTL success cache
+        self.verifier = PasswordVerifier()
         # map client_id -> Session
         self.sessions: Dict[str, Session] = {}
+        # disconnected persistent sessions (clean_session=false)
+        self.offline_sessions: Dict[str, Session] = {}
+        # map user_id -> compiled ACL, valid for acl_version
+        self.acls: Dict[int, CompiledACL] = {}
+        self.acl_version = 0
+        self._acl_watcher: Optional[asyncio.Task] = None
+        # retransmission timers of every session's inflight window
+        self.timers = TimerWheel(settings.TIMER_WHEEL_TICK,
+                                 settings.TIMER_WHEEL_SLOTS,
+                                 self._retransmit)
+
+    async def start(self,
+                    poll_interval: float = settings.ACL_VERSION_POLL_INTERVAL):
+        """Start watching the acls table for changes."""
+        self.acl_version = await self.db.run(self.auth.acl_version)
+        if self._acl_watcher is None:
+            self._acl_watcher = asyncio.create_task(
+                self._watch_acl_version(poll_interval))
+        self.timers.start()
+
+    async def close(self):
+        self.verifier.close()
+        await self.timers.close()
+        task, self._acl_watcher = self._acl_watcher, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    @staticmethod
+    def _retransmit(key: Hashable):
+        session, pid = key
+        session.retransmit(pid)
+
+    async def _watch_acl_version(self, poll_interval: float):
+        # the admin CLI / web UI run in other processes; triggers bump
+        # acl_version on any change, so one cheap query per interval is
+        # enough to notice
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                version = await self.db.run(self.auth.acl_version)
+            except sqlite3.Error as e:
+                log.warning("ACL version check failed: %s", e)
+                continue
+            if version != self.acl_version:
+                self.acl_version = version
+                self.invalidate_acls()
+
+    def invalidate_acls(self, user_id: Optional[int] = None):
+        """
+        Drop compiled ACLs (one user's, or all) so the next check reloads
+        them. Also usable as a direct notification hook.
+        """
+        if user_id is None:
+            self.acls.clear()
+        else:
+            self.acls.pop(user_id, None)
+
+    async def _acl(self, user: dict) -> CompiledACL:
+        uid = user["id"]
+        acl = self.acls.get(uid)
+        if acl is None:
+            version = self.acl_version
+            acl = await self.db.run(self.auth.load_acl, uid)
+            # don't cache rows read before an invalidation we just saw
+            if version == self.acl_version:
+                self.acls[uid] = acl
+        return acl
 
     async def authenticate(self,
                            username: str,
                            password: str) -> Optional[dict]:
         """
         Verify credentials; returns user record dict if OK, else None.
+        The lookup runs on the DB thread, bcrypt in the verifier's pool.
+        The user's ACL is compiled here so later checks hit the cache.
         """
-        return self.auth.verify_user(username, password)
+        started = time.perf_counter()
+        user = await self._authenticate(username, password)
+        (_AUTH_OK if user else _AUTH_FAILED).observe(time.perf_counter() - started)
+        return user
+
+    async def _authenticate(self,
+                            username: str,
+                            password: str) -> Optional[dict]:
+        record = await self.db.run(self.auth.lookup_user, username)
+        if not record:
+            return None
+        if not await self.verifier.verify(username, password,
+                                          record["password_hash"]):
+            return None
+        user = {
+            "id":       record["id"],
+            "username": username,
+            "role_id":  record["role_id"]
+        }
+        await self._acl(user)
+        return user
 
     def create_session(self,
                        client_id: str,
                        writer: StreamWriter,
-                       will: Optional[dict] = None):
+                       will: Optional[dict] = None,
+                       codec=JSON_CODEC,
+                       clean_session: bool = True):
         """
-        Register a new client session, storing its StreamWriter and LWT.
+        Register a client session, storing its StreamWriter, LWT and wire
+        codec, and start its outbound writer task.  With
+        ``clean_session=False`` an offline persistent session of the same
+        client_id is resumed instead of creating a new one.
+
+        Returns (session, session_present).
         """
-        sess = Session(client_id, writer, will)
+        sess = None if clean_session else self.offline_sessions.pop(client_id, None)
+        present = sess is not None
+        if sess is None:
+            sess = Session(client_id, writer, will, codec, timers=self.timers)
+            sess.clean_session = clean_session
+            sess.start()
+        else:
+            sess.attach(writer, will, codec)
         self.sessions[client_id] = sess
-        return sess
+        return sess, present
+
+    def discard_offline(self, client_id: str) -> Optional[Session]:
+        """Forget an offline persistent session; returns it, if any."""
+        return self.offline_sessions.pop(client_id, None)
+
+    def expired_sessions(self, max_age: float) -> list:
+        """client_ids of offline sessions disconnected over ``max_age`` s ago."""
+        cutoff = time.monotonic() - max_age
+        return [cid for cid, s in self.offline_sessions.items()
+                if s.disconnected_at is not None and s.disconnected_at < cutoff]
 
     def next_id(self, client_id):
-        sess = self.sessions[client_id]
-        pid = sess.next_msg_id
-        sess.next_msg_id = pid+1 if pid<0xFFFF else 1
-        return pid
+        return self.sessions[client_id].next_packet_id()
 
-    def can_subscribe(self,
-                      user: dict,
-                      topic: str) -> bool:
+    async def can_subscribe(self,
+                            user: dict,
+                            topic: str) -> bool:
         """
         ACL check before allowing a SUBSCRIBE.
         """
-        return self.auth.can_subscribe(user["id"], topic)
+        return (await self._acl(user)).can_subscribe(topic)
 
-    def can_publish(self,
-                    user: dict,
-                    topic: str) -> bool:
+    async def can_publish(self,
+                          user: dict,
+                          topic: str) -> bool:
         """
         ACL check before allowing a PUBLISH.
         """
-        return self.auth.can_publish(user["id"], topic)
+        return (await self._acl(user)).can_publish(topic)
 
     async def terminate_session(self,
-                                client_id: str) -> Optional[dict]:
+                                client_id: str,
+                                session: Optional[Session] = None) -> Optional[dict]:
         """
-        Called on DISCONNECT. Removes session and returns the Last Will
-        (if any) so the router can publish it.
+        Called on DISCONNECT. Removes session, flushes its outbound queue
+        and returns the Last Will (if any) so the router can publish it.
+        A persistent session is kept, offline, for the next CONNECT.
+
+        ``session`` is the connection's own Session: if a newer connection
+        has taken over ``client_id`` meanwhile, that one stays registered.
         """
-        session = self.sessions.pop(client_id, None)
-        if session and session.will:
-            return session.will
-        return None
+        current = self.sessions.get(client_id)
+        if session is None:
+            session = current
+        if session is None:
+            return None
+        if current is session:
+            del self.sessions[client_id]
+        await session.stop()
+        session.cancel_timers()
+        will = session.will
+        if not session.clean_session and current is session:
+            session.detach()
+            self.offline_sessions[client_id] = session
+        return will
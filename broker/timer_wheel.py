@@ -0,0 +1,95 @@
+# secure_mqtt_broker/broker/timer_wheel.py
+
+import asyncio
+import logging
+import math
+from typing import Callable, Dict, Hashable, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel: ``slots`` buckets of ``tick`` seconds each.
+
+    schedule() and cancel() are O(1) dict operations, and one task
+    advances the wheel, so thousands of retransmission timers cost no
+    more than a handful.  Delays longer than one revolution wait out the
+    extra rounds in their bucket.  Expired keys are passed to
+    ``on_expire``; the resolution is one tick.
+    """
+
+    def __init__(self,
+                 tick: float,
+                 slots: int,
+                 on_expire: Callable[[Hashable], None]):
+        self.tick = tick
+        self.on_expire = on_expire
+        # key -> remaining rounds, per bucket
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        # key -> index of the bucket holding it
+        self._where: Dict[Hashable, int] = {}
+        self._cursor = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key) -> bool:
+        return key in self._where
+
+    def schedule(self, key: Hashable, delay: float):
+        """(Re)arm ``key`` to expire after ``delay`` seconds."""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        n = len(self._slots)
+        slot = (self._cursor + ticks) % n
+        self._slots[slot][key] = (ticks - 1) // n
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self):
+        """Move one tick forward and fire whatever expires there."""
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        bucket = self._slots[self._cursor]
+        expired = []
+        for key, rounds in bucket.items():
+            if rounds:
+                bucket[key] = rounds - 1
+            else:
+                expired.append(key)
+        for key in expired:
+            del bucket[key]
+            del self._where[key]
+        for key in expired:
+            try:
+                self.on_expire(key)
+            except Exception:
+                log.exception("timer callback failed for %r", key)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_at = loop.time() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            # catch up on ticks missed while the loop was busy
+            while loop.time() >= next_at:
+                self.advance()
+                next_at += self.tick
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,182 @@
+# secure_mqtt_broker/broker/topic_trie.py
+
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Tuple
+
+# shared read-only stand-in for a node's empty children / subscribers:
+# with per-device filters most nodes are leaves or pass-throughs
+_EMPTY = MappingProxyType({})
+# discard() without a value check
+_ANY = object()
+
+
+def match_topic(filter: str, topic: str) -> bool:
+    """
+    MQTT‑style match of a single filter against a topic:
+    '+' matches one level, '#' matches all remaining levels.
+    """
+    f_parts = filter.split('/')
+    t_parts = topic.split('/')
+    for i, fp in enumerate(f_parts):
+        if fp == '#':
+            return True
+        if i >= len(t_parts):
+            return False
+        if fp == '+':
+            continue
+        if fp != t_parts[i]:
+            return False
+    return len(t_parts) == len(f_parts)
+
+
+class _Node:
+    __slots__ = ("children", "plus", "hash", "subscribers", "parent", "level")
+
+    def __init__(self, parent: Optional["_Node"] = None, level: str = ""):
+        # literal level -> child node (a real dict once it has one)
+        self.children: Dict[str, "_Node"] = _EMPTY
+        # dedicated children for the '+' and '#' wildcard levels
+        self.plus: Optional["_Node"] = None
+        self.hash: Optional["_Node"] = None
+        # subscribers whose filter ends at this node: key -> value
+        self.subscribers: Dict[Any, Any] = _EMPTY
+        # back-link for pruning from a handle; None once detached
+        self.parent = parent
+        self.level = level
+
+    def is_empty(self) -> bool:
+        return not (self.subscribers or self.children
+                    or self.plus is not None or self.hash is not None)
+
+
+class TopicTrie:
+    """
+    Level-based index of MQTT topic filters.
+
+    Each filter is stored along the path of its '/'-separated levels, with
+    '+' and '#' kept as dedicated child nodes, so matching a topic costs
+    O(topic depth × wildcard branching) instead of O(number of filters).
+
+    Every filter node holds a ``{key: value}`` dict; the router uses
+    ``client_id`` as key, so one client holds at most one entry per filter.
+
+    insert() returns the filter's node as an opaque handle; discard()
+    with it removes the entry without walking the filter again, so a
+    client that keeps its handles unsubscribes in O(its own filters).
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @staticmethod
+    def _levels(topic_filter: str) -> List[str]:
+        levels = topic_filter.split('/')
+        # '#' swallows everything after it, exactly like match_topic()
+        if '#' in levels:
+            levels = levels[:levels.index('#') + 1]
+        return levels
+
+    def insert(self, topic_filter: str, key: Any, value: Any) -> _Node:
+        """
+        Add (or replace) ``key``'s entry on ``topic_filter``; returns the
+        handle for discard().
+        """
+        node = self.root
+        for level in self._levels(topic_filter):
+            if level == '+':
+                if node.plus is None:
+                    node.plus = _Node(node, level)
+                node = node.plus
+            elif level == '#':
+                if node.hash is None:
+                    node.hash = _Node(node, level)
+                node = node.hash
+            else:
+                child = node.children.get(level)
+                if child is None:
+                    if not node.children:
+                        node.children = {}
+                    child = node.children[level] = _Node(node, level)
+                node = child
+        if key not in node.subscribers:
+            if not node.subscribers:
+                node.subscribers = {}
+            self._count += 1
+        node.subscribers[key] = value
+        return node
+
+    def discard(self, handle: _Node, key: Any, value: Any = _ANY) -> bool:
+        """
+        Drop ``key``'s entry from the filter node returned by insert() and
+        prune empty nodes.  With ``value``, only if the entry still equals
+        it (not what a later insert() under the same key put there).
+        Returns False if there was no such entry.
+        """
+        if key not in handle.subscribers:
+            return False
+        if value is not _ANY and handle.subscribers[key] != value:
+            return False
+        del handle.subscribers[key]
+        if not handle.subscribers:
+            handle.subscribers = _EMPTY
+        self._count -= 1
+
+        # walk back up, detaching nodes that no longer carry anything
+        node = handle
+        while node.parent is not None and node.is_empty():
+            parent = node.parent
+            if node.level == '+':
+                parent.plus = None
+            elif node.level == '#':
+                parent.hash = None
+            else:
+                del parent.children[node.level]
+                if not parent.children:
+                    parent.children = _EMPTY
+            node.parent = None
+            node = parent
+        return True
+
+    def remove(self, topic_filter: str, key: Any) -> bool:
+        """
+        Drop ``key``'s entry on ``topic_filter`` and prune empty nodes.
+        Returns False if there was no such entry.
+        """
+        node = self.root
+        for level in self._levels(topic_filter):
+            if level == '+':
+                node = node.plus
+            elif level == '#':
+                node = node.hash
+            else:
+                node = node.children.get(level)
+            if node is None:
+                return False
+        return self.discard(node, key)
+
+    def match(self, topic: str) -> List[Tuple[Any, Any]]:
+        """
+        Return ``(key, value)`` for every filter that matches ``topic``.
+        A key appears once per matching filter, as with the old list scan.
+        """
+        levels = topic.split('/')
+        depth = len(levels)
+        found: List[Tuple[Any, Any]] = []
+        stack = [(self.root, 0)]
+        while stack:
+            node, i = stack.pop()
+            if node.hash is not None:
+                found.extend(node.hash.subscribers.items())
+            if i == depth:
+                found.extend(node.subscribers.items())
+                continue
+            child = node.children.get(levels[i])
+            if child is not None:
+                stack.append((child, i + 1))
+            if node.plus is not None:
+                stack.append((node.plus, i + 1))
+        return found
@@ -13,12 +13,16 @@ class Subscriber:
                  username: str,
                  password: str,
                  topic: str,
-                 qos: int = 0):
+                 qos: int = 0,
+                 clean_session: bool = True):
         self.client_id = client_id
         self.username  = username
         self.password  = password
         self.topic     = topic
         self.qos       = qos
+        # False: the broker keeps our subscription and queues QoS 1/2
+        # messages while we are offline
+        self.clean_session = clean_session
 
     def _make_ssl_context(self) -> ssl.SSLContext:
         ctx = ssl.create_default_context(
@@ -38,7 +42,8 @@ class Subscriber:
             "type":      "CONNECT",
             "client_id": self.client_id,
             "username":  self.username,
-            "password":  self.password
+            "password":  self.password,
+            "clean_session": self.clean_session
         }
         writer.write((json.dumps(connect_pkt) + "\n").encode())
         await writer.drain()
@@ -51,7 +56,10 @@ class Subscriber:
             except: pass
             return
 
-        print("✅ Connected, subscribing…")
+        if resp.get("session_present"):
+            print("✅ Connected, resuming session…")
+        else:
+            print("✅ Connected, subscribing…")
 
         # SUBSCRIBE
         sub_pkt = {
@@ -72,6 +80,8 @@ class Subscriber:
 
         print(f"👂 Listening on '{self.topic}' (QoS {self.qos})…")
 
+        # QoS2 ids we sent PUBREC for, waiting for the broker's PUBREL
+        awaiting_rel = set()
         try:
             while True:
                 line = await reader.readline()
@@ -87,6 +97,8 @@ class Subscriber:
                     pid     = pkt.get("id")
 
                     flag = " (retained)" if retain else ""
+                    if pkt.get("dup"):
+                        flag += " (dup)"
                     print(f"🔔 {topic} → {payload!r}{flag} [qos={qos}, id={pid}]")
 
                     if qos == 1 and pid is not None:
@@ -97,20 +109,21 @@ class Subscriber:
                         print(f"   ↳ Sent PUBACK for {pid}")
 
                     elif qos == 2 and pid is not None:
-                        # QoS2 handshake
-                        # 1) send PUBREC
+                        # QoS2 handshake step 1; PUBREL arrives as its own
+                        # packet, possibly after other PUBLISHes
                         writer.write((json.dumps({"type":"PUBREC","id":pid}) + "\n").encode())
                         await writer.drain()
+                        awaiting_rel.add(pid)
                         print(f"   ↳ Sent PUBREC for {pid}")
-                        # 2) wait for PUBREL
-                        rel = json.loads((await reader.readline()).decode())
-                        if rel.get("type") == "PUBREL" and rel.get("id") == pid:
-                            # 3) send PUBCOMP
-                            writer.write((json.dumps({"type":"PUBCOMP","id":pid}) + "\n").encode())
-                            await writer.drain()
-                            print(f"   ↳ Completed QoS2 handshake for {pid}")
-                        else:
-                            print("⚠️ Unexpected PUBREL:", rel)
+
+                elif pkt.get("type") == "PUBREL":
+                    pid = pkt.get("id")
+                    # always complete, even for an id we no longer know
+                    writer.write((json.dumps({"type":"PUBCOMP","id":pid}) + "\n").encode())
+                    await writer.drain()
+                    if pid in awaiting_rel:
+                        awaiting_rel.discard(pid)
+                        print(f"   ↳ Completed QoS2 handshake for {pid}")
 
         except asyncio.CancelledError:
             pass
@@ -127,6 +140,8 @@ if __name__ == "__main__":
     p.add_argument("--topic",     required=True)
     p.add_argument("--qos",       type=int, choices=[0,1,2], default=0,
                    help="Requested QoS level (0, 1, or 2)")
+    p.add_argument("--no-clean-session", action="store_true",
+                   help="Keep subscription and queued messages across reconnects")
     args = p.parse_args()
 
     sub = Subscriber(
@@ -134,6 +149,7 @@ if __name__ == "__main__":
         username=args.username,
         password=args.password,
         topic=args.topic,
-        qos=args.qos
+        qos=args.qos,
+        clean_session=not args.no_clean_session
     )
     asyncio.run(sub.run())
@@ -1,6 +1,13 @@
 # config/settings.py
 HOST        = "localhost"
-PORT        = 8883
+PORT        = 8883        # newline-JSON protocol (client/ publisher & subscriber)
+MQTT_PORT   = 8884        # binary MQTT 3.1.1 (paho-mqtt and other standard clients)
+
+# Listeners started next to the JSON one on PORT, as (port, protocol);
+# protocol is "json" or "mqtt"
+EXTRA_LISTENERS = [(MQTT_PORT, "mqtt")]
+# largest MQTT remaining length accepted from a client, in bytes
+MAX_PACKET_SIZE = 16 * 1024 * 1024
 
 SERVER_CERT = "config/certs/server.crt"
 SERVER_KEY  = "config/certs/server.key"
@@ -8,4 +15,174 @@ CA_CERT     = "config/certs/ca.crt"    # ← this must exist
 MUTUAL_TLS  = False
 
 DB_PATH         = "secure_mqtt_broker.db"
-FERNET_KEY_PATH = "config/certs/db_fernet.key"
\ No newline at end of file
+FERNET_KEY_PATH = "config/certs/db_fernet.key"
+
+# SQLite connection profiles (EncryptedSQLiteDB(profile=...)).  The broker
+# and the admin CLI / web UI open the same file, so both use WAL: readers
+# never block the writer and vice versa.  synchronous=NORMAL in WAL mode
+# fsyncs at checkpoints only (a power loss may lose the last commits, never
+# corrupts the file).  auto_vacuum=INCREMENTAL (only takes effect on a new
+# file, or after a full VACUUM) lets the log compactor hand free pages back
+# in small steps.  cache_size < 0 is in KiB; statement_cache is the number
+# of prepared statements kept per connection.
+DB_PROFILE  = "broker"
+DB_PROFILES = {
+    "broker": {
+        "auto_vacuum":     "INCREMENTAL",
+        "journal_mode":    "WAL",
+        "synchronous":     "NORMAL",
+        "busy_timeout":    5000,              # ms
+        "cache_size":      -64 * 1024,
+        "mmap_size":       256 * 1024 * 1024,
+        "temp_store":      "MEMORY",
+        "statement_cache": 256,
+    },
+    "admin": {
+        "auto_vacuum":     "INCREMENTAL",
+        "journal_mode":    "WAL",
+        "synchronous":     "NORMAL",
+        "busy_timeout":    5000,
+        "cache_size":      -16 * 1024,
+        "mmap_size":       64 * 1024 * 1024,
+        "statement_cache": 128,
+    },
+    # SQLite's own defaults (rollback journal, FULL sync)
+    "compat": {},
+}
+
+# Bulk Fernet (EncryptedSQLiteDB.encrypt_many / decrypt_many / decrypt_rows):
+# tokens handled per chunk, threads for multi-chunk batches (0/1: inline),
+# and entries in the token -> plaintext LRU used for hot columns
+CRYPTO_BATCH_SIZE  = 512
+CRYPTO_WORKERS     = 0
+DECRYPT_CACHE_SIZE = 4096
+
+# Per-subscriber outbound queue (frames waiting for that client's writer task)
+OUTBOUND_QUEUE_SIZE      = 1000
+# what to do when it is full: "drop-oldest", "drop-new" or "disconnect"
+OUTBOUND_OVERFLOW_POLICY = "drop-oldest"
+# seconds a closing session may spend flushing its queue
+OUTBOUND_FLUSH_TIMEOUT   = 2.0
+# PUBLISH payloads of at least this many bytes are written by reference
+# (header and payload as separate buffers, shared by every subscriber);
+# smaller ones are cheaper to copy into a single frame
+SHARED_PAYLOAD_MIN       = 4096
+
+# Outbound QoS 1/2 flow control: at most MAX_INFLIGHT unacknowledged
+# deliveries per subscriber; the rest wait (up to OUTBOUND_QUEUE_SIZE, same
+# overflow policy) until a PUBACK/PUBCOMP frees a slot.  Unacknowledged
+# PUBLISH/PUBREL frames are resent every INFLIGHT_RETRY_INTERVAL seconds by
+# a timer wheel of TIMER_WHEEL_SLOTS buckets, TIMER_WHEEL_TICK seconds each
+MAX_INFLIGHT            = 20
+INFLIGHT_RETRY_INTERVAL = 10.0
+TIMER_WHEEL_TICK        = 0.25
+TIMER_WHEEL_SLOTS       = 256
+
+# Audit log sink: records are buffered in memory and written to `logs`
+# with one executemany/commit per batch
+AUDIT_RING_SIZE         = 10000   # records buffered before the oldest are dropped
+AUDIT_BATCH_SIZE        = 200     # flush as soon as this many are waiting…
+AUDIT_FLUSH_INTERVAL_MS = 250     # …or at least this often
+
+# Control plane (broker.control): HTTP/JSON on CONTROL_HOST:CONTROL_PORT to
+# list sessions (paged, at most CONTROL_MAX_PAGE per request) and force
+# disconnects; with --workers N, worker i listens on CONTROL_PORT + i.  If
+# CONTROL_TOKEN is set, requests need "Authorization: Bearer <token>".
+# None disables it.
+CONTROL_HOST     = "127.0.0.1"
+CONTROL_PORT     = 9208
+CONTROL_TOKEN    = None
+CONTROL_MAX_PAGE = 500
+
+# Local event feed: the broker writes each committed audit record, as a
+# JSON line, to every listener on this Unix socket (the admin web app's live
+# log view follows it instead of polling `logs`).  With --workers N, worker
+# i uses "<stem>-<i>.sock".  None disables it.
+EVENT_FEED_SOCKET     = "/tmp/secure_mqtt_broker-events.sock"
+EVENT_FEED_MAX_BUFFER = 1024 * 1024   # bytes queued to a slow listener before dropping
+
+# Log retention (broker.log_compactor): every LOG_COMPACT_INTERVAL seconds,
+# `logs` rows older than LOG_ROTATE_DAYS move, LOG_COMPACT_BATCH rows per
+# transaction, into one SQLite file per LOG_ARCHIVE_PERIOD ("day" or
+# "month") under LOG_ARCHIVE_DIR (None: they are deleted instead).  Archive
+# files older than LOG_RETENTION_DAYS are removed (None: kept forever), and
+# freed pages are returned to the OS LOG_VACUUM_PAGES at a time
+LOG_ROTATE_DAYS       = 30
+LOG_ARCHIVE_DIR       = "log_archive"
+LOG_ARCHIVE_PERIOD    = "month"
+LOG_RETENTION_DAYS    = 365
+LOG_COMPACT_INTERVAL  = 3600
+LOG_COMPACT_BATCH     = 5000
+LOG_VACUUM_PAGES      = 1000
+
+# Retained messages are persisted write-behind at most this often
+RETAINED_FLUSH_INTERVAL_MS = 500
+
+# Persistent sessions (CONNECT with clean_session=false): QoS 1/2 messages
+# for an offline client are queued, the first OFFLINE_MEMORY_MESSAGES in
+# memory and the rest spilled to SQLite, up to OFFLINE_QUEUE_MAX per client.
+# With --workers N a stored session lives in the worker that held it: a
+# reconnect that lands on another worker starts without it
+OFFLINE_MEMORY_MESSAGES    = 100
+OFFLINE_QUEUE_MAX          = 10000
+OFFLINE_SPILL_BATCH        = 500
+OFFLINE_SPILL_INTERVAL_MS  = 200
+OFFLINE_REPLAY_BATCH       = 100     # messages replayed per step on reconnect
+# seconds an offline persistent session is kept (None: forever)
+SESSION_EXPIRY             = 24 * 3600
+# seconds a CONNECT waits for the connection it takes over (same
+# client_id, MQTT 3.1.1 §3.1.4) to finish its disconnect
+TAKEOVER_TIMEOUT           = 5.0
+
+# Compiled ACL cache: per-user LRU of topic -> allow/deny decisions, dropped
+# whenever the acls table changes (polled through the acl_version row)
+ACL_DECISION_CACHE_SIZE   = 1024
+ACL_VERSION_POLL_INTERVAL = 1.0     # seconds
+
+# bcrypt verification runs in a thread pool behind a concurrency limit;
+# successful checks are remembered briefly so reconnect storms skip bcrypt
+AUTH_WORKERS         = 4        # bcrypt threads
+AUTH_MAX_CONCURRENCY = 4        # CONNECTs verifying at once; the rest queue
+AUTH_CACHE_TTL       = 60.0     # seconds a verified credential stays cached
+AUTH_CACHE_SIZE      = 10000
+
+# Admission control (broker.admission), per broker process.  At most
+# MAX_HANDSHAKES CONNECTs are authenticated and set up at once, the rest
+# wait; a CONNECT that would create session number MAX_SESSIONS + 1
+# (connected + stored persistent ones) is refused with "server
+# unavailable".  None disables a limit.
+MAX_HANDSHAKES = 64
+MAX_SESSIONS   = None
+# Token buckets on PUBLISH traffic, per client_id and per user (summed over
+# that user's connections): messages and payload bytes per second, and the
+# burst a client may send ahead of its rate.  A client over a limit is not
+# dropped: its reader is paused until the bucket has refilled.
+CLIENT_MSG_RATE   = None
+CLIENT_MSG_BURST  = 100
+CLIENT_BYTE_RATE  = None
+CLIENT_BYTE_BURST = 1024 * 1024
+USER_MSG_RATE     = None
+USER_MSG_BURST    = 1000
+USER_BYTE_RATE    = None
+USER_BYTE_BURST   = 8 * 1024 * 1024
+
+# Multi-process mode: WORKERS processes accept on the same ports
+# (SO_REUSEPORT, Linux/BSD only) and forward PUBLISHes to each other over
+# Unix sockets in CLUSTER_SOCKET_DIR
+WORKERS            = 1
+CLUSTER_SOCKET_DIR = "/tmp"
+CLUSTER_MAX_BUFFER = 4 * 1024 * 1024   # bytes queued to a slow peer before dropping
+
+# Logging: default level, per-logger overrides (e.g. {"broker.router":
+# "DEBUG"} traces every packet), "text" or "json" lines, and whether log
+# records are written by a background thread instead of the event loop
+LOG_LEVEL  = "INFO"
+LOG_LEVELS = {}
+LOG_FORMAT = "text"
+LOG_QUEUE  = False
+
+# Prometheus text endpoint (http://METRICS_HOST:METRICS_PORT/metrics), served
+# from the broker's event loop; None disables it.  With --workers N, worker
+# i listens on METRICS_PORT + i.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
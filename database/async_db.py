@@ -0,0 +1,69 @@
+# secure_mqtt_broker/database/async_db.py
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .encrypted_db import EncryptedSQLiteDB
+
+
+class AsyncEncryptedDB:
+    """
+    Awaitable facade over EncryptedSQLiteDB for code running on the
+    asyncio event loop.
+
+    Every call is shipped to one dedicated thread, whose work queue is the
+    request queue: the sqlite3 connection is only ever touched from that
+    thread, statements run in submission order, and a slow disk or a lock
+    held by another process (e.g. the admin web app) only delays the
+    awaiting coroutine instead of freezing the whole broker.
+
+    Usage:
+        adb  = AsyncEncryptedDB(db)
+        rows = await adb.query("SELECT ...", params)
+        user = await adb.run(auth.verify_user, username, password)
+    """
+    def __init__(self, db: EncryptedSQLiteDB):
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="sqlite")
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run ``fn(*args, **kwargs)`` on the DB thread and await its result.
+        Use this for helpers (AuthManager, …) that issue several queries.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def run_in_transaction(self,
+                                 fn: Callable[..., Any],
+                                 *args,
+                                 immediate: bool = False) -> Any:
+        """
+        Run ``fn(db, *args)`` on the DB thread inside
+        ``db.transaction()``: all its statements commit once, or not at all.
+        """
+        def call():
+            with self.db.transaction(immediate=immediate):
+                return fn(self.db, *args)
+        return await self.run(call)
+
+    async def query(self, query: str, params: tuple = ()) -> list:
+        """Awaitable EncryptedSQLiteDB.query (SELECT, fetch all rows)."""
+        return await self.run(self.db.query, query, params)
+
+    async def execute(self, query: str, params: tuple = ()):
+        """Awaitable EncryptedSQLiteDB.execute (single write + commit)."""
+        return await self.run(self.db.execute, query, params)
+
+    async def executemany(self, query: str, seq_of_params):
+        """Awaitable EncryptedSQLiteDB.executemany (batch, one commit)."""
+        return await self.run(self.db.executemany, query, list(seq_of_params))
+
+    def close(self):
+        """Finish queued statements and stop the DB thread."""
+        self._executor.shutdown(wait=True)
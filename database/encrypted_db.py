@@ -1,6 +1,25 @@
+import hashlib
+import hmac
 import sqlite3
 import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Sequence, Union
+
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+import config.settings as settings
+
+# PRAGMAs a connection profile may set, in the order they are applied
+# (busy_timeout first, so switching journal_mode already waits on locks;
+# auto_vacuum before anything can create the first table)
+PROFILE_PRAGMAS = ("busy_timeout", "auto_vacuum", "journal_mode", "synchronous", "cache_size",
+                   "mmap_size", "temp_store", "wal_autocheckpoint")
 
 class EncryptedSQLiteDB:
     """
@@ -11,19 +30,89 @@ class EncryptedSQLiteDB:
         db = EncryptedSQLiteDB(db_path='secure.db', key_path='secret.key')
         # Use SQL functions `encrypt(?)` and `decrypt(column)` in your queries.
 
+    For many rows, select the raw tokens and decrypt them in bulk with
+    decrypt_rows()/decrypt_many() (and encrypt_many() before an
+    executemany): identical tokens are decrypted once, work is done in
+    chunks of ``batch_size``, optionally across ``workers`` threads, and
+    hot low-cardinality columns (usernames) can be served from a bounded
+    LRU of decrypted values (also reachable as SQL `decrypt_cached(col)`).
+    Fernet tokens are randomized, so the LRU is keyed by token: it pays
+    off for rows read again and again, e.g. users joined into every log
+    row or re-read on each admin page.
+
+    Equality lookups on an encrypted column go through a blind index: a
+    companion column holding `blind_index(value)`, a keyed HMAC-SHA256 of
+    the normalized value, with an ordinary SQLite index on it:
+
+        INSERT INTO users(username, username_bidx, ...)
+             VALUES (encrypt(?), blind_index(?), ...)
+        SELECT ... FROM users WHERE username_bidx = ?   -- db.blind_index(name)
+
+    The connection is tuned by a profile from settings.DB_PROFILES (or a
+    dict of the same shape): PRAGMAs such as WAL journaling and
+    busy_timeout, plus the size of sqlite3's prepared-statement LRU.
+    execute()/executemany() commit on their own unless they run inside
+    `with db.transaction():`, which commits (or rolls back) once.
+
     """
-    def __init__(self, db_path: str, key_path: str):
+    def __init__(self,
+                 db_path: str,
+                 key_path: str,
+                 cache_size: int = settings.DECRYPT_CACHE_SIZE,
+                 batch_size: int = settings.CRYPTO_BATCH_SIZE,
+                 workers: int = settings.CRYPTO_WORKERS,
+                 profile: Union[str, dict] = settings.DB_PROFILE):
         # Load or create encryption key
         self.key = self._load_or_create_key(key_path)
         self.fernet = Fernet(self.key)
+        # separate key for the blind index, derived from the Fernet key so
+        # no second key file has to be managed
+        self._bidx_key = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=None,
+            info=b"secure_mqtt_broker blind index v1",
+        ).derive(self.key)
+
+        # bulk crypto: chunking, optional thread pool, token -> plaintext LRU
+        self.batch_size = max(1, batch_size)
+        self.workers = workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, str]" = OrderedDict()
+        # the admin web app calls in from several threads
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
         # Connect to SQLite database
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.profile = dict(settings.DB_PROFILES[profile]
+                            if isinstance(profile, str) else profile)
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False,
+            cached_statements=self.profile.get("statement_cache", 128))
         self.conn.row_factory = sqlite3.Row
+        self._apply_profile()
+
+        # serializes use of the shared connection, so another thread's
+        # statements never land inside an open transaction()
+        self._lock = threading.RLock()
+        self._tx_depth = 0
 
         # Register custom SQL functions for encryption/decryption
         self._register_functions()
 
+    def _apply_profile(self):
+        for name in PROFILE_PRAGMAS:
+            value = self.profile.get(name)
+            if value is None:
+                continue
+            if not (isinstance(value, int) or str(value).isalnum()):
+                raise ValueError(f"invalid PRAGMA {name} value {value!r}")
+            self.conn.execute(f"PRAGMA {name} = {value}")
+
+    def pragma(self, name: str):
+        """Current value of a PRAGMA (e.g. 'journal_mode')."""
+        return self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+
     def _load_or_create_key(self, key_path: str) -> bytes:
         """
         Load existing encryption key from file, or generate a new one.
@@ -46,6 +135,23 @@ class EncryptedSQLiteDB:
         Decrypt token to raw bytes. """
         return self.fernet.decrypt(token)
 
+    @staticmethod
+    def normalize(value: str) -> str:
+        """Blind-index normal form: NFKC, case-folded."""
+        return unicodedata.normalize("NFKC", value).casefold()
+
+    def blind_index(self, value) -> Optional[bytes]:
+        """
+        Deterministic keyed digest of a value, for `WHERE col_bidx = ?`.
+        Also registered as SQL `blind_index(?)`.
+        """
+        if value is None:
+            return None
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value).decode('utf-8')
+        return hmac.new(self._bidx_key, self.normalize(value).encode('utf-8'),
+                        hashlib.sha256).digest()
+
     def _encrypt_func(self, plain_text):
         """
         SQL function: encrypt(TEXT) -> BLOB
@@ -67,31 +173,207 @@ class EncryptedSQLiteDB:
         # token may be stored as bytes or buffer
         return self._decrypt(token).decode('utf-8')
 
+    def _decrypt_cached_func(self, token):
+        """
+        SQL function: decrypt_cached(BLOB) -> TEXT
+        Like `decrypt(column)`, through the LRU; meant for hot,
+        low-cardinality columns such as usernames.
+        """
+        if token is None:
+            return None
+        return self.decrypt_many([token], cache=True)[0]
+
     def _register_functions(self):
         """
         Register the SQL functions for encrypt/decrypt.
         """
         self.conn.create_function('encrypt', 1, self._encrypt_func)
         self.conn.create_function('decrypt', 1, self._decrypt_func)
+        self.conn.create_function('decrypt_cached', 1, self._decrypt_cached_func)
+        self.conn.create_function('blind_index', 1, self.blind_index,
+                                  deterministic=True)
+
+    # ——— bulk encryption ————————————————————————————————————————
+
+    def _map(self, fn, items: list) -> list:
+        """
+        Apply ``fn`` (list -> list) to ``items`` in chunks of batch_size,
+        on the worker pool when there is more than one chunk.
+        """
+        if len(items) <= self.batch_size or self.workers <= 1:
+            return fn(items)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix="fernet")
+        chunks = [items[i:i + self.batch_size]
+                  for i in range(0, len(items), self.batch_size)]
+        out = []
+        for part in self._pool.map(fn, chunks):
+            out.extend(part)
+        return out
+
+    def _encrypt_chunk(self, values: list) -> list:
+        encrypt = self.fernet.encrypt
+        return [encrypt(v) for v in values]
+
+    def _decrypt_chunk(self, tokens: list) -> list:
+        decrypt = self.fernet.decrypt
+        return [decrypt(t).decode('utf-8') for t in tokens]
+
+    def encrypt_many(self, values: Iterable) -> List[Optional[bytes]]:
+        """
+        Encrypt many values (str or bytes; None stays None) for binding
+        as plain parameters, e.g. in executemany().  Every value gets its
+        own randomized token, as with `encrypt(?)`.
+        """
+        values = [v.encode('utf-8') if isinstance(v, str) else v
+                  for v in values]
+        todo = [v for v in values if v is not None]
+        tokens = iter(self._map(self._encrypt_chunk, todo))
+        return [None if v is None else next(tokens) for v in values]
+
+    def decrypt_many(self,
+                     tokens: Iterable,
+                     cache: bool = False) -> List[Optional[str]]:
+        """
+        Decrypt many tokens (None stays None).  Repeated tokens are only
+        decrypted once; with ``cache`` the LRU is consulted and filled.
+        """
+        tokens = [None if t is None else bytes(t) for t in tokens]
+        out: List[Optional[str]] = [None] * len(tokens)
+        # distinct token -> positions in `tokens`
+        todo = {}
+        with self._cache_lock:
+            for i, tok in enumerate(tokens):
+                if tok is None:
+                    continue
+                if cache:
+                    hit = self._cache.get(tok)
+                    if hit is not None:
+                        self._cache.move_to_end(tok)
+                        self.cache_hits += 1
+                        out[i] = hit
+                        continue
+                todo.setdefault(tok, []).append(i)
+            if cache:
+                self.cache_misses += len(todo)
+
+        distinct = list(todo)
+        plain = self._map(self._decrypt_chunk, distinct)
+        for tok, text in zip(distinct, plain):
+            for i in todo[tok]:
+                out[i] = text
+        if cache and distinct:
+            self._remember(zip(distinct, plain))
+        return out
+
+    def _remember(self, pairs):
+        with self._cache_lock:
+            for tok, text in pairs:
+                self._cache[tok] = text
+                self._cache.move_to_end(tok)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def decrypt_rows(self,
+                     rows: Sequence,
+                     columns: Sequence[str],
+                     cached: Sequence[str] = ()) -> List[dict]:
+        """
+        Rows (sqlite3.Row or dict) as dicts with ``columns`` decrypted in
+        bulk, one column at a time; columns listed in ``cached`` go
+        through the LRU.
+        """
+        out = [dict(r) for r in rows]
+        for col in columns:
+            plain = self.decrypt_many((r[col] for r in out), cache=col in cached)
+            for r, text in zip(out, plain):
+                r[col] = text
+        return out
+
+    def query_decrypted(self,
+                        query: str,
+                        params: tuple = (),
+                        columns: Sequence[str] = (),
+                        cached: Sequence[str] = ()) -> List[dict]:
+        """
+        query() the raw tokens, then decrypt_rows(); the bulk counterpart
+        of `SELECT decrypt(column) ...`.
+        """
+        return self.decrypt_rows(self.query(query, params), columns, cached)
+
+    @contextmanager
+    def transaction(self, immediate: bool = False):
+        """
+        Run several statements as one transaction with a single commit:
+
+            with db.transaction():
+                db.executemany(...)
+                db.execute(...)
+
+        Rolls back if the block raises.  ``immediate`` takes the write
+        lock up front (BEGIN IMMEDIATE) instead of at the first write.
+        Nested blocks join the outermost transaction.
+        """
+        with self._lock:
+            if self._tx_depth:
+                self._tx_depth += 1
+                try:
+                    yield self
+                finally:
+                    self._tx_depth -= 1
+                return
+            if self.conn.in_transaction:
+                self.conn.commit()
+            self.conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            self._tx_depth = 1
+            try:
+                yield self
+            except BaseException:
+                self._tx_depth = 0
+                self.conn.rollback()
+                raise
+            self._tx_depth = 0
+            self.conn.commit()
+
+    def _commit(self):
+        # inside transaction() the outermost block commits
+        if not self._tx_depth:
+            self.conn.commit()
 
     def execute(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
         """
         Execute a write operation (INSERT, UPDATE, DELETE).
         """
-        cur = self.conn.cursor()
-        cur.execute(query, params)
-        self.conn.commit()
-        return cur
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(query, params)
+            self._commit()
+            return cur
+
+    def executemany(self, query: str, seq_of_params) -> sqlite3.Cursor:
+        """
+        Execute one write statement for many parameter tuples in a single
+        transaction (one commit for the whole batch).
+        """
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.executemany(query, seq_of_params)
+            self._commit()
+            return cur
 
     def query(self, query: str, params: tuple = ()) -> list:
         """
         Execute a read operation (SELECT) and fetch all rows.
         Use `decrypt(column)` in SELECT to get plaintext values.
         """
-        cur = self.conn.cursor()
-        cur.execute(query, params)
-        return cur.fetchall()
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(query, params)
+            return cur.fetchall()
 
     def close(self):
         """Close the database connection."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
         self.conn.close()
\ No newline at end of file
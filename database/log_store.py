@@ -0,0 +1,184 @@
+# secure_mqtt_broker/database/log_store.py
+
+import glob
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import config.settings as settings
+
+from .encrypted_db import EncryptedSQLiteDB
+
+log = logging.getLogger(__name__)
+
+# Retention for the ``logs`` table.  Rows older than a cutoff are rotated,
+# oldest first and in bounded batches, into one archive file per period
+# (logs-2024-05.db for "month", logs-2024-05-17.db for "day"), which keeps
+# the live table -- and so every admin query on it -- at a steady size.
+# Old archive files are simply deleted, and the pages freed in the main
+# file are released with incremental vacuum.  Each function here is one
+# short step on an open connection, so the broker can run them on its DB
+# thread between other work (broker.log_compactor) and the admin CLI can
+# run them back to back (compact_logs).
+
+# period name -> length of the timestamp prefix naming it
+PERIODS = {"day": 10, "month": 7}
+
+# `logs` timestamps: CURRENT_TIMESTAMP's format, UTC
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+CREATE_ARCHIVE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS log_archive.logs (
+    id         INTEGER PRIMARY KEY,
+    timestamp  DATETIME,
+    client_id  TEXT    NOT NULL,
+    topic      TEXT    NOT NULL,
+    action     TEXT    NOT NULL,
+    success    INTEGER NOT NULL,
+    details    BLOB
+);
+"""
+
+# the oldest ``limit`` rows inside [start, end); run twice in one
+# transaction it selects the same rows both times
+_OLDEST_IDS_SQL = ("SELECT id FROM logs WHERE timestamp >= ? AND timestamp < ? "
+                   "ORDER BY timestamp, id LIMIT ?")
+
+# With the main file in WAL mode a transaction spanning it and an attached
+# file is atomic per file only, so a crash may leave rows both archived and
+# still in `logs`; OR IGNORE makes the retry harmless.
+ARCHIVE_ROWS_SQL = (
+    "INSERT OR IGNORE INTO log_archive.logs "
+    "SELECT id, timestamp, client_id, topic, action, success, details "
+    f"FROM logs WHERE id IN ({_OLDEST_IDS_SQL})"
+)
+DELETE_ROWS_SQL = f"DELETE FROM logs WHERE id IN ({_OLDEST_IDS_SQL})"
+
+
+def timestamp(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def cutoff(days: float, now: Optional[datetime] = None) -> str:
+    """Timestamp ``days`` before ``now`` (default: the current time)."""
+    return timestamp((now or datetime.now(timezone.utc)) - timedelta(days=days))
+
+
+def period_bounds(key: str, period: str) -> Tuple[str, str]:
+    """[start, end) timestamps of the period named ``key``."""
+    if period == "day":
+        start = datetime.strptime(key, "%Y-%m-%d")
+        end = start + timedelta(days=1)
+    elif period == "month":
+        start = datetime.strptime(key, "%Y-%m")
+        end = start.replace(year=start.year + start.month // 12,
+                            month=start.month % 12 + 1)
+    else:
+        raise ValueError(f"unknown log archive period {period!r}")
+    return start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+
+
+def archive_path(archive_dir: str, key: str) -> str:
+    return os.path.join(archive_dir, f"logs-{key}.db")
+
+
+def rotate_batch(db: EncryptedSQLiteDB,
+                 before: str,
+                 archive_dir: Optional[str] = settings.LOG_ARCHIVE_DIR,
+                 period: str = settings.LOG_ARCHIVE_PERIOD,
+                 limit: int = settings.LOG_COMPACT_BATCH) -> int:
+    """
+    Move up to ``limit`` of the oldest rows stamped before ``before`` into
+    their period's archive file (or, with no ``archive_dir``, delete them).
+    One batch never spans two periods.  Returns the rows taken out of
+    `logs`; 0 once nothing older than ``before`` is left.
+    """
+    oldest = db.query("SELECT MIN(timestamp) AS ts FROM logs")[0]["ts"]
+    if oldest is None or oldest >= before:
+        return 0
+    key = oldest[:PERIODS[period]]
+    start, end = period_bounds(key, period)
+    params = (start, min(end, before), limit)
+
+    if archive_dir is None:
+        return db.execute(DELETE_ROWS_SQL, params).rowcount
+
+    os.makedirs(archive_dir, exist_ok=True)
+    # ATTACH is not allowed inside a transaction
+    db.execute("ATTACH DATABASE ? AS log_archive", (archive_path(archive_dir, key),))
+    try:
+        with db.transaction(immediate=True):
+            db.execute(CREATE_ARCHIVE_TABLE_SQL)
+            db.execute(ARCHIVE_ROWS_SQL, params)
+            moved = db.execute(DELETE_ROWS_SQL, params).rowcount
+    finally:
+        db.execute("DETACH DATABASE log_archive")
+    return moved
+
+
+def purge_archives(archive_dir: Optional[str],
+                   before: str,
+                   period: str = settings.LOG_ARCHIVE_PERIOD) -> List[str]:
+    """Delete archive files whose whole period ends before ``before``."""
+    if archive_dir is None or not os.path.isdir(archive_dir):
+        return []
+    removed = []
+    for path in sorted(glob.glob(os.path.join(archive_dir, "logs-*.db"))):
+        key = os.path.basename(path)[len("logs-"):-len(".db")]
+        try:
+            _, end = period_bounds(key, period)
+        except ValueError:
+            continue        # another period's naming, or not ours
+        if end > before:
+            continue
+        for leftover in (path, path + "-journal"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        removed.append(path)
+    return removed
+
+
+def vacuum_step(db: EncryptedSQLiteDB,
+                pages: int = settings.LOG_VACUUM_PAGES) -> int:
+    """
+    Release up to ``pages`` free pages of the main file to the OS; returns
+    how many were released (always 0 unless auto_vacuum=INCREMENTAL).
+    """
+    if db.pragma("auto_vacuum") != 2:
+        return 0
+    free = db.pragma("freelist_count")
+    if free:
+        # the pragma frees one page per result step: fetch them all
+        db.query(f"PRAGMA incremental_vacuum({int(pages)})")
+    return free - db.pragma("freelist_count")
+
+
+def compact_logs(db: EncryptedSQLiteDB,
+                 rotate_days: float = settings.LOG_ROTATE_DAYS,
+                 archive_dir: Optional[str] = settings.LOG_ARCHIVE_DIR,
+                 period: str = settings.LOG_ARCHIVE_PERIOD,
+                 retention_days: Optional[float] = settings.LOG_RETENTION_DAYS,
+                 batch_size: int = settings.LOG_COMPACT_BATCH,
+                 vacuum_pages: int = settings.LOG_VACUUM_PAGES,
+                 now: Optional[datetime] = None) -> dict:
+    """One full retention pass, without yielding (admin CLI)."""
+    before = cutoff(rotate_days, now)
+    rotated = 0
+    while True:
+        n = rotate_batch(db, before, archive_dir, period, batch_size)
+        if not n:
+            break
+        rotated += n
+
+    purged: List[str] = []
+    if retention_days is not None:
+        purged = purge_archives(archive_dir, cutoff(retention_days, now), period)
+
+    vacuumed = 0
+    while True:
+        n = vacuum_step(db, vacuum_pages)
+        if not n:
+            break
+        vacuumed += n
+    return {"rotated": rotated, "purged": purged, "vacuumed": vacuumed}
@@ -1,8 +1,15 @@
 # secure_mqtt_broker/database/models.py
 
+import logging
+import sqlite3
 from typing import Any
+
+from cryptography.fernet import InvalidToken
+
 from .encrypted_db import EncryptedSQLiteDB
 
+log = logging.getLogger(__name__)
+
 # ——— SQL DDL ——————————————————————————————————————
 
 CREATE_ROLES_TABLE_SQL = """
@@ -16,12 +23,28 @@ CREATE_USERS_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS users (
     id            INTEGER PRIMARY KEY AUTOINCREMENT,
     username      BLOB    NOT NULL,
+    username_bidx BLOB,
     password_hash BLOB    NOT NULL,
     role_id       INTEGER NOT NULL,
     FOREIGN KEY(role_id) REFERENCES roles(id)
 );
 """
 
+# username is Fernet-encrypted; lookups go through its blind index
+# (EncryptedSQLiteDB.blind_index), which also makes usernames unique
+# up to case and Unicode normalization
+ADD_USERNAME_BIDX_COLUMN_SQL = "ALTER TABLE users ADD COLUMN username_bidx BLOB;"
+
+CREATE_USERNAME_BIDX_INDEX_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_bidx
+ON users(username_bidx);
+"""
+
+INSERT_USER_SQL = (
+    "INSERT INTO users(username, username_bidx, password_hash, role_id) "
+    "VALUES (encrypt(?), blind_index(?), ?, ?)"
+)
+
 CREATE_ACLS_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS acls (
     id              INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,6 +66,43 @@ CREATE TABLE IF NOT EXISTS retained_messages (
 );
 """
 
+# One row per topic.  Older databases may hold duplicates (the table had no
+# constraint), so init_db keeps only the newest row per topic first.
+DEDUPE_RETAINED_MESSAGES_SQL = """
+DELETE FROM retained_messages
+WHERE id NOT IN (SELECT MAX(id) FROM retained_messages GROUP BY topic);
+"""
+
+CREATE_RETAINED_TOPIC_INDEX_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_retained_messages_topic
+ON retained_messages(topic);
+"""
+
+# QoS 1/2 messages spilled to disk for offline persistent sessions; each
+# worker process owns the rows it wrote (sessions are worker-local)
+CREATE_OFFLINE_MESSAGES_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS offline_messages (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    worker    INTEGER NOT NULL DEFAULT 0,
+    client_id TEXT    NOT NULL,
+    topic     TEXT    NOT NULL,
+    payload   BLOB,
+    qos       INTEGER NOT NULL,
+    retain    INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+ADD_OFFLINE_WORKER_COLUMN_SQL = (
+    "ALTER TABLE offline_messages ADD COLUMN worker INTEGER NOT NULL DEFAULT 0;"
+)
+
+DROP_OFFLINE_CLIENT_INDEX_SQL = "DROP INDEX IF EXISTS idx_offline_messages_client;"
+
+CREATE_OFFLINE_MESSAGES_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_offline_messages_worker_client
+ON offline_messages(worker, client_id, id);
+"""
+
 CREATE_LOGS_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS logs (
     id         INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,6 +115,46 @@ CREATE TABLE IF NOT EXISTS logs (
 );
 """
 
+# Indexes for admin.cli view-logs filters (client_id, topic, action,
+# success; newest first) and for the compactor's timestamp cutoff.  Every
+# SQLite index ends in the rowid (= id), so equality on all of an index's
+# columns already yields rows in id order: ORDER BY id DESC LIMIT n reads n
+# entries however large the table is.  The composite ones serve combined
+# filters (a client's failed SUBSCRIBEs, a topic's failures); a partial
+# match, e.g. client_id+action, searches one and sorts just its matches.
+CREATE_LOGS_INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_logs_client_id ON logs(client_id);",
+    "CREATE INDEX IF NOT EXISTS idx_logs_client_action_success ON logs(client_id, action, success);",
+    "CREATE INDEX IF NOT EXISTS idx_logs_topic ON logs(topic);",
+    "CREATE INDEX IF NOT EXISTS idx_logs_topic_success ON logs(topic, success);",
+    "CREATE INDEX IF NOT EXISTS idx_logs_action_success ON logs(action, success);",
+    "CREATE INDEX IF NOT EXISTS idx_logs_success ON logs(success);",
+    "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp);",
+]
+
+# Single-row counter bumped by triggers on every change to `acls`, so the
+# broker can cheaply tell that its compiled ACL cache is stale no matter
+# which process (admin CLI, web UI) edited the table.
+CREATE_ACL_VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS acl_version (
+    id      INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+SEED_ACL_VERSION_SQL = "INSERT OR IGNORE INTO acl_version(id, version) VALUES (1, 0);"
+
+CREATE_ACL_VERSION_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS acls_bump_version_{event.lower()}
+    AFTER {event} ON acls
+    BEGIN
+        UPDATE acl_version SET version = version + 1 WHERE id = 1;
+    END;
+    """
+    for event in ("INSERT", "UPDATE", "DELETE")
+]
+
 # ——— Helpers ————————————————————————————————————————
 
 def seed_roles(db: EncryptedSQLiteDB) -> None:
@@ -65,16 +165,73 @@ def seed_roles(db: EncryptedSQLiteDB) -> None:
         if role not in existing:
             db.execute("INSERT INTO roles(name) VALUES (?)", (role,))
 
+def insert_user(db: EncryptedSQLiteDB,
+                username: str,
+                password_hash: bytes,
+                role_id: int) -> int:
+    """Add a user with encrypted, blind-indexed username; returns its id."""
+    cur = db.execute(INSERT_USER_SQL, (username, username, password_hash, role_id))
+    return cur.lastrowid
+
+def migrate_usernames(db: EncryptedSQLiteDB) -> None:
+    """
+    Give older users rows their blind index, encrypting usernames that
+    were stored in plaintext.
+    """
+    columns = {r["name"] for r in db.query("PRAGMA table_info(users)")}
+    if "username_bidx" not in columns:
+        db.execute(ADD_USERNAME_BIDX_COLUMN_SQL)
+    db.execute(CREATE_USERNAME_BIDX_INDEX_SQL)
+
+    rows = db.query("SELECT id, username FROM users WHERE username_bidx IS NULL")
+    for r in rows:
+        stored = r["username"]
+        try:
+            name = db.decrypt_many([stored])[0]
+            token = stored
+        except (InvalidToken, TypeError):
+            # legacy plaintext row
+            name = stored.decode('utf-8') if isinstance(stored, bytes) else str(stored)
+            token = db.encrypt_many([name])[0]
+        try:
+            db.execute(
+                "UPDATE users SET username = ?, username_bidx = ? WHERE id = ?",
+                (token, db.blind_index(name), r["id"]))
+        except sqlite3.IntegrityError:
+            log.warning("user %d: username clashes with another user after "
+                        "normalization; left without a blind index", r["id"])
+
+def migrate_offline_messages(db: EncryptedSQLiteDB) -> None:
+    """Scope older offline_messages tables by worker process."""
+    columns = {r["name"] for r in db.query("PRAGMA table_info(offline_messages)")}
+    if "worker" not in columns:
+        db.execute(ADD_OFFLINE_WORKER_COLUMN_SQL)
+        db.execute(DROP_OFFLINE_CLIENT_INDEX_SQL)
+    db.execute(CREATE_OFFLINE_MESSAGES_INDEX_SQL)
+
 def init_db(db: EncryptedSQLiteDB) -> None:
     """
-    Create all tables (idempotent) and seed default data.
+    Create all tables (idempotent) and seed default data, as one
+    transaction.
     """
-    # 1) Schema
-    db.execute(CREATE_ROLES_TABLE_SQL)
-    db.execute(CREATE_USERS_TABLE_SQL)
-    db.execute(CREATE_ACLS_TABLE_SQL)
-    db.execute(CREATE_RETAINED_MESSAGES_TABLE_SQL)
-    db.execute(CREATE_LOGS_TABLE_SQL)
-
-    # 2) Seed defaults
-    seed_roles(db)
+    with db.transaction(immediate=True):
+        # 1) Schema
+        db.execute(CREATE_ROLES_TABLE_SQL)
+        db.execute(CREATE_USERS_TABLE_SQL)
+        migrate_usernames(db)
+        db.execute(CREATE_ACLS_TABLE_SQL)
+        db.execute(CREATE_RETAINED_MESSAGES_TABLE_SQL)
+        db.execute(DEDUPE_RETAINED_MESSAGES_SQL)
+        db.execute(CREATE_RETAINED_TOPIC_INDEX_SQL)
+        db.execute(CREATE_OFFLINE_MESSAGES_TABLE_SQL)
+        migrate_offline_messages(db)
+        db.execute(CREATE_LOGS_TABLE_SQL)
+        for index in CREATE_LOGS_INDEXES_SQL:
+            db.execute(index)
+        db.execute(CREATE_ACL_VERSION_TABLE_SQL)
+        db.execute(SEED_ACL_VERSION_SQL)
+        for trigger in CREATE_ACL_VERSION_TRIGGERS_SQL:
+            db.execute(trigger)
+
+        # 2) Seed defaults
+        seed_roles(db)
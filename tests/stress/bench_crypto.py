@@ -0,0 +1,105 @@
+# tests/stress/bench_crypto.py
+"""
+Microbenchmark: per-row SQL `encrypt(?)` / `decrypt(col)` scalar functions
+vs. EncryptedSQLiteDB's bulk API.
+
+    python -m tests.stress.bench_crypto [--rows 20000] [--users 50] [--workers 4]
+
+On a temporary database it times:
+  insert  executemany with encrypt(?) vs. encrypt_many() + plain binding
+  decrypt SELECT decrypt(details) vs. query_decrypted() (all tokens distinct)
+  join    log rows joined to a small users table, decrypting the username:
+          decrypt(u.username) vs. query_decrypted(cached=("username",)),
+          run twice so the second pass shows the warm LRU
+Each bulk variant runs inline and, with --workers > 1, on the thread pool.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from database.encrypted_db import EncryptedSQLiteDB
+
+SCHEMA = [
+    "CREATE TABLE bench_users (id INTEGER PRIMARY KEY, username BLOB)",
+    "CREATE TABLE bench_logs (id INTEGER PRIMARY KEY, user_id INTEGER, details BLOB)",
+]
+JOIN_SQL = ("SELECT l.id, {col} AS username FROM bench_logs l "
+            "JOIN bench_users u ON u.id = l.user_id")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def open_db(tmp, workers):
+    return EncryptedSQLiteDB(os.path.join(tmp, "bench.db"),
+                             os.path.join(tmp, "bench.key"), workers=workers)
+
+
+def run(db, args, label):
+    rows = [(i % args.users + 1, f"detail {i} " + "x" * args.size)
+            for i in range(args.rows)]
+    results = []
+
+    db.execute("DELETE FROM bench_logs")
+    t_scalar, _ = timed(lambda: db.executemany(
+        "INSERT INTO bench_logs(user_id, details) VALUES (?, encrypt(?))", rows))
+    db.execute("DELETE FROM bench_logs")
+    t_bulk, _ = timed(lambda: db.executemany(
+        "INSERT INTO bench_logs(user_id, details) VALUES (?, ?)",
+        zip((r[0] for r in rows), db.encrypt_many(r[1] for r in rows))))
+    results.append(("insert", t_scalar, t_bulk))
+
+    t_scalar, a = timed(lambda: db.query(
+        "SELECT id, decrypt(details) AS details FROM bench_logs"))
+    t_bulk, b = timed(lambda: db.query_decrypted(
+        "SELECT id, details FROM bench_logs", columns=("details",)))
+    assert [r["details"] for r in a] == [r["details"] for r in b]
+    results.append(("decrypt", t_scalar, t_bulk))
+
+    for attempt in ("join (cold)", "join (warm)"):
+        if attempt.endswith("(cold)"):
+            db._cache.clear()
+        t_scalar, a = timed(lambda: db.query(JOIN_SQL.format(col="decrypt(u.username)")))
+        t_bulk, b = timed(lambda: db.query_decrypted(
+            JOIN_SQL.format(col="u.username"), columns=("username",),
+            cached=("username",)))
+        assert [r["username"] for r in a] == [r["username"] for r in b]
+        results.append((attempt, t_scalar, t_bulk))
+
+    for name, t_scalar, t_bulk in results:
+        print(f"{label:<9} {name:<12} {t_scalar * 1e3:>9.1f}ms {t_bulk * 1e3:>9.1f}ms "
+              f"{t_scalar / t_bulk:>7.1f}x")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    p.add_argument("--rows", type=int, default=20_000)
+    p.add_argument("--users", type=int, default=50)
+    p.add_argument("--size", type=int, default=100,
+                   help="Bytes of padding per log detail")
+    p.add_argument("--workers", type=int, default=4)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_db(tmp, workers=0)
+        for stmt in SCHEMA:
+            db.execute(stmt)
+        db.executemany("INSERT INTO bench_users(id, username) VALUES (?, encrypt(?))",
+                       [(i + 1, f"user{i}") for i in range(args.users)])
+        print(f"{args.rows} rows, {args.users} users, {os.cpu_count()} CPUs")
+        print(f"{'mode':<9} {'case':<12} {'scalar':>11} {'bulk':>11} {'speedup':>8}")
+        run(db, args, "inline")
+        db.close()
+        if args.workers > 1:
+            db = open_db(tmp, workers=args.workers)
+            run(db, args, f"{args.workers} thr")
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
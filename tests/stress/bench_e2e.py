@@ -0,0 +1,425 @@
+# tests/stress/bench_e2e.py
+"""
+End-to-end benchmark: M publishers × N subscribers through a real broker.
+
+    python -m tests.stress.bench_e2e --publishers 4 --subscribers 16 \\
+        --messages 500 --qos 0,1,2 --mix exact,plus,hash --output bench.json
+
+The broker runs in its own process on a temporary database with freshly
+generated TLS certificates, so nothing in config/ is touched.  Load is
+generated by lightweight versions of client.publisher.Publisher and
+client.subscriber.Subscriber (same JSON protocol and QoS handshakes, but
+many messages per connection and no printing).
+
+Every payload carries its send time; subscribers record the delivery
+latency.  For each (QoS, wildcard mix) scenario the report gives
+msgs/sec delivered and p50/p99 end-to-end latency, as JSON on stdout (or
+in --output) so runs can be compared between releases.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from broker.topic_trie import match_topic
+
+USERNAME = "bench"
+PASSWORD = "bench-secret"
+
+# subscription filter for subscriber i, given M publishers on bench/<p>/data
+MIXES = {
+    "exact": lambda i, m: f"bench/{i % m}/data",
+    "plus":  lambda i, m: "bench/+/data",
+    "hash":  lambda i, m: "bench/#",
+    "mixed": lambda i, m: (f"bench/{i % m}/data", "bench/+/data", "bench/#")[i % 3],
+}
+
+
+# ——— environment ——————————————————————————————————————————
+
+def make_certs(directory: str) -> Dict[str, str]:
+    """Self-signed CA plus a localhost server certificate signed by it."""
+    import ipaddress
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    def build(subject, issuer, public_key, signing_key, ca, san=None):
+        b = (x509.CertificateBuilder()
+             .subject_name(subject).issuer_name(issuer)
+             .public_key(public_key)
+             .serial_number(x509.random_serial_number())
+             .not_valid_before(now - datetime.timedelta(minutes=5))
+             .not_valid_after(now + datetime.timedelta(days=1))
+             .add_extension(x509.BasicConstraints(ca=ca, path_length=None),
+                            critical=True))
+        if san:
+            b = b.add_extension(x509.SubjectAlternativeName(san), critical=False)
+        return b.sign(signing_key, hashes.SHA256())
+
+    ca_key = ec.generate_private_key(ec.SECP256R1())
+    ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench CA")])
+    ca_cert = build(ca_name, ca_name, ca_key.public_key(), ca_key, True)
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    cert = build(name, ca_name, key.public_key(), ca_key, False,
+                 [x509.DNSName("localhost"),
+                  x509.IPAddress(ipaddress.ip_address("127.0.0.1"))])
+
+    paths = {k: os.path.join(directory, f) for k, f in
+             (("CA_CERT", "ca.crt"), ("SERVER_CERT", "server.crt"),
+              ("SERVER_KEY", "server.key"))}
+    pem = serialization.Encoding.PEM
+    with open(paths["CA_CERT"], "wb") as f:
+        f.write(ca_cert.public_bytes(pem))
+    with open(paths["SERVER_CERT"], "wb") as f:
+        f.write(cert.public_bytes(pem))
+    with open(paths["SERVER_KEY"], "wb") as f:
+        f.write(key.private_bytes(pem, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return paths
+
+
+def prepare_db(overrides: Dict[str, str], filters):
+    """
+    Schema plus one user allowed to publish on bench/# and to subscribe to
+    every filter the scenarios use (subscribe ACLs match filters, not
+    topics: see CompiledACL.can_subscribe).
+    """
+    import bcrypt
+    from database.encrypted_db import EncryptedSQLiteDB
+    from database.models import init_db, insert_user
+
+    db = EncryptedSQLiteDB(overrides["DB_PATH"], overrides["FERNET_KEY_PATH"])
+    init_db(db)
+    role = db.query("SELECT id FROM roles WHERE name = 'Teacher'")[0]["id"]
+    pw_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt())
+    user_id = insert_user(db, USERNAME, pw_hash, role)
+    db.executemany(
+        "INSERT INTO acls(user_id, topic, can_publish, can_subscribe) VALUES (?,?,1,1)",
+        [(user_id, f) for f in sorted({"bench/#", *filters})])
+    db.close()
+
+
+def run_broker(overrides: Dict[str, object], port: int):
+    """Broker process: point settings at the temp files, then serve."""
+    import config.settings as settings
+    for k, v in overrides.items():
+        setattr(settings, k, v)
+    from broker.log import configure_logging
+    from broker.server import BrokerServer
+    configure_logging(level="WARNING")
+    server = BrokerServer(host="127.0.0.1", port=port,
+                          listeners=[(port, "json")], metrics_port=None)
+    try:
+        asyncio.run(server.start())
+    except KeyboardInterrupt:
+        pass
+
+
+# ——— load generators ——————————————————————————————————————
+
+class _Client:
+    def __init__(self, client_id: str, port: int, ssl_ctx: ssl.SSLContext):
+        self.client_id = client_id
+        self.port = port
+        self.ssl_ctx = ssl_ctx
+
+    async def _send(self, pkt: dict):
+        self.writer.write((json.dumps(pkt) + "\n").encode())
+        await self.writer.drain()
+
+    async def _recv(self) -> dict:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError(f"{self.client_id}: connection closed")
+        return json.loads(line)
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            "127.0.0.1", self.port, ssl=self.ssl_ctx,
+            server_hostname="localhost", limit=2 ** 20)
+        await self._send({"type": "CONNECT", "client_id": self.client_id,
+                          "username": USERNAME, "password": PASSWORD})
+        if not (await self._recv()).get("success"):
+            raise RuntimeError(f"{self.client_id}: CONNECT refused")
+
+    async def close(self):
+        try:
+            await self._send({"type": "DISCONNECT"})
+        except ConnectionError:
+            pass
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, ssl.SSLError):
+            pass
+
+
+class LoadSubscriber(_Client):
+    """Subscriber that acks like client.subscriber but only records latency."""
+
+    def __init__(self, client_id, port, ssl_ctx, topic_filter, qos):
+        super().__init__(client_id, port, ssl_ctx)
+        self.topic_filter = topic_filter
+        self.qos = qos
+        self.latencies: List[int] = []       # ns
+        self.last_at = 0
+
+    async def subscribe(self):
+        await self._send({"type": "SUBSCRIBE", "topic": self.topic_filter,
+                          "qos": self.qos})
+        if not (await self._recv()).get("success"):
+            raise RuntimeError(f"{self.client_id}: SUBSCRIBE refused")
+
+    async def consume(self):
+        try:
+            while True:
+                pkt = await self._recv()
+                kind, pid = pkt.get("type"), pkt.get("id")
+                if kind == "PUBLISH":
+                    now = time.monotonic_ns()
+                    sent = int(pkt["payload"].split(":", 2)[1])
+                    self.latencies.append(now - sent)
+                    self.last_at = now
+                    if pkt.get("qos") == 1 and pid is not None:
+                        await self._send({"type": "PUBACK", "id": pid})
+                    elif pkt.get("qos") == 2 and pid is not None:
+                        await self._send({"type": "PUBREC", "id": pid})
+                elif kind == "PUBREL":
+                    await self._send({"type": "PUBCOMP", "id": pid})
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+
+class LoadPublisher(_Client):
+    """
+    Publisher that sends ``count`` messages on one connection, completing
+    each QoS 1/2 handshake before the next message (like Publisher.run).
+    """
+
+    def __init__(self, client_id, port, ssl_ctx, topic, qos, count,
+                 payload_size, rate):
+        super().__init__(client_id, port, ssl_ctx)
+        self.topic = topic
+        self.qos = qos
+        self.count = count
+        self.padding = "x" * payload_size
+        self.interval = 1 / rate if rate else 0
+
+    async def publish_all(self):
+        next_at = time.monotonic()
+        for seq in range(self.count):
+            pkt = {"type": "PUBLISH", "topic": self.topic, "qos": self.qos,
+                   "payload": f"{seq}:{time.monotonic_ns()}:{self.padding}"}
+            pid = seq % 0xFFFF + 1
+            if self.qos:
+                pkt["id"] = pid
+            await self._send(pkt)
+            if self.qos == 1:
+                await self._expect("PUBACK", pid)
+            elif self.qos == 2:
+                await self._expect("PUBREC", pid)
+                await self._send({"type": "PUBREL", "id": pid})
+                await self._expect("PUBCOMP", pid)
+            if self.interval:
+                next_at += self.interval
+                await asyncio.sleep(max(0, next_at - time.monotonic()))
+
+    async def _expect(self, kind: str, pid: int):
+        pkt = await self._recv()
+        if pkt.get("type") != kind or pkt.get("id") != pid:
+            raise RuntimeError(f"{self.client_id}: expected {kind} {pid}, got {pkt}")
+
+
+# ——— scenarios ——————————————————————————————————————————————
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1,
+                   round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+async def run_scenario(port, ssl_ctx, qos, mix, args, run_id) -> dict:
+    m, n = args.publishers, args.subscribers
+    tag = f"{run_id}-q{qos}-{mix}"
+    subs = [LoadSubscriber(f"sub-{tag}-{i}", port, ssl_ctx,
+                           MIXES[mix](i, m), qos) for i in range(n)]
+    pubs = [LoadPublisher(f"pub-{tag}-{p}", port, ssl_ctx, f"bench/{p}/data",
+                          qos, args.messages, args.payload_size, args.rate)
+            for p in range(m)]
+
+    for c in subs:
+        await c.connect()
+        await c.subscribe()
+    consumers = [asyncio.create_task(s.consume()) for s in subs]
+    for c in pubs:
+        await c.connect()
+
+    expected = sum(args.messages
+                   for s in subs for p in pubs
+                   if match_topic(s.topic_filter, p.topic))
+    started = time.monotonic_ns()
+    await asyncio.gather(*(p.publish_all() for p in pubs))
+    published = time.monotonic_ns()
+
+    # wait for the tail: everything delivered, or nothing new for a while
+    received = 0
+    idle_since = time.monotonic()
+    while received < expected and time.monotonic() - idle_since < args.drain_timeout:
+        await asyncio.sleep(0.05)
+        now_received = sum(len(s.latencies) for s in subs)
+        if now_received != received:
+            received, idle_since = now_received, time.monotonic()
+
+    for t in consumers:
+        t.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    for c in pubs + subs:
+        await c.close()
+
+    lat = sorted(x / 1e6 for s in subs for x in s.latencies)
+    finished = max([s.last_at for s in subs] + [published])
+    duration = (finished - started) / 1e9
+    return {
+        "qos": qos,
+        "mix": mix,
+        "publishers": m,
+        "subscribers": n,
+        "published": m * args.messages,
+        "expected": expected,
+        "received": received,
+        "lost": expected - received,
+        "duration_s": round(duration, 4),
+        "publish_rate": round(m * args.messages / ((published - started) / 1e9), 1),
+        "msgs_per_sec": round(received / duration, 1) if duration else 0.0,
+        "latency_ms": {
+            "p50":  round(percentile(lat, 50), 3),
+            "p99":  round(percentile(lat, 99), 3),
+            "max":  round(lat[-1], 3) if lat else 0.0,
+            "mean": round(sum(lat) / len(lat), 3) if lat else 0.0,
+        },
+    }
+
+
+async def wait_for_port(port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, w = await asyncio.open_connection("127.0.0.1", port)
+            w.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_all(args, certs, port) -> List[dict]:
+    ssl_ctx = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH,
+                                         cafile=certs["CA_CERT"])
+    await wait_for_port(port)
+    run_id = os.getpid()
+    results = []
+    for qos in args.qos:
+        for mix in args.mix:
+            res = await run_scenario(port, ssl_ctx, qos, mix, args, run_id)
+            print(f"qos={qos} mix={mix:<6} {res['msgs_per_sec']:>10.1f} msg/s  "
+                  f"p50={res['latency_ms']['p50']:.2f}ms "
+                  f"p99={res['latency_ms']['p99']:.2f}ms  "
+                  f"lost={res['lost']}", file=sys.stderr)
+            results.append(res)
+    return results
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("--publishers", type=int, default=4)
+    p.add_argument("--subscribers", type=int, default=16)
+    p.add_argument("--messages", type=int, default=500,
+                   help="messages per publisher per scenario")
+    p.add_argument("--qos", default="0,1,2",
+                   type=lambda s: [int(q) for q in s.split(",")])
+    p.add_argument("--mix", default="exact,plus,hash,mixed",
+                   type=lambda s: s.split(","),
+                   help=f"wildcard mixes: {', '.join(MIXES)}")
+    p.add_argument("--payload-size", type=int, default=64,
+                   help="padding bytes per payload")
+    p.add_argument("--rate", type=float, default=0,
+                   help="messages/sec per publisher (0: as fast as possible)")
+    p.add_argument("--drain-timeout", type=float, default=3.0,
+                   help="seconds without new deliveries before giving up")
+    p.add_argument("--port", type=int, default=18883)
+    p.add_argument("--output", help="write the JSON report here")
+    args = p.parse_args(argv)
+    unknown = set(args.mix) - set(MIXES)
+    if unknown:
+        p.error(f"unknown mix {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="bench-e2e-") as tmp:
+        overrides = dict(make_certs(tmp),
+                         DB_PATH=os.path.join(tmp, "bench.db"),
+                         FERNET_KEY_PATH=os.path.join(tmp, "bench.key"))
+        prepare_db(overrides, {MIXES[mix](i, args.publishers)
+                               for mix in args.mix
+                               for i in range(args.subscribers)})
+
+        ctx = multiprocessing.get_context("spawn")
+        broker = ctx.Process(target=run_broker, args=(overrides, args.port),
+                             daemon=True)
+        broker.start()
+        try:
+            results = asyncio.run(run_all(args, overrides, args.port))
+        finally:
+            broker.terminate()
+            broker.join(5)
+
+    report = {
+        "benchmark": "e2e",
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: getattr(args, k) for k in
+                   ("publishers", "subscribers", "messages", "qos", "mix",
+                    "payload_size", "rate")},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# tests/stress/bench_fanout.py
+"""
+Benchmark: memory allocated by one PUBLISH fanned out to N subscribers.
+
+    python -m tests.stress.bench_fanout [--sizes 1024,65536,1048576] [--fanout 1,10,100,1000]
+
+For each payload size, fan-out and QoS it decodes one MQTT PUBLISH,
+builds the dispatch frame and queues it on N sessions (as
+Router._dispatch_publish does), then reports the tracemalloc peak in
+KiB.  "shared" is the broker as configured; "copy" sets
+SHARED_PAYLOAD_MIN out of reach, so every frame is one joined bytes
+object -- what a QoS 1/2 delivery cost before payloads were shared.
+Nothing is written to a socket.
+"""
+
+import argparse
+import struct
+import tracemalloc
+
+import config.settings as settings
+from broker.mqtt_codec import MQTT_CODEC
+from broker.session import Session
+
+
+class NullTransport:
+    def abort(self):
+        pass
+
+
+class NullWriter:
+    def __init__(self):
+        self.transport = NullTransport()
+
+
+def peak_kib(body, fanout, qos):
+    sessions = [Session(f"s{i}", NullWriter(), codec=MQTT_CODEC)
+                for i in range(fanout)]
+    tracemalloc.start()
+    pkt = MQTT_CODEC.decode(0x30 | qos << 1, body)
+    frame = MQTT_CODEC.publish_frame(pkt["topic"], pkt["payload"], qos)
+    for sess in sessions:
+        sess.publish(frame)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    p.add_argument("--sizes", default="1024,65536,1048576")
+    p.add_argument("--fanout", default="1,10,100,1000")
+    args = p.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    fanouts = [int(n) for n in args.fanout.split(",")]
+    shared_min = settings.SHARED_PAYLOAD_MIN
+
+    print(f"{'payload':>9} {'qos':>3} {'mode':<6} "
+          + " ".join(f"{f'N={n}':>12}" for n in fanouts))
+    for size in sizes:
+        topic = b"fw/chunk"
+        for qos in (0, 1):
+            body = (struct.pack("!H", len(topic)) + topic
+                    + (b"\x00\x01" if qos else b"") + b"\xab" * size)
+            for mode, threshold in (("copy", float("inf")), ("shared", shared_min)):
+                settings.SHARED_PAYLOAD_MIN = threshold
+                cells = [peak_kib(body, n, qos) for n in fanouts]
+                print(f"{size:>9} {qos:>3} {mode:<6} "
+                      + " ".join(f"{c:>9.0f}KiB" for c in cells))
+    settings.SHARED_PAYLOAD_MIN = shared_min
+
+
+if __name__ == "__main__":
+    main()
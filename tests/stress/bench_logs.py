@@ -0,0 +1,110 @@
+# tests/stress/bench_logs.py
+"""
+Benchmark: admin view-logs queries as the logs table grows, with and
+without the log indexes.
+
+    python -m tests.stress.bench_logs [--sizes 10000,100000,1000000] [--repeat 20]
+
+For each size it fills a temporary database (50 clients, 200 topics, ~1%
+failures, plus a "retired" client seen only in the first 100 rows) and
+times the `view-logs` shapes -- newest 50 rows filtered by client_id,
+topic, action+success, success=0 and the combined client_id+action,
+client_id+action+success=0 and topic+success=0 -- plus the web UI's
+`WHERE id > ?` poll.
+Without indexes a filter is only cheap while matches are common among the
+newest rows; the retired client shows the full scan behind it.  Each
+cell is the median of --repeat runs.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import CREATE_LOGS_INDEXES_SQL, init_db
+
+INSERT = ("INSERT INTO logs(timestamp, client_id, topic, action, success, details) "
+          "VALUES (?,?,?,?,?,?)")
+ACTIONS = ["CONNECT", "SUBSCRIBE", "PUBLISH", "DISCONNECT"]
+
+QUERIES = [
+    ("client_id",      "client_id = ?",               ("client7",)),
+    ("retired client", "client_id = ?",               ("retired",)),
+    ("topic",          "topic = ?",                   ("school/room42",)),
+    ("action+success", "action = ? AND success = ?",  ("SUBSCRIBE", 0)),
+    ("failures",       "success = ?",                 (0,)),
+    # combined filters
+    ("client+action",  "client_id = ? AND action = ?", ("client7", "SUBSCRIBE")),
+    ("client+failed",  "client_id = ? AND action = ? AND success = ?",
+                       ("client7", "SUBSCRIBE", 0)),
+    ("topic+failures", "topic = ? AND success = ?",   ("school/room42", 0)),
+]
+VIEW_SQL = ("SELECT timestamp, client_id, topic, action, success, details "
+            "FROM logs WHERE {where} ORDER BY id DESC LIMIT 50")
+POLL_SQL = "SELECT * FROM logs WHERE id > ? ORDER BY id ASC"
+
+
+def fill(db, start, count, rng):
+    rows = []
+    for i in range(start, start + count):
+        rows.append((f"2024-01-01 00:00:{i % 60:02d}",
+                     f"client{rng.randrange(50)}" if i >= 100 else "retired",
+                     f"school/room{rng.randrange(200)}",
+                     rng.choice(ACTIONS),
+                     0 if rng.random() < 0.01 else 1,
+                     "detail " + "x" * 60))
+        if len(rows) == 10_000:
+            db.executemany(INSERT, rows)
+            rows = []
+    if rows:
+        db.executemany(INSERT, rows)
+
+
+def median_ms(db, sql, params, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.query(sql, params)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    p.add_argument("--sizes", default="10000,100000,1000000")
+    p.add_argument("--repeat", type=int, default=20)
+    args = p.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    rng = random.Random(1)
+
+    names = [q[0] for q in QUERIES] + ["poll id>?"]
+    print(f"{'rows':>9} {'indexes':<8} " + " ".join(f"{n:>15}" for n in names))
+    with tempfile.TemporaryDirectory() as tmp:
+        db = EncryptedSQLiteDB(os.path.join(tmp, "bench.db"),
+                               os.path.join(tmp, "bench.key"))
+        init_db(db)
+        have = 0
+        for size in sizes:
+            fill(db, have, size - have, rng)
+            have = size
+            for indexed in (False, True):
+                for stmt in CREATE_LOGS_INDEXES_SQL:
+                    if indexed:
+                        db.execute(stmt)
+                    else:
+                        name = stmt.split("EXISTS ")[1].split()[0]
+                        db.execute(f"DROP INDEX IF EXISTS {name}")
+                cells = [median_ms(db, VIEW_SQL.format(where=where), params,
+                                   args.repeat)
+                         for _, where, params in QUERIES]
+                cells.append(median_ms(db, POLL_SQL, (size - 10,), args.repeat))
+                print(f"{size:>9} {'yes' if indexed else 'no':<8} "
+                      + " ".join(f"{c:>13.2f}ms" for c in cells))
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
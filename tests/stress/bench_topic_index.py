@@ -0,0 +1,83 @@
+# tests/stress/bench_topic_index.py
+"""
+Microbenchmark: topic-trie subscription index vs. the old linear list scan.
+
+    python -m tests.stress.bench_topic_index
+
+For 1k, 10k and 100k subscription filters it times how long matching one
+PUBLISH topic takes with each structure.
+"""
+
+import random
+import time
+
+from broker.topic_trie import TopicTrie, match_topic
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def make_filters(n: int, rnd: random.Random):
+    """A realistic mix: mostly exact device topics, some '+' and '#'."""
+    filters = []
+    for i in range(n):
+        site, dev = f"site{i % 50}", f"dev{i}"
+        kind = rnd.random()
+        if kind < 0.80:
+            filters.append(f"school/{site}/{dev}/temp")
+        elif kind < 0.95:
+            filters.append(f"school/{site}/+/temp")
+        else:
+            filters.append(f"school/{site}/#")
+    return filters
+
+
+def make_topics(n_filters: int, count: int, rnd: random.Random):
+    return [
+        f"school/site{rnd.randrange(50)}/dev{rnd.randrange(n_filters)}/temp"
+        for _ in range(count)
+    ]
+
+
+def bench_list(subs, topics):
+    start = time.perf_counter()
+    hits = 0
+    for topic in topics:
+        for cid, w, filt in subs:
+            if match_topic(filt, topic):
+                hits += 1
+    return (time.perf_counter() - start) / len(topics), hits
+
+
+def bench_trie(trie, topics):
+    start = time.perf_counter()
+    hits = 0
+    for topic in topics:
+        hits += len(trie.match(topic))
+    return (time.perf_counter() - start) / len(topics), hits
+
+
+def main():
+    rnd = random.Random(42)
+    print(f"{'filters':>8} {'list scan':>12} {'trie':>12} {'speedup':>8}")
+    for n in SIZES:
+        filters = make_filters(n, rnd)
+        subs = [(f"c{i}", None, f) for i, f in enumerate(filters)]
+        trie = TopicTrie()
+        for cid, w, f in subs:
+            trie.insert(f, cid, w)
+
+        # keep the O(N) side affordable at 100k filters
+        list_topics = make_topics(n, max(5, 20_000 // n), rnd)
+        trie_topics = make_topics(n, 5_000, rnd)
+
+        t_list, hits_list = bench_list(subs, list_topics)
+        t_trie, hits_trie = bench_trie(trie, list_topics)
+        assert hits_list == hits_trie, "trie and list scan disagree"
+        t_trie, _ = bench_trie(trie, trie_topics)
+
+        print(f"{n:>8} {t_list * 1e6:>10.1f}µs {t_trie * 1e6:>10.2f}µs "
+              f"{t_list / t_trie:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
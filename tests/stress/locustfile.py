@@ -6,7 +6,7 @@ from locust import User, task, constant
 import config.settings as settings
 
 HOST        = settings.HOST
-PORT        = settings.PORT
+PORT        = settings.MQTT_PORT    # binary MQTT listener; PORT speaks JSON
 CA_CERT     = settings.CA_CERT
 CLIENT_CERT = settings.SERVER_CERT
 CLIENT_KEY  = settings.SERVER_KEY
@@ -13,26 +13,28 @@ import config.settings as settings
 TEST_PORT = 1884
 
 @pytest.fixture(scope="session", autouse=True)
-def test_env(tmp_path_factory, monkeypatch):
+def test_env(tmp_path_factory):
     # 1) Temporary DB & key
     tmp = tmp_path_factory.mktemp("data")
     db_path = tmp / "test.db"
     key_path = tmp / "test.key"
     # ensure key file exists
-    from database.encrypted_db import generate_key
-    k = generate_key()
+    from cryptography.fernet import Fernet
+    k = Fernet.generate_key()
     key_path.write_bytes(k)
 
-    monkeypatch.setattr(settings, "DB_PATH", str(db_path))
-    monkeypatch.setattr(settings, "FERNET_KEY_PATH", str(key_path))
-    # override port
-    monkeypatch.setattr(settings, "PORT", TEST_PORT)
+    # the monkeypatch fixture is function-scoped; patch for the session
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(settings, "DB_PATH", str(db_path))
+        monkeypatch.setattr(settings, "FERNET_KEY_PATH", str(key_path))
+        # override port
+        monkeypatch.setattr(settings, "PORT", TEST_PORT)
 
-    yield
+        yield
 
-@pytest.fixture(scope="session", autouse=True)
-def broker_server():
-    """Start the MQTT broker in a background thread."""
+@pytest.fixture(scope="session")
+def broker_server(test_env):
+    """Start the MQTT broker in a background thread (tests ask for it)."""
     server = BrokerServer(host="127.0.0.1", port=TEST_PORT)
     thr = threading.Thread(
         target=lambda: asyncio.run(server.start()),
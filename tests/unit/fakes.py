@@ -0,0 +1,57 @@
+import asyncio
+import json
+
+
+class FakeTransport:
+    """Records abort(); ``on_abort`` runs as well (e.g. a reader's feed_eof)."""
+    def __init__(self, on_abort=None):
+        self.aborted = False
+        self.on_abort = on_abort
+
+    def abort(self):
+        self.aborted = True
+        if self.on_abort is not None:
+            self.on_abort()
+
+
+class FakeWriter:
+    """
+    StreamWriter stand-in that collects written frames.
+
+    ``peer`` is its peername.  With ``blocked``, drain() waits until
+    ``unblock`` is set.  With a ``reader``, the connection stays open
+    until the broker aborts it: the reader then sees EOF.
+    """
+    def __init__(self, peer=("10.0.0.1", 1000), blocked=False, reader=None):
+        self.frames = []
+        self.peer = peer
+        self.transport = FakeTransport(reader.feed_eof if reader else None)
+        self.unblock = asyncio.Event()
+        if not blocked:
+            self.unblock.set()
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return self.peer if name == "peername" else None
+
+    def write(self, data):
+        self.frames.append(data)
+
+    def writelines(self, data):
+        self.frames.extend(data)
+
+    async def drain(self):
+        await self.unblock.wait()
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+    def data(self) -> bytes:
+        return b"".join(self.frames)
+
+    def packets(self):
+        """The JSON packets written so far."""
+        return [json.loads(line) for line in self.data().splitlines()]
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+
+from auth.acl import CompiledACL
+from broker.session import SessionManager
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db
+
+
+def test_compiled_acl_rules():
+    acl = CompiledACL([
+        ("school/#", 1, 1),
+        ("lab/+/temp", 1, 0),
+        ("home/room1", 0, 1),
+    ])
+    assert acl.can_publish("school/a/b")
+    assert acl.can_publish("lab/x/temp")
+    assert not acl.can_publish("lab/x/humidity")
+    assert not acl.can_publish("home/room1")
+
+    assert acl.can_subscribe("school/#")
+    assert acl.can_subscribe("home/room1/#")    # prefix rule
+    assert acl.can_subscribe("home/+/temp")     # parent rule
+    assert not acl.can_subscribe("lab/+/temp")  # publish-only row
+    # memoized decisions give the same answer
+    assert acl.can_publish("school/a/b") and not acl.can_publish("lab/x/humidity")
+
+
+def test_decision_lru_is_bounded():
+    acl = CompiledACL([("a/#", 1, 0)], cache_size=2)
+    for t in ("a/1", "a/2", "a/3"):
+        acl.can_publish(t)
+    assert list(acl._decisions) == [("pub", "a/2"), ("pub", "a/3")]
+
+
+@pytest.mark.asyncio
+async def test_acl_table_changes_invalidate_cache(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "acl.db"), str(tmp_path / "acl.key"))
+    init_db(db)
+    db.execute("INSERT INTO users(username, password_hash, role_id) VALUES ('u', 'x', 1)")
+    db.execute("INSERT INTO acls(user_id, topic, can_publish) VALUES (1, 'a/#', 1)")
+    mgr = SessionManager(AsyncEncryptedDB(db))
+    await mgr.start(poll_interval=0.05)
+    user = {"id": 1}
+
+    assert await mgr.can_publish(user, "a/x")
+    assert not await mgr.can_publish(user, "b/x")
+
+    # another process (admin CLI / web UI) edits the table
+    other = EncryptedSQLiteDB(str(tmp_path / "acl.db"), str(tmp_path / "acl.key"))
+    before = mgr.auth.acl_version()
+    other.execute("INSERT INTO acls(user_id, topic, can_publish) VALUES (1, 'b/#', 1)")
+    assert mgr.auth.acl_version() == before + 1
+
+    # cached decision until the watcher notices the version change
+    assert not await mgr.can_publish(user, "b/x")
+    await asyncio.sleep(0.2)
+    assert mgr.acl_version == before + 1
+    assert await mgr.can_publish(user, "b/x")
+    await mgr.close()
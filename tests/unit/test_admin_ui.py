@@ -1,3 +1,7 @@
+import json
+import socket
+
+import eventlet
 import pytest
 from admin.web import app, db, init_db
 import config.settings as settings
@@ -44,18 +48,28 @@ def test_user_crud_and_acl_delete(client):
     assert b"deleted" in rv2.data
     assert b"foo/bar" not in rv2.data
 
-def test_live_logs_socketio(client):
+def test_live_logs_socketio(client, tmp_path, monkeypatch):
     login(client)
+    # stand-in broker event feed
+    path = str(tmp_path / "events.sock")
+    monkeypatch.setattr(settings, "EVENT_FEED_SOCKET", path)
+    feed = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    feed.bind(path)
+    feed.listen(1)
+    feed.settimeout(5)
     socketio = app.extensions["socketio"]
     # connect socket
     client.environ_base['wsgi.url_scheme'] = 'http'
     ws = socketio.test_client(app, namespace="/logs")
-    # insert a log entry directly
-    db.execute(
-      "INSERT INTO logs(client_id,topic,action,success,details) VALUES (?,?,?,?,?)",
-      ("cid","t","PUBLISH",1,"d")
-    )
-    # give background poller a sec
-    pytest.sleep(1.2)
+    # the web app follows the feed; the broker writes a committed record
+    conn, _ = feed.accept()
+    conn.sendall(json.dumps({
+        "type": "log", "timestamp": "2024-01-01 00:00:00", "client_id": "cid",
+        "topic": "t", "action": "PUBLISH", "success": 1, "details": "d",
+    }).encode() + b"\n")
+    eventlet.sleep(0.2)
     received = ws.get_received("/logs")
-    assert any(msg["name"]=="new_log" for msg in received)
+    assert any(msg["name"]=="new_log" and msg["args"][0]["client_id"]=="cid"
+               for msg in received)
+    conn.close()
+    feed.close()
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import bcrypt
+import pytest
+
+from broker.admission import AdmissionControl, TokenBucket
+from broker.metrics import THROTTLE_SECONDS
+from broker.router import Router
+from broker.session import SessionManager
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db, insert_user
+from fakes import FakeWriter
+
+NO_LIMIT = (None, 0, None, 0)
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=10, burst=3)
+    now = bucket.stamp
+    assert [bucket.take(1, now) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(1, now) == pytest.approx(0.1)
+    assert bucket.take(1, now + 0.1) == pytest.approx(0.1)    # still one behind
+    assert bucket.take(1, now + 1.0) == 0
+    # larger than the burst: delayed, not refused
+    assert bucket.take(50, now + 10) == pytest.approx(4.7)
+
+
+def test_user_buckets_are_shared_and_released():
+    adm = AdmissionControl(client_rates=NO_LIMIT,
+                           user_rates=(None, 0, 100, 100))
+    user = {"id": 7}
+    a, b = adm.throttle("a", user), adm.throttle("b", user)
+    assert a.limits == b.limits and adm.stats()["limited"] == 1
+    assert a.charge(100) == 0
+    assert b.charge(50) == pytest.approx(0.5, abs=0.01)
+    adm.release(a)
+    assert adm.stats()["limited"] == 1
+    adm.release(b)
+    assert adm.stats()["limited"] == 0
+    assert AdmissionControl(client_rates=NO_LIMIT,
+                            user_rates=NO_LIMIT).throttle("c", user) is None
+
+
+def test_session_cap_admits_takeovers_and_resumes():
+    mgr = SimpleNamespace(sessions={"on": 1}, offline_sessions={"off": 1})
+    adm = AdmissionControl(max_sessions=2)
+    assert adm.admit(mgr, "on") and adm.admit(mgr, "off")
+    assert not adm.admit(mgr, "new") and adm.rejected == 1
+    assert AdmissionControl(max_sessions=None).admit(mgr, "new")
+
+
+@pytest.mark.asyncio
+async def test_handshake_slots_are_bounded():
+    adm = AdmissionControl(max_handshakes=1)
+    entered = []
+
+    async def connect(name):
+        async with adm.handshake():
+            entered.append(name)
+            await asyncio.sleep(0.05)
+
+    tasks = [asyncio.create_task(connect(n)) for n in "ab"]
+    await asyncio.sleep(0.01)
+    assert entered == ["a"] and adm.stats()["waiting"] == 1
+    await asyncio.gather(*tasks)
+    assert entered == ["a", "b"] and adm.active == adm.waiting == 0
+
+
+@pytest.fixture
+def adb(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "a.db"), str(tmp_path / "a.key"))
+    init_db(db)
+    role = db.query("SELECT id FROM roles LIMIT 1")[0]["id"]
+    uid = insert_user(db, "dev", bcrypt.hashpw(b"pw", bcrypt.gensalt(4)), role)
+    db.execute("INSERT INTO acls(user_id, topic, can_subscribe, can_publish) "
+               "VALUES (?,?,?,?)", (uid, "#", 1, 1))
+    db.execute("INSERT INTO acls(user_id, topic, can_subscribe, can_publish) "
+               "VALUES (?,?,?,?)", (uid, "cmd", 1, 0))
+    adb = AsyncEncryptedDB(db)
+    yield adb
+    adb.close()
+    db.close()
+
+
+def _feed(*packets):
+    reader = asyncio.StreamReader()
+    for p in packets:
+        reader.feed_data((json.dumps(p) + "\n").encode())
+    reader.feed_eof()
+    return reader
+
+
+CONNECT = {"type": "CONNECT", "client_id": "dev-1",
+           "username": "dev", "password": "pw"}
+
+
+@pytest.mark.asyncio
+async def test_publisher_over_its_rate_is_paused_not_dropped(adb):
+    router = Router(session_mgr=SessionManager(adb), db=adb,
+                    admission=AdmissionControl(client_rates=(20, 2, None, 0),
+                                               user_rates=NO_LIMIT))
+    publishes = [{"type": "PUBLISH", "topic": "t", "payload": "x",
+                  "qos": 1, "id": i} for i in range(1, 6)]
+    writer = FakeWriter()
+    paused = THROTTLE_SECONDS.value
+    started = time.monotonic()
+    await router.handle_client(_feed(CONNECT, *publishes), writer)
+    elapsed = time.monotonic() - started
+
+    packets = writer.packets()
+    assert packets[0]["type"] == "CONNACK" and packets[0]["success"]
+    # every PUBLISH was taken: 2 in the burst, 3 more at 20/s
+    assert [p["id"] for p in packets[1:]] == [1, 2, 3, 4, 5]
+    assert elapsed >= 0.14 and THROTTLE_SECONDS.value - paused >= 0.14
+    await router.close()
+    await router.session_mgr.close()
+
+
+@pytest.mark.asyncio
+async def test_connect_over_session_cap_is_refused(adb):
+    router = Router(session_mgr=SessionManager(adb), db=adb,
+                    admission=AdmissionControl(max_sessions=0))
+    writer = FakeWriter()
+    await router.handle_client(_feed(CONNECT), writer)
+    assert writer.packets() == [{"type": "CONNACK", "success": False,
+                                 "return_code": 3}]
+    assert router.admission.rejected == 1
+    await router.close()
+    await router.session_mgr.close()
+
+
+@pytest.mark.asyncio
+async def test_reconnect_with_same_client_id_takes_over(adb):
+    router = Router(session_mgr=SessionManager(adb), db=adb)
+    connect = dict(CONNECT, clean_session=False)
+    subscribe = {"type": "SUBSCRIBE", "topic": "cmd", "qos": 1}
+    old_reader = asyncio.StreamReader()
+    old_reader.feed_data((json.dumps(connect) + "\n"
+                          + json.dumps(subscribe) + "\n").encode())
+    old_writer = FakeWriter(reader=old_reader)
+    old = asyncio.create_task(router.handle_client(old_reader, old_writer))
+    await asyncio.sleep(0.3)
+    first = router.session_mgr.sessions["dev-1"]
+
+    new_reader = asyncio.StreamReader()
+    new_reader.feed_data((json.dumps(connect) + "\n").encode())
+    new_writer = FakeWriter(reader=new_reader)
+    new = asyncio.create_task(router.handle_client(new_reader, new_writer))
+    await asyncio.wait_for(old, 5)          # the first connection was dropped
+    await asyncio.sleep(0.3)
+
+    # the persistent session was stored by the old connection's cleanup,
+    # then resumed on the new one
+    second = router.session_mgr.sessions["dev-1"]
+    assert second is first and second.online and second.writer is new_writer
+    assert new_writer.packets()[0] == {"type": "CONNACK", "success": True,
+                                       "session_present": True}
+    # the old connection's cleanup left the resumed subscription alone
+    assert "cmd" in second.subscriptions
+    assert [e for _, e in router.subscriptions.match("cmd")] == [(second, 1)]
+
+    new_reader.feed_eof()
+    await new
+    await router.close()
+    await router.session_mgr.close()
+
+
+@pytest.mark.asyncio
+async def test_delivery_uses_the_granted_qos(adb):
+    router = Router(session_mgr=SessionManager(adb), db=adb)
+    user = await router.session_mgr.authenticate("dev", "pw")
+    writers = {}
+    for cid, granted in (("sub0", 0), ("sub2", 2)):
+        writers[cid] = FakeWriter()
+        sess, _ = router.session_mgr.create_session(cid, writers[cid])
+        assert await router._handle_subscribe(sess, user, "cmd", granted)
+    router._dispatch_publish("cmd", b"x", 1)
+    await asyncio.sleep(0.05)
+
+    (low,) = writers["sub0"].packets()
+    (high,) = writers["sub2"].packets()
+    assert low["qos"] == 0 and "id" not in low      # downgraded
+    assert high["qos"] == 1 and high["id"] == 1     # never upgraded
+    for cid in writers:
+        await router.session_mgr.terminate_session(cid)
+    await router.close()
+    await router.session_mgr.close()
+
+
+@pytest.mark.asyncio
+async def test_qos2_state_stays_with_the_connection_own_session(adb):
+    router = Router(session_mgr=SessionManager(adb), db=adb)
+    reader = asyncio.StreamReader()
+    reader.feed_data((json.dumps(CONNECT) + "\n").encode())
+    writer = FakeWriter(reader=reader)
+    task = asyncio.create_task(router.handle_client(reader, writer))
+    await asyncio.sleep(0.3)
+    own = router.session_mgr.sessions["dev-1"]
+    # a takeover that timed out: a newer connection owns the client_id
+    other, _ = router.session_mgr.create_session("dev-1", FakeWriter())
+    publish = {"type": "PUBLISH", "topic": "t", "payload": "x", "qos": 2, "id": 7}
+    reader.feed_data((json.dumps(publish) + "\n").encode())
+    await asyncio.sleep(0.1)
+    assert 7 in own.pending_pubrec and not other.pending_pubrec
+    reader.feed_data((json.dumps({"type": "PUBREL", "id": 7}) + "\n").encode())
+    await asyncio.sleep(0.1)
+    assert [p["type"] for p in writer.packets()] == ["CONNACK", "PUBREC", "PUBCOMP"]
+    assert not own.pending_pubrec
+
+    reader.feed_eof()
+    await task
+    assert router.session_mgr.sessions["dev-1"] is other
+    await router.session_mgr.terminate_session("dev-1")
+    await router.close()
+    await router.session_mgr.close()
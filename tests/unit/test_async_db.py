@@ -0,0 +1,27 @@
+import threading
+import pytest
+
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db
+
+
+@pytest.mark.asyncio
+async def test_queries_run_on_dedicated_thread(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "a.db"), str(tmp_path / "a.key"))
+    init_db(db)
+    adb = AsyncEncryptedDB(db)
+
+    await adb.executemany(
+        "INSERT INTO logs(client_id, topic, action, success, details) VALUES (?,?,?,?,?)",
+        [("c1", "t", "CONNECT", 1, ""), ("c2", "t", "CONNECT", 1, "")]
+    )
+    rows = await adb.query("SELECT client_id FROM logs ORDER BY id")
+    assert [r["client_id"] for r in rows] == ["c1", "c2"]
+
+    names = {await adb.run(lambda: threading.current_thread().name)
+             for _ in range(3)}
+    assert len(names) == 1
+    assert names != {threading.current_thread().name}
+    adb.close()
+    db.close()
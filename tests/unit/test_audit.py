@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+
+from broker.audit import AuditLogWriter
+
+
+class FakeDB:
+    def __init__(self):
+        self.batches = []
+
+    async def executemany(self, sql, rows):
+        self.batches.append(list(rows))
+
+
+@pytest.mark.asyncio
+async def test_flush_by_batch_size_and_on_close():
+    db = FakeDB()
+    audit = AuditLogWriter(db, capacity=100, batch_size=3, flush_interval=60)
+    audit.start()
+    for i in range(4):
+        audit.write(f"c{i}", None, "CONNECT", True)
+    await asyncio.sleep(0.01)
+    # one full batch went out in a single executemany
+    assert len(db.batches) == 1 and len(db.batches[0]) == 4
+    audit.write("c9", "t", "SUBSCRIBE", False, "ACL denied")
+    assert audit.pending == 1
+
+    await audit.close()
+    assert db.batches[-1][0][1:] == ("c9", "t", "SUBSCRIBE", 0, "ACL denied")
+    assert audit.written == 5 and audit.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_flush_by_interval():
+    db = FakeDB()
+    audit = AuditLogWriter(db, batch_size=1000, flush_interval=0.02)
+    audit.start()
+    audit.write("c1", None, "CONNECT", True)
+    await asyncio.sleep(0.1)
+    assert db.batches and audit.pending == 0
+    await audit.close()
+
+
+def test_ring_overflow_counts_drops_and_backpressure():
+    audit = AuditLogWriter(FakeDB(), capacity=4, batch_size=1000)
+    for i in range(6):
+        audit.write(f"c{i}", None, "CONNECT", True)
+    assert audit.pending == 4
+    assert audit.dropped == 2
+    assert audit.backpressure == 3
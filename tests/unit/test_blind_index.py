@@ -0,0 +1,57 @@
+import sqlite3
+import pytest
+
+from auth.auth import AuthManager
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db, insert_user
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "u.db"), str(tmp_path / "u.key"))
+    init_db(db)
+    yield db
+    db.close()
+
+
+def test_lookup_uses_index_on_encrypted_username(db):
+    uid = insert_user(db, "Teacher1", b"hash", 2)
+    row = db.query("SELECT username, username_bidx FROM users")[0]
+    assert b"Teacher1" not in row["username"]
+    assert row["username_bidx"] == db.blind_index("teacher1")   # case-folded
+
+    assert AuthManager(db).lookup_user("TEACHER1")["id"] == uid
+    assert AuthManager(db).lookup_user("teacher2") is None
+    plan = db.query("EXPLAIN QUERY PLAN SELECT id FROM users WHERE username_bidx = ?",
+                    (db.blind_index("x"),))
+    assert "idx_users_username_bidx" in plan[0]["detail"]
+
+    with pytest.raises(sqlite3.IntegrityError):
+        insert_user(db, "teacher1", b"other", 2)
+
+
+def test_blind_index_is_keyed(tmp_path, db):
+    other = EncryptedSQLiteDB(str(tmp_path / "o.db"), str(tmp_path / "o.key"))
+    assert other.blind_index("alice") != db.blind_index("alice")
+    assert db.blind_index("ﬁle") == db.blind_index("FILE")      # NFKC
+    other.close()
+
+
+def test_init_db_migrates_plaintext_usernames(tmp_path):
+    path, key = str(tmp_path / "old.db"), str(tmp_path / "old.key")
+    old = sqlite3.connect(path)
+    old.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "username BLOB NOT NULL, password_hash BLOB NOT NULL, "
+                "role_id INTEGER NOT NULL)")
+    old.execute("INSERT INTO users(username, password_hash, role_id) "
+                "VALUES ('legacy', 'h', 1)")
+    old.commit()
+    old.close()
+
+    db = EncryptedSQLiteDB(path, key)
+    init_db(db)
+    init_db(db)                                     # idempotent
+    assert AuthManager(db).lookup_user("legacy")["id"] == 1
+    rows = db.query_decrypted("SELECT username FROM users", columns=("username",))
+    assert rows == [{"username": "legacy"}]
+    db.close()
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+
+from broker.cluster import ClusterLink
+
+
+async def _wait_connected(*links):
+    for _ in range(100):
+        if all(len(l._peers) == l.workers - 1 for l in links):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("workers never connected")
+
+
+@pytest.mark.asyncio
+async def test_publish_forwarded_to_peer(tmp_path):
+    got0, got1 = [], []
+    w0 = ClusterLink(0, 2, name="t", socket_dir=str(tmp_path))
+    w1 = ClusterLink(1, 2, name="t", socket_dir=str(tmp_path))
+    await w0.start(lambda *a: got0.append(a))
+    await w1.start(lambda *a: got1.append(a))
+    await _wait_connected(w0, w1)
+
+    w0.forward("school/a", b"\x00hello", 1, True)
+    w0.forward("school/b", b"", 0, False)
+    for _ in range(100):
+        if len(got1) == 2:
+            break
+        await asyncio.sleep(0.01)
+
+    assert got1 == [("school/a", b"\x00hello", 1, True),
+                    ("school/b", b"", 0, False)]
+    assert got0 == []           # never echoed back to the sender
+    assert w0.forwarded == 2 and w1.received == 2
+
+    await w0.close()
+    await w1.close()
+
+
+@pytest.mark.asyncio
+async def test_forward_drops_when_peer_missing(tmp_path):
+    w0 = ClusterLink(0, 2, name="t", socket_dir=str(tmp_path))
+    await w0.start(lambda *a: None)
+    w0.forward("a", b"x", 0, False)
+    assert w0.dropped == 1 and w0.forwarded == 0
+    await w0.close()
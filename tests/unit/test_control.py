@@ -0,0 +1,92 @@
+import asyncio
+import urllib.error
+
+import pytest
+
+from broker.control import ControlServer, control_request, session_path
+from broker.router import Router
+from broker.session import SessionManager
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db
+from fakes import FakeWriter
+
+
+@pytest.fixture
+def router(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "c.db"), str(tmp_path / "c.key"))
+    init_db(db)
+    adb = AsyncEncryptedDB(db)
+    yield Router(session_mgr=SessionManager(adb), db=adb)
+    adb.close()
+    db.close()
+
+
+def _connect(router, cid, clean=True):
+    sess, _ = router.session_mgr.create_session(
+        cid, FakeWriter(("10.0.0.1", 1000 + len(router.session_mgr.sessions))),
+        will={"topic": "lwt/" + cid, "payload": b"bye"}, clean_session=clean)
+    return sess
+
+
+@pytest.mark.asyncio
+async def test_paged_session_listing(router):
+    for i in range(5):
+        _connect(router, f"c{i}")
+    c1 = router.session_mgr.sessions["c1"]
+    c1.subscriptions["a/#"] = (router.subscriptions.insert("a/#", "c1", (c1, 0)), 0)
+    ctl = ControlServer(router, max_page=2)
+
+    status, page = ctl.list_sessions({"offset": "1", "limit": "10"})
+    assert status == 200
+    assert [s["client_id"] for s in page["sessions"]] == ["c1", "c2"]   # capped
+    assert (page["total"], page["next"]) == (5, 3)
+    first = page["sessions"][0]
+    assert first["online"] and first["peer"] == "10.0.0.1:1001"
+    assert (first["subscriptions"], first["inflight"], first["queued"]) == (1, 0, 0)
+    assert first["will_topic"] == "lwt/c1"
+
+    _, last = ctl.list_sessions({"offset": "4"})
+    assert [s["client_id"] for s in last["sessions"]] == ["c4"] and last["next"] is None
+    assert ctl.list_sessions({"state": "bogus"})[0] == 400
+
+    status, detail = await ctl.dispatch("GET", "/sessions/c1")
+    assert status == 200 and detail["filters"] == ["a/#"]
+    assert (await ctl.dispatch("GET", "/sessions/nope"))[0] == 404
+    assert (await ctl.dispatch("DELETE", "/sessions/c1"))[0] == 405
+    for sess in list(router.session_mgr.sessions.values()):
+        await sess.stop()
+
+
+@pytest.mark.asyncio
+async def test_forced_disconnect_over_http(router):
+    live = _connect(router, "a/b")              # needs URL quoting
+    stored = _connect(router, "durable", clean=False)
+    await router.session_mgr.terminate_session("durable")
+    ctl = ControlServer(router, host="127.0.0.1", port=0, token="s3cret")
+    await ctl.start()
+
+    def call(method, path, token="s3cret"):
+        return control_request(method, path, port=ctl.port, token=token)
+
+    with pytest.raises(urllib.error.HTTPError) as err:
+        await asyncio.to_thread(call, "GET", "/sessions", "wrong")
+    assert err.value.code == 401
+
+    res = await asyncio.to_thread(call, "GET", "/sessions?state=offline")
+    assert [s["client_id"] for s in res["sessions"]] == ["durable"]
+    assert not res["sessions"][0]["online"] and res["sessions"][0]["offline_for"] >= 0
+
+    res = await asyncio.to_thread(call, "POST", session_path("a/b", "disconnect"))
+    assert res == {"client_id": "a/b", "disconnected": True, "discarded": False}
+    assert live.writer.transport.aborted and not live.online
+
+    await asyncio.to_thread(call, "POST", session_path("durable", "disconnect") + "?discard=1")
+    assert "durable" not in router.session_mgr.offline_sessions
+    with pytest.raises(urllib.error.HTTPError) as err:
+        await asyncio.to_thread(call, "POST", session_path("durable", "disconnect"))
+    assert err.value.code == 404
+
+    await ctl.close()
+    await live.stop()
+    await stored.stop()
@@ -0,0 +1,65 @@
+import sqlite3
+import pytest
+
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db
+
+
+def _db(tmp_path, **kw):
+    db = EncryptedSQLiteDB(str(tmp_path / "p.db"), str(tmp_path / "p.key"), **kw)
+    db.execute("CREATE TABLE IF NOT EXISTS t (v INTEGER)")
+    return db
+
+
+def test_profile_pragmas(tmp_path):
+    db = _db(tmp_path, profile="broker")
+    assert db.pragma("journal_mode") == "wal"
+    assert db.pragma("synchronous") == 1            # NORMAL
+    assert db.pragma("busy_timeout") == 5000
+    db.close()
+
+    compat = _db(tmp_path, profile={"busy_timeout": 10})
+    assert compat.pragma("busy_timeout") == 10
+    compat.close()
+    with pytest.raises(ValueError):
+        _db(tmp_path, profile={"journal_mode": "WAL; DROP TABLE t"})
+
+
+def test_transaction_commits_once_or_rolls_back(tmp_path):
+    db = _db(tmp_path)
+    other = _db(tmp_path)       # second connection, like the admin app
+
+    with db.transaction():
+        db.execute("INSERT INTO t VALUES (1)")
+        with db.transaction():                       # nested: joins
+            db.executemany("INSERT INTO t VALUES (?)", [(2,), (3,)])
+        assert db.conn.in_transaction
+        assert other.query("SELECT COUNT(*) AS n FROM t")[0]["n"] == 0
+    assert other.query("SELECT COUNT(*) AS n FROM t")[0]["n"] == 3
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.transaction(immediate=True):
+            db.execute("INSERT INTO t VALUES (4)")
+            raise sqlite3.IntegrityError("boom")
+    assert db.query("SELECT COUNT(*) AS n FROM t")[0]["n"] == 3
+    assert not db.conn.in_transaction
+    other.close()
+    db.close()
+
+
+@pytest.mark.asyncio
+async def test_run_in_transaction(tmp_path):
+    db = _db(tmp_path)
+    init_db(db)
+    adb = AsyncEncryptedDB(db)
+
+    def write(db, n):
+        db.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(n)])
+        return db.conn.in_transaction
+
+    assert await adb.run_in_transaction(write, 5)
+    rows = await adb.query("SELECT COUNT(*) AS n FROM t")
+    assert rows[0]["n"] == 5
+    adb.close()
+    db.close()
@@ -0,0 +1,43 @@
+import pytest
+
+from database.encrypted_db import EncryptedSQLiteDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "b.db"), str(tmp_path / "b.key"),
+                           cache_size=2, batch_size=3, workers=2)
+    db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name BLOB, note BLOB)")
+    yield db
+    db.close()
+
+
+def test_bulk_roundtrip_matches_sql_functions(db):
+    names = [f"user{i % 4}" for i in range(10)]
+    notes = [None if i % 3 == 0 else f"n{i}" for i in range(10)]
+    tokens = db.encrypt_many(names)
+    assert len(set(tokens)) == 10                   # randomized, per value
+    db.executemany("INSERT INTO t(name, note) VALUES (?, ?)",
+                   zip(tokens, db.encrypt_many(notes)))
+
+    rows = db.query_decrypted("SELECT id, name, note FROM t ORDER BY id",
+                              columns=("name", "note"))
+    assert [r["name"] for r in rows] == names
+    assert [r["note"] for r in rows] == notes
+    scalar = db.query("SELECT decrypt(name) AS name FROM t ORDER BY id")
+    assert [r["name"] for r in scalar] == names
+
+
+def test_repeated_tokens_and_lru(db):
+    a, b, c = db.encrypt_many(["alice", "bob", "carol"])
+    assert db.decrypt_many([a, a, None, b], cache=True) == ["alice", "alice", None, "bob"]
+    assert db.cache_misses == 2 and db.cache_hits == 0
+
+    assert db.decrypt_many([a], cache=True) == ["alice"]
+    assert db.cache_hits == 1
+    db.decrypt_many([c], cache=True)                # evicts b (size 2)
+    assert list(db._cache) == [a, c]
+
+    db.execute("INSERT INTO t(name) VALUES (?)", (b,))
+    row = db.query("SELECT decrypt_cached(name) AS name FROM t")[0]
+    assert row["name"] == "bob" and b in db._cache
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from broker.audit import AuditLogWriter
+from broker.event_feed import EventFeed, feed_path, feed_paths, read_events
+
+
+class FakeDB:
+    async def executemany(self, sql, rows):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_committed_log_records_reach_every_listener(tmp_path):
+    feed = EventFeed(str(tmp_path / "events.sock"))
+    await feed.start()
+    readers = []
+    for _ in range(2):
+        r, w = await asyncio.open_unix_connection(feed.path)
+        readers.append((r, w))
+    await asyncio.sleep(0.01)
+    assert len(feed) == 2
+
+    audit = AuditLogWriter(FakeDB(), feed=feed, batch_size=100, flush_interval=60)
+    audit.write("c1", "t/1", "PUBLISH", True, "ok")
+    audit.write("c2", None, "CONNECT", False, "bad password")
+    with pytest.raises(asyncio.TimeoutError):   # nothing before the commit
+        await asyncio.wait_for(readers[0][0].readline(), 0.05)
+    await audit.flush()
+
+    for r, _ in readers:
+        first = json.loads(await r.readline())
+        second = json.loads(await r.readline())
+        assert first["type"] == "log" and first["client_id"] == "c1"
+        assert (second["action"], second["success"]) == ("CONNECT", 0)
+    assert feed.published == 2
+
+    readers[0][1].close()
+    await asyncio.sleep(0.01)
+    assert len(feed) == 1
+    readers[1][1].close()
+    await feed.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_listener_misses_events(tmp_path):
+    feed = EventFeed(str(tmp_path / "events.sock"), max_buffer=-1)
+    await feed.start()
+    _, w = await asyncio.open_unix_connection(feed.path)
+    await asyncio.sleep(0.01)
+    feed.publish([{"n": 1}, {"n": 2}])
+    assert feed.dropped == 2 and feed.published == 0
+    w.close()
+    await feed.close()
+
+
+@pytest.mark.asyncio
+async def test_blocking_reader_and_worker_paths(tmp_path):
+    base = str(tmp_path / "events.sock")
+    assert feed_path(base, 3) == str(tmp_path / "events-3.sock")
+    feeds = [EventFeed(feed_path(base, i)) for i in range(2)]
+    for f in feeds:
+        await f.start()
+    assert feed_paths(base) == [f.path for f in feeds]
+
+    got = []
+    t = threading.Thread(target=lambda: got.extend(read_events(feeds[1].path, 5)))
+    t.start()
+    while not len(feeds[1]):
+        await asyncio.sleep(0.01)
+    feeds[1].publish([{"type": "log", "client_id": "x"}])
+    await asyncio.sleep(0.01)
+    for f in feeds:
+        await f.close()
+    await asyncio.to_thread(t.join)
+    assert got == [{"type": "log", "client_id": "x"}]
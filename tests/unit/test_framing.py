@@ -0,0 +1,23 @@
+import json
+
+from broker.framing import PublishFrame, encode_packet
+
+
+def test_qos0_frame_is_shared():
+    frame = PublishFrame("school/demo", "hello", qos=0)
+    a, b = frame.encode(), frame.encode()
+    assert a is b
+    assert a == encode_packet({"type": "PUBLISH", "topic": "school/demo",
+                               "payload": "hello", "retain": False, "qos": 0})
+
+
+def test_qos1_frame_splices_packet_id():
+    frame = PublishFrame("school/demo", 'quote " and \n newline', qos=1)
+    for pid in (1, 42, 0xFFFF):
+        data = frame.encode(pid)
+        assert data.endswith(b"\n") and data.count(b"\n") == 1
+        assert json.loads(data) == {
+            "type": "PUBLISH", "topic": "school/demo",
+            "payload": 'quote " and \n newline',
+            "retain": False, "qos": 1, "id": pid,
+        }
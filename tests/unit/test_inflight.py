@@ -0,0 +1,118 @@
+import json
+import pytest
+
+from broker.framing import PublishFrame
+from broker.session import Session
+from broker.timer_wheel import TimerWheel
+from fakes import FakeWriter
+
+
+def _packets(sess):
+    out = [json.loads(f) for f in sess.outbound]
+    sess.outbound.clear()
+    return out
+
+
+def test_timer_wheel_fires_after_delay_and_cancels():
+    fired = []
+    wheel = TimerWheel(tick=1.0, slots=4, on_expire=fired.append)
+    wheel.schedule("a", 2)
+    wheel.schedule("b", 6)      # more than one revolution
+    wheel.schedule("c", 1)
+    wheel.cancel("c")
+    for _ in range(2):
+        wheel.advance()
+    assert fired == ["a"]
+    for _ in range(3):
+        wheel.advance()
+    assert fired == ["a"]
+    wheel.advance()
+    assert fired == ["a", "b"] and len(wheel) == 0
+
+
+@pytest.mark.asyncio
+async def test_window_holds_frames_until_acked():
+    sess = Session("c1", FakeWriter(), max_inflight=2)
+    for i in range(4):
+        assert sess.publish(PublishFrame("t", "m%d" % i, qos=1))
+    assert [p["id"] for p in _packets(sess)] == [1, 2]
+    assert len(sess.inflight) == 2 and len(sess.held) == 2
+
+    assert sess.puback(1)
+    assert not sess.puback(1)
+    assert [(p["payload"], p["id"]) for p in _packets(sess)] == [("m2", 3)]
+    assert sess.puback(3) and sess.puback(2)
+    assert [p["payload"] for p in _packets(sess)] == ["m3"]
+    assert list(sess.inflight) == [4] and not sess.held
+
+
+@pytest.mark.asyncio
+async def test_qos2_pubrec_pubrel_pubcomp():
+    sess = Session("c2", FakeWriter(), max_inflight=1)
+    sess.publish(PublishFrame("t", "x", qos=2))
+    sess.publish(PublishFrame("t", "y", qos=2))
+    _packets(sess)
+
+    assert not sess.pubcomp(1)               # not released yet
+    assert sess.pubrec(1)
+    assert _packets(sess) == [{"type": "PUBREL", "id": 1}]
+    assert sess.pubcomp(1)
+    assert [p["payload"] for p in _packets(sess)] == ["y"]
+
+
+@pytest.mark.asyncio
+async def test_unacked_frames_are_retransmitted_with_dup():
+    fired = []
+    wheel = TimerWheel(tick=1.0, slots=8, on_expire=fired.append)
+    sess = Session("c3", FakeWriter(), timers=wheel, retry_interval=2)
+    sess.publish(PublishFrame("t", "a", qos=1))
+    sess.publish(PublishFrame("t", "b", qos=2))
+    _packets(sess)
+    sess.puback(1)
+    assert (sess, 1) not in wheel and (sess, 2) in wheel
+
+    wheel.advance()
+    wheel.advance()
+    assert fired == [(sess, 2)]
+    sess.retransmit(2)
+    assert _packets(sess) == [{"type": "PUBLISH", "topic": "t", "payload": "b",
+                               "retain": False, "qos": 2, "id": 2, "dup": True}]
+    sess.pubrec(2)
+    _packets(sess)
+    sess.retransmit(2)
+    assert _packets(sess) == [{"type": "PUBREL", "id": 2}]
+    assert sess.retransmits == 2
+
+    sess.cancel_timers()
+    assert len(wheel) == 0
+
+
+@pytest.mark.asyncio
+async def test_packet_ids_skip_inflight_ones():
+    sess = Session("c4", FakeWriter(), max_inflight=10)
+    sess.next_msg_id = 0xFFFF
+    sess.publish(PublishFrame("t", "a", qos=1))     # 0xFFFF
+    sess.next_msg_id = 0xFFFF
+    assert sess.next_packet_id() == 1
+
+
+@pytest.mark.asyncio
+async def test_idle_session_allocates_no_containers():
+    sess = Session("c5", FakeWriter(), max_inflight=1)
+    assert not hasattr(sess, "__dict__")
+    idle = (sess.outbound, sess.held, sess.inflight, sess.pending_pubrec)
+
+    sess.publish(PublishFrame("t", "a", qos=1))
+    sess.publish(PublishFrame("t", "b", qos=1))
+    sess.store_pubrec(9, ("t", b"in", False))
+    assert len(sess.inflight) == len(sess.held) == len(sess.pending_pubrec) == 1
+
+    _packets(sess)
+    assert sess.puback(1)
+    _packets(sess)
+    assert sess.puback(2)
+    assert sess.release_pubrec(9) == ("t", b"in", False)
+    assert sess.release_pubrec(9) is None
+    # emptied maps and queues go back to the shared empty stand-ins
+    now = (sess.held, sess.inflight, sess.pending_pubrec)
+    assert all(a is b for a, b in zip(idle[1:], now))
@@ -0,0 +1,57 @@
+import io
+import json
+import logging
+
+from broker.log import JsonFormatter, configure_logging
+
+
+class _Loud:
+    reprs = 0
+
+    def __repr__(self):
+        _Loud.reprs += 1
+        return "loud"
+
+
+def _reset():
+    logging.getLogger("broker.router").setLevel(logging.NOTSET)
+    configure_logging(level="WARNING", module_levels={})
+
+
+def test_disabled_debug_never_formats_arguments():
+    configure_logging(level="INFO", module_levels={})
+    logging.getLogger("broker.router").debug("packet %r", _Loud())
+    assert _Loud.reprs == 0
+    _reset()
+
+
+def test_module_level_overrides_default(capsys):
+    configure_logging(level="WARNING", module_levels={"broker.router": "DEBUG"})
+    logging.getLogger("broker.router").debug("traced")
+    logging.getLogger("broker.session").info("quiet")
+    err = capsys.readouterr().err
+    assert "broker.router: traced" in err
+    assert "quiet" not in err
+    _reset()
+
+
+def test_queue_listener_writes_records(capsys):
+    listener = configure_logging(level="INFO", module_levels={}, use_queue=True)
+    logging.getLogger("broker.server").info("via queue")
+    listener.stop()             # drains the queue
+    assert "via queue" in capsys.readouterr().err
+    _reset()
+
+
+def test_json_formatter_includes_extra_fields():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger("test.json")
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.warning("dropped %d", 3, extra={"client_id": "c1"})
+    out = json.loads(stream.getvalue())
+    assert out["msg"] == "dropped 3"
+    assert out["client_id"] == "c1"
+    assert out["level"] == "WARNING" and out["logger"] == "test.json"
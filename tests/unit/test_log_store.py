@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+from broker.log_compactor import LogCompactor
+from database import log_store
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db
+
+NOW = datetime(2024, 6, 15, 12, 0, tzinfo=timezone.utc)
+INSERT = ("INSERT INTO logs(timestamp, client_id, topic, action, success, details) "
+          "VALUES (?,?,?,?,?,?)")
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "l.db"), str(tmp_path / "l.key"))
+    init_db(db)
+    yield db
+    db.close()
+
+
+def _fill(db, stamps):
+    db.executemany(INSERT, [(ts, f"c{i % 3}", "t", "PUBLISH", i % 2, "x" * 200)
+                            for i, ts in enumerate(stamps)])
+
+
+def test_view_logs_filters_use_indexes(db):
+    for where, index in [("client_id = ?", "idx_logs_client_id"),
+                         ("topic = ?", "idx_logs_topic"),
+                         ("action = ? AND success = ?", "idx_logs_action_success"),
+                         ("success = ?", "idx_logs_success"),
+                         ("client_id = ? AND action = ? AND success = ?",
+                          "idx_logs_client_action_success"),
+                         ("topic = ? AND success = ?", "idx_logs_topic_success")]:
+        plan = db.query(f"EXPLAIN QUERY PLAN SELECT * FROM logs WHERE {where} "
+                        "ORDER BY id DESC LIMIT 50", ("x",) * where.count("?"))
+        details = " ".join(r["detail"] for r in plan)
+        assert index in details and "TEMP B-TREE" not in details, details
+
+
+def test_rotation_into_monthly_archives(db, tmp_path):
+    archive = str(tmp_path / "archive")
+    _fill(db, ["2024-04-30 23:59:59"] * 3 + ["2024-05-01 00:00:00"] * 4
+          + ["2024-06-14 00:00:00"] * 2)
+    before = log_store.cutoff(30, NOW)          # 2024-05-16 12:00:00
+
+    assert log_store.rotate_batch(db, before, archive, "month", limit=2) == 2
+    assert log_store.rotate_batch(db, before, archive, "month", limit=5) == 1
+    assert log_store.rotate_batch(db, before, archive, "month", limit=5) == 4
+    assert log_store.rotate_batch(db, before, archive, "month", limit=5) == 0
+    assert sorted(os.listdir(archive)) == ["logs-2024-04.db", "logs-2024-05.db"]
+    assert db.query("SELECT COUNT(*) AS n FROM logs")[0]["n"] == 2
+
+    with sqlite3.connect(os.path.join(archive, "logs-2024-05.db")) as old:
+        rows = old.execute("SELECT id, timestamp FROM logs ORDER BY id").fetchall()
+    assert rows == [(i, "2024-05-01 00:00:00") for i in range(4, 8)]
+
+    purged = log_store.purge_archives(archive, log_store.cutoff(40, NOW), "month")
+    assert [os.path.basename(p) for p in purged] == ["logs-2024-04.db"]
+
+
+def test_compact_without_archive_deletes_and_vacuums(db):
+    assert db.pragma("auto_vacuum") == 2        # broker profile, new file
+    _fill(db, ["2024-01-01 00:00:00"] * 2000 + ["2024-06-15 00:00:00"])
+    stats = log_store.compact_logs(db, rotate_days=1, archive_dir=None,
+                                   batch_size=500, vacuum_pages=10, now=NOW)
+    assert stats["rotated"] == 2000 and stats["vacuumed"] > 0
+    assert db.pragma("freelist_count") == 0
+    assert db.query("SELECT COUNT(*) AS n FROM logs")[0]["n"] == 1
+
+
+@pytest.mark.asyncio
+async def test_compactor_runs_in_background(db, tmp_path):
+    _fill(db, ["2000-01-01 00:00:00"] * 10)
+    adb = AsyncEncryptedDB(db)
+    compactor = LogCompactor(adb, interval=60, archive_dir=str(tmp_path / "a"),
+                             retention_days=None, batch_size=4)
+    compactor.start()
+    for _ in range(100):
+        if compactor.runs:
+            break
+        await asyncio.sleep(0.01)
+    await compactor.close()
+    assert compactor.runs == 1 and compactor.rotated == 10
+    assert os.listdir(tmp_path / "a") == ["logs-2000-01.db"]
+    adb.close()
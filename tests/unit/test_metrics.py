@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+
+from broker.metrics import Counter, Gauge, Histogram, Registry, start_metrics_server
+
+
+def _registry():
+    reg = Registry()
+    c = reg.register(Counter("pubs_total", "publishes", ["qos"]))
+    g = reg.register(Gauge("depth", "queue depth", ["client_id"]))
+    h = reg.register(Histogram("lat_seconds", "latency", buckets=(0.01, 0.1)))
+    return reg, c, g, h
+
+
+def test_render_text_format():
+    reg, c, g, h = _registry()
+    q1 = c.labels(1)
+    q1.inc()
+    q1.inc(2)
+    g.set_function(lambda: {"a": 3, 'we"ird': 1})
+    for v in (0.005, 0.05, 5):
+        h.observe(v)
+
+    text = reg.render()
+    assert "# TYPE pubs_total counter" in text
+    assert 'pubs_total{qos="1"} 3' in text
+    assert 'depth{client_id="a"} 3' in text
+    assert r'depth{client_id="we\"ird"} 1' in text
+    assert 'lat_seconds_bucket{le="0.01"} 1' in text
+    assert 'lat_seconds_bucket{le="0.1"} 2' in text
+    assert 'lat_seconds_bucket{le="+Inf"} 3' in text
+    assert "lat_seconds_count 3" in text
+
+
+def test_labels_child_is_reused():
+    c = Counter("x_total", "x", ["qos"])
+    assert c.labels(0) is c.labels("0")
+
+
+@pytest.mark.asyncio
+async def test_http_endpoint():
+    reg, c, _, _ = _registry()
+    c.labels(0).inc()
+    server = await start_metrics_server("127.0.0.1", 0, reg)
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path):
+        r, w = await asyncio.open_connection("127.0.0.1", port)
+        w.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        data = await r.read()
+        w.close()
+        return data.decode()
+
+    ok = await get("/metrics")
+    assert ok.startswith("HTTP/1.1 200 OK")
+    assert 'pubs_total{qos="0"} 1' in ok
+    assert (await get("/")).startswith("HTTP/1.1 404")
+    server.close()
+    await server.wait_closed()
@@ -0,0 +1,106 @@
+import asyncio
+import struct
+import pytest
+
+from broker.framing import ProtocolError
+from broker.mqtt_codec import MqttCodec, encode_remaining_length
+
+
+def utf8(s):
+    data = s.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def frame(header, body):
+    return bytes((header,)) + encode_remaining_length(len(body)) + body
+
+
+def test_remaining_length_boundaries():
+    assert encode_remaining_length(0) == b"\x00"
+    assert encode_remaining_length(127) == b"\x7f"
+    assert encode_remaining_length(128) == b"\x80\x01"
+    assert encode_remaining_length(16383) == b"\xff\x7f"
+    assert encode_remaining_length(2097152) == b"\x80\x80\x80\x01"
+
+
+@pytest.mark.asyncio
+async def test_incremental_read_of_connect_and_publish():
+    codec = MqttCodec()
+    connect = frame(0x10, utf8("MQTT") + bytes((4, 0xC6)) + b"\x00\x3c"
+                    + utf8("dev1") + utf8("school/lwt") + utf8("gone")
+                    + utf8("teacher1") + utf8("secret"))
+    payload = bytes(range(256)) * 2
+    publish = frame(0x33, utf8("school/bin") + b"\x00\x07" + payload)
+
+    reader = asyncio.StreamReader()
+    data = connect + publish
+    # feed byte by byte: parsing must cope with partial buffers
+    async def feed():
+        for i in range(len(data)):
+            reader.feed_data(data[i:i + 1])
+            await asyncio.sleep(0)
+        reader.feed_eof()
+    feeder = asyncio.create_task(feed())
+
+    pkt = await codec.read_packet(reader)
+    assert pkt["type"] == "CONNECT" and pkt["client_id"] == "dev1"
+    assert pkt["username"] == "teacher1" and pkt["password"] == "secret"
+    assert pkt["clean_session"] and pkt["keepalive"] == 60
+    assert pkt["last_will"] == {"topic": "school/lwt", "payload": b"gone",
+                                "qos": 0, "retain": False}
+
+    pkt = await codec.read_packet(reader)
+    assert pkt["type"] == "PUBLISH" and pkt["topic"] == "school/bin"
+    assert pkt["qos"] == 1 and pkt["retain"] and pkt["id"] == 7
+    assert pkt["payload"] == payload
+
+    assert await codec.read_packet(reader) is None
+    await feeder
+
+
+def test_publish_frame_roundtrip():
+    codec = MqttCodec()
+    pf = codec.publish_frame("a/b", b"\x00\x01payload", qos=2)
+    raw = pf.encode(513)
+    length = len(raw) - 2
+    assert raw[0] == 0x34 and raw[1] == length
+    pkt = codec.decode(raw[0], raw[2:])
+    assert pkt["id"] == 513 and pkt["payload"] == b"\x00\x01payload"
+
+    pf0 = codec.publish_frame("a/b", b"x")
+    assert pf0.encode() is pf0.encode()
+
+    raw = pf.encode(513, dup=True)
+    dup = codec.decode(raw[0], raw[2:])
+    assert dup["dup"] and dup["id"] == 513 and not pkt["dup"]
+
+
+def test_large_payloads_are_not_copied():
+    codec = MqttCodec()
+    body = utf8("fw/1") + b"\xab" * 65536
+    payload = codec.decode(0x30, body)["payload"]
+    assert isinstance(payload, memoryview) and payload.obj is body
+
+    pf = codec.publish_frame("fw/1", payload, qos=1)
+    head, pid, shared = pf.buffers(7)
+    assert shared is payload and pid == b"\x00\x07"
+    assert pf.buffers()[1] is payload
+    raw, fixed = pf.encode(7), len(head) - len(utf8("fw/1"))
+    assert raw == head + pid + body[6:]
+    assert codec.decode(raw[0], raw[fixed:])["payload"] == payload
+    # small payloads still go out as one bytes object
+    assert isinstance(codec.publish_frame("a", b"x", qos=1).buffers(1), bytes)
+
+
+@pytest.mark.asyncio
+async def test_encode_acks_and_rejects_oversize():
+    codec = MqttCodec(max_packet_size=10)
+    assert codec.encode({"type": "CONNACK", "success": False}) == b"\x20\x02\x00\x04"
+    assert codec.encode({"type": "SUBACK", "id": 5, "granted": [1, 0x80]}) == \
+        b"\x90\x04\x00\x05\x01\x80"
+    assert codec.encode({"type": "PUBREL", "id": 1}) == b"\x62\x02\x00\x01"
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"\x30\x0b" + b"x" * 11)
+    with pytest.raises(ProtocolError):
+        await codec.read_packet(reader)
@@ -0,0 +1,111 @@
+import asyncio
+import struct
+
+import bcrypt
+import pytest
+
+from broker.mqtt_codec import MQTT_CODEC, encode_remaining_length
+from broker.router import Router
+from broker.session import SessionManager
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db, insert_user
+from fakes import FakeWriter
+
+
+def utf8(s):
+    data = s.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def frame(header, body):
+    return bytes((header,)) + encode_remaining_length(len(body)) + body
+
+
+def connect(client_id, keepalive=0):
+    # clean session, username + password, Last Will "lwt" = "gone"
+    return frame(0x10, utf8("MQTT") + bytes((4, 0xC6))
+                 + struct.pack("!H", keepalive) + utf8(client_id)
+                 + utf8("lwt") + utf8("gone") + utf8("dev") + utf8("pw"))
+
+
+DISCONNECT = b"\xe0\x00"
+
+
+@pytest.fixture
+def adb(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "m.db"), str(tmp_path / "m.key"))
+    init_db(db)
+    role = db.query("SELECT id FROM roles LIMIT 1")[0]["id"]
+    uid = insert_user(db, "dev", bcrypt.hashpw(b"pw", bcrypt.gensalt(4)), role)
+    db.execute("INSERT INTO acls(user_id, topic, can_subscribe, can_publish) "
+               "VALUES (?,?,?,?)", (uid, "lwt", 1, 1))
+    adb = AsyncEncryptedDB(db)
+    yield adb
+    adb.close()
+    db.close()
+
+
+async def _close(router):
+    await router.close()
+    await router.session_mgr.close()
+
+
+async def _watch_will(router):
+    """A JSON session subscribed to the Will topic."""
+    user = await router.session_mgr.authenticate("dev", "pw")
+    writer = FakeWriter()
+    watcher, _ = router.session_mgr.create_session("watcher", writer)
+    assert await router._handle_subscribe(watcher, user, "lwt", 0)
+    return writer
+
+
+async def _run(router, *packets, eof=True):
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"".join(packets))
+    if eof:
+        reader.feed_eof()
+    writer = FakeWriter(reader=reader)
+    await router.handle_client(reader, writer, codec=MQTT_CODEC)
+    await asyncio.sleep(0.05)       # let the session writers run
+    return writer
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("disconnect, will_sent", [(True, False), (False, True)])
+async def test_clean_disconnect_discards_the_will(adb, disconnect, will_sent):
+    router = Router(session_mgr=SessionManager(adb), db=adb)
+    watched = await _watch_will(router)
+    packets = [connect("dev-1")] + ([DISCONNECT] if disconnect else [])
+    await _run(router, *packets)
+    assert bool(watched.frames) == will_sent
+    await _close(router)
+
+
+@pytest.mark.asyncio
+async def test_denied_publish_is_acknowledged_and_logged(adb):
+    router = Router(session_mgr=SessionManager(adb), db=adb)
+    records = []
+    router.audit.write = lambda *rec: records.append(rec)
+    qos1 = frame(0x32, utf8("secret/a") + b"\x00\x05" + b"x")
+    qos2 = frame(0x34, utf8("secret/b") + b"\x00\x06" + b"y")
+    pubrel = b"\x62\x02\x00\x06"
+    writer = await _run(router, connect("dev-1"), qos1, qos2, pubrel, DISCONNECT)
+    # CONNACK, PUBACK 5, PUBREC 6, PUBCOMP 6
+    assert writer.data() == (b"\x20\x02\x00\x00" + b"\x40\x02\x00\x05"
+                             + b"\x50\x02\x00\x06" + b"\x70\x02\x00\x06")
+    assert [(r[1], r[2], r[4]) for r in records if not r[3]] == [
+        ("secret/a", "PUBLISH", "ACL denied"), ("secret/b", "PUBLISH", "ACL denied")]
+    await _close(router)
+
+
+@pytest.mark.asyncio
+async def test_silent_client_is_dropped_after_keepalive(adb):
+    router = Router(session_mgr=SessionManager(adb), db=adb)
+    watched = await _watch_will(router)
+    # the socket stays open, but nothing follows the CONNECT
+    run = _run(router, connect("dev-1", keepalive=1), eof=False)
+    await asyncio.wait_for(run, 3)      # 1.5 x keepalive
+    assert "dev-1" not in router.session_mgr.sessions
+    assert watched.frames               # a lost client's Will goes out
+    await _close(router)
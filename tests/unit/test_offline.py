@@ -0,0 +1,96 @@
+import pytest
+
+from broker.offline import OfflineStore
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db
+
+
+@pytest.fixture
+def adb(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "o.db"), str(tmp_path / "o.key"))
+    init_db(db)
+    adb = AsyncEncryptedDB(db)
+    yield adb
+    adb.close()
+    db.close()
+
+
+async def _drain(store, cid, n=3):
+    out = []
+    while True:
+        batch = await store.pop_batch(cid, n)
+        if not batch:
+            return out
+        out.extend(batch)
+
+
+@pytest.mark.asyncio
+async def test_spills_to_disk_and_replays_in_order(adb):
+    store = OfflineStore(adb, memory_limit=2, max_messages=100, spill_batch=1000)
+    await store.start()
+    for i in range(5):
+        store.push("c1", "t", b"%d" % i, 1)
+    await store.flush()             # 3 spilled rows hit the disk
+    store.push("c1", "t", b"5", 2)  # still behind the spilled ones
+    assert store.depth("c1") == 6
+    rows = await adb.query("SELECT payload FROM offline_messages")
+    assert [r["payload"] for r in rows] == [b"2", b"3", b"4"]
+
+    first = await store.pop_batch("c1", 3)
+    assert [m[1] for m in first] == [b"0", b"1"]      # memory part first
+    rest = await _drain(store, "c1")
+    assert [m[1] for m in rest] == [b"2", b"3", b"4", b"5"]
+    assert rest[-1][2] == 2
+    assert await adb.query("SELECT id FROM offline_messages") == []
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_queue_is_bounded(adb):
+    store = OfflineStore(adb, memory_limit=1, max_messages=3)
+    assert all(store.push("c1", "t", b"x", 1) for _ in range(3))
+    assert not store.push("c1", "t", b"x", 1)
+    assert store.dropped == 1 and store.depth("c1") == 3
+
+
+@pytest.mark.asyncio
+async def test_discard_removes_spilled_rows(adb):
+    store = OfflineStore(adb, memory_limit=0, max_messages=10)
+    store.push("c1", "t", b"a", 1)
+    store.push("c2", "t", b"b", 1)
+    await store.flush()
+    await store.discard("c1")
+    rows = await adb.query("SELECT client_id FROM offline_messages")
+    assert [r["client_id"] for r in rows] == ["c2"]
+    assert store.depth("c1") == 0 and store.depth("c2") == 1
+
+
+@pytest.mark.asyncio
+async def test_requeue_puts_messages_back_in_front(adb):
+    store = OfflineStore(adb, memory_limit=10)
+    for i in range(3):
+        store.push("c1", "t", b"%d" % i, 1)
+    batch = await store.pop_batch("c1", 2)
+    store.requeue("c1", batch)
+    assert [m[1] for m in await _drain(store, "c1")] == [b"0", b"1", b"2"]
+
+
+@pytest.mark.asyncio
+async def test_workers_share_the_table_not_their_rows(adb):
+    w0 = OfflineStore(adb, worker=0, workers=2, memory_limit=0)
+    w1 = OfflineStore(adb, worker=1, workers=2, memory_limit=0)
+    await w0.start()
+    w0.push("c1", "t", b"a", 1)
+    await w0.flush()
+    await w1.start()                # a restarted worker 1 keeps w0's rows
+    w1.push("c1", "t", b"b", 1)
+    await w1.flush()
+    assert [m[1] for m in await _drain(w1, "c1")] == [b"b"]
+    assert [m[1] for m in await _drain(w0, "c1")] == [b"a"]
+
+    w1.push("c1", "t", b"c", 1)
+    await w1.flush()
+    # back to one worker: rows of workers that no longer run go as well
+    await OfflineStore(adb, worker=0, workers=1).start()
+    assert await adb.query("SELECT id FROM offline_messages") == []
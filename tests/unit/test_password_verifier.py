@@ -0,0 +1,54 @@
+import asyncio
+import bcrypt
+import pytest
+
+from auth.verifier import PasswordVerifier
+
+
+@pytest.mark.asyncio
+async def test_cache_skips_bcrypt_and_tracks_hash_changes():
+    v = PasswordVerifier(workers=2, max_concurrency=2, ttl=60)
+    h1 = bcrypt.hashpw(b"secret", bcrypt.gensalt(4))
+    assert await v.verify("u", "secret", h1)
+    assert await v.verify("u", "secret", h1)
+    assert v.verified == 1 and v.cache_hits == 1
+
+    assert not await v.verify("u", "wrong", h1)
+    assert not await v.verify("u", "wrong", h1)
+    assert v.rejected == 2      # failures are never cached
+
+    # password changed in the DB: old cache entry no longer applies
+    h2 = bcrypt.hashpw(b"other", bcrypt.gensalt(4))
+    assert not await v.verify("u", "secret", h2)
+    v.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_rechecked():
+    v = PasswordVerifier(ttl=0)
+    h = bcrypt.hashpw(b"pw", bcrypt.gensalt(4))
+    assert await v.verify("u", "pw", h)
+    assert await v.verify("u", "pw", h)
+    assert v.cache_hits == 0 and v.verified == 2
+    v.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    v = PasswordVerifier(workers=4, max_concurrency=2, ttl=0)
+    h = bcrypt.hashpw(b"pw", bcrypt.gensalt(6))
+    peak = 0
+
+    async def watch():
+        nonlocal peak
+        while True:
+            peak = max(peak, v.active)
+            await asyncio.sleep(0.001)
+
+    watcher = asyncio.create_task(watch())
+    results = await asyncio.gather(*(v.verify(f"u{i}", "pw", h) for i in range(8)))
+    watcher.cancel()
+    assert all(results)
+    assert peak <= 2
+    assert v.max_waiting >= 6 and v.waiting == 0
+    v.close()
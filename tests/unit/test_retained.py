@@ -0,0 +1,75 @@
+import pytest
+
+from broker.retained import RetainedStore
+from broker.topic_trie import match_topic
+from database.async_db import AsyncEncryptedDB
+from database.encrypted_db import EncryptedSQLiteDB
+from database.models import init_db
+
+
+TOPICS = ["school", "school/a", "school/a/x", "school/b", "home/a", "home/b/c"]
+
+
+def _store(*topics):
+    store = RetainedStore(db=None)
+    for t in topics:
+        store.set(t, t.encode(), 1, persist=False)
+    return store
+
+
+@pytest.mark.parametrize("filt", [
+    "school", "school/a", "school/+", "school/#", "+/a", "+/+/+", "#",
+    "home/+/c", "+", "nope/#",
+])
+def test_match_agrees_with_match_topic(filt):
+    store = _store(*TOPICS)
+    got = sorted(t for t, _, _ in store.match(filt))
+    assert got == sorted(t for t in TOPICS if match_topic(filt, t))
+
+
+def test_empty_payload_clears_and_prunes():
+    store = _store("a/b/c", "a")
+    store.set("a/b/c", b"", persist=False)
+    assert len(store) == 1
+    assert store.get("a/b/c") is None
+    assert "b" not in store.root.children["a"].children
+    store.set("a", b"", persist=False)
+    assert store.root.children == {}
+
+
+@pytest.mark.asyncio
+async def test_write_behind_upserts_and_deletes(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "r.db"), str(tmp_path / "r.key"))
+    init_db(db)
+    adb = AsyncEncryptedDB(db)
+    store = RetainedStore(adb)
+
+    store.set("t/1", b"one", 0)
+    store.set("t/1", b"uno", 1)     # coalesced with the first write
+    store.set("t/2", b"two", 0)
+    assert await store.flush() == 2
+    store.set("t/2", b"")
+    await store.flush()
+
+    rows = db.query("SELECT topic, payload, qos FROM retained_messages")
+    assert [(r["topic"], r["payload"], r["qos"]) for r in rows] == [("t/1", b"uno", 1)]
+
+    reloaded = RetainedStore(adb)
+    await reloaded.load()
+    assert reloaded.get("t/1") == (b"uno", 1)
+    adb.close()
+    db.close()
+
+
+def test_init_db_dedupes_existing_rows(tmp_path):
+    db = EncryptedSQLiteDB(str(tmp_path / "d.db"), str(tmp_path / "d.key"))
+    db.execute("CREATE TABLE retained_messages (id INTEGER PRIMARY KEY "
+               "AUTOINCREMENT, topic TEXT NOT NULL, payload BLOB, "
+               "qos INTEGER NOT NULL DEFAULT 0, timestamp DATETIME)")
+    for p in ("old", "new"):
+        db.execute("INSERT INTO retained_messages(topic, payload) VALUES (?,?)",
+                   ("t", p))
+    init_db(db)
+    rows = db.query("SELECT payload FROM retained_messages")
+    assert [r["payload"] for r in rows] == ["new"]
+    db.close()
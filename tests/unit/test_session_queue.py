@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+
+from broker.framing import JSON_CODEC
+from broker.mqtt_codec import MQTT_CODEC
+from broker.session import Session
+from fakes import FakeWriter
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_newest_frames():
+    w = FakeWriter(blocked=True)
+    sess = Session("c1", w, max_queue=2, overflow_policy="drop-oldest")
+    for i in range(4):
+        assert sess.enqueue(b"%d" % i)
+    assert list(sess.outbound) == [b"2", b"3"]
+    assert sess.dropped == 2
+
+    sess.start()
+    w.unblock.set()
+    await sess.stop()
+    assert w.frames == [b"2", b"3"]
+
+
+@pytest.mark.asyncio
+async def test_drop_new_and_disconnect_policies():
+    sess = Session("c2", FakeWriter(), max_queue=1, overflow_policy="drop-new")
+    assert sess.enqueue(b"a")
+    assert not sess.enqueue(b"b")
+    assert list(sess.outbound) == [b"a"] and sess.dropped == 1
+
+    w = FakeWriter()
+    sess = Session("c3", w, max_queue=1, overflow_policy="disconnect")
+    assert sess.enqueue(b"a")
+    assert not sess.enqueue(b"b")
+    assert w.transport.aborted
+    assert not sess.enqueue(b"c")
+
+
+@pytest.mark.asyncio
+async def test_slow_writer_does_not_block_enqueue():
+    w = FakeWriter(blocked=True)    # drain() never completes until unblocked
+    sess = Session("c4", w, max_queue=10)
+    sess.start()
+    sess.enqueue(b"first")
+    await asyncio.sleep(0)
+    # writer task is parked in drain(); enqueue still returns immediately
+    for i in range(5):
+        assert sess.enqueue(b"x")
+    w.unblock.set()
+    await sess.stop()
+    assert w.frames == [b"first"] + [b"x"] * 5
+
+
+@pytest.mark.asyncio
+async def test_fan_out_shares_large_payloads():
+    payload = memoryview(b"\x00" * 100_000)
+    for codec in (JSON_CODEC, MQTT_CODEC):
+        frame = codec.publish_frame("fw/chunk", payload, qos=1)
+        writers = [FakeWriter(blocked=True) for _ in range(3)]
+        sessions = [Session(f"s{i}", w, codec=codec) for i, w in enumerate(writers)]
+        for sess in sessions:
+            assert sess.publish(frame)
+        heads = {id(sess.outbound[0][0]) for sess in sessions}
+        assert len(heads) == 1  # one serialized packet, referenced 3 times
+
+        for sess, w in zip(sessions, writers):
+            sess.start()
+            w.unblock.set()
+            await sess.stop()
+            pid = next(iter(sess.inflight))
+            assert b"".join(w.frames) == frame.encode(pid)
+    # MQTT passes the publisher's buffer itself to every transport
+    assert all(w.frames[-1] is payload for w in writers)
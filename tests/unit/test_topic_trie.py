@@ -0,0 +1,86 @@
+import random
+
+from broker.topic_trie import TopicTrie, match_topic
+
+
+def test_wildcard_matching():
+    trie = TopicTrie()
+    for i, filt in enumerate(["school/#", "school/+/status", "school/a/status",
+                              "#", "+", "school/+", "other/x"]):
+        trie.insert(filt, i, filt)
+
+    def matched(topic):
+        return sorted(v for _, v in trie.match(topic))
+
+    assert matched("school") == ["#", "+", "school/#"]
+    assert matched("school/a/status") == sorted(
+        ["#", "school/#", "school/+/status", "school/a/status"])
+    assert matched("school/b") == ["#", "school/#", "school/+"]
+    assert matched("other/x") == ["#", "other/x"]
+    assert matched("other/x/y") == ["#"]
+
+
+def test_trie_agrees_with_linear_scan():
+    rnd = random.Random(7)
+    levels = ["a", "b", "c", "+", "#"]
+    filters = set()
+    while len(filters) < 300:
+        depth = rnd.randint(1, 4)
+        filters.add("/".join(rnd.choice(levels) for _ in range(depth)))
+    trie = TopicTrie()
+    for f in filters:
+        trie.insert(f, f, None)
+
+    for _ in range(500):
+        depth = rnd.randint(1, 5)
+        topic = "/".join(rnd.choice("abcd") for _ in range(depth))
+        expected = {f for f in filters if match_topic(f, topic)}
+        assert {k for k, _ in trie.match(topic)} == expected
+
+
+def test_remove_prunes_nodes():
+    trie = TopicTrie()
+    trie.insert("a/+/c", "cid1", 1)
+    trie.insert("a/+/c", "cid2", 2)
+    trie.insert("a/#", "cid1", 3)
+    assert len(trie) == 3
+
+    assert trie.remove("a/+/c", "cid1")
+    assert not trie.remove("a/+/c", "cid1")
+    assert sorted(trie.match("a/b/c")) == [("cid1", 3), ("cid2", 2)]
+
+    trie.remove("a/+/c", "cid2")
+    trie.remove("a/#", "cid1")
+    assert len(trie) == 0
+    assert trie.root.is_empty()
+
+
+def test_discard_by_handle():
+    trie = TopicTrie()
+    h1 = trie.insert("x/+/y", "cid1", 1)
+    h2 = trie.insert("x/+/y", "cid2", 2)
+    assert h1 is h2
+    h3 = trie.insert("x/#", "cid1", 3)
+
+    assert trie.discard(h1, "cid1")
+    assert not trie.discard(h1, "cid1")
+    assert trie.discard(h2, "cid2")
+    assert trie.root.children["x"].plus is None      # pruned
+    assert trie.match("x/a/y") == [("cid1", 3)]
+
+    # a stale handle of a pruned node is harmless
+    assert trie.insert("x/+/y", "cid3", 4) is not h1
+    assert not trie.discard(h1, "cid3")
+    trie.discard(h3, "cid1")
+    trie.remove("x/+/y", "cid3")
+    assert len(trie) == 0 and trie.root.is_empty()
+
+
+def test_leaf_nodes_share_empty_maps():
+    trie = TopicTrie()
+    a = trie.insert("devices/1/cmd", "c1", None)
+    b = trie.insert("devices/2/cmd", "c2", None)
+    assert a.children is b.children            # leaves own no dict
+    assert trie.discard(a, "c1") and trie.discard(b, "c2")
+    assert a.subscribers is b.subscribers
+    assert trie.root.children is a.children and len(trie) == 0